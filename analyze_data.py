@@ -1,10 +1,21 @@
-import re
+import datetime
 
+import numpy as np
 import pandas as pd
 from itertools import combinations
 import ast
+from compact_snapshot import (compact_perpetual_data_df, expand_compact_df, get_budget_chunk_pairs, get_memory_report,
+                              print_memory_report)
 from config import CONFIG
-from utils import df_to_file, file_to_df
+from funding_history import (HISTORY_STAT_COLUMNS, create_rate_history, create_rate_history_from_lists,
+                             compute_history_stats, sum_segments)
+from funding_history_store import open_funding_history_store, load_funding_history
+from instrument_registry import add_instrument_columns, get_instrument_symbols
+from metrics import stage_timer
+from result_collector import ResultCollector
+from spot_index import (build_spot_index, get_exchange_bits, get_spot_exchange_names, get_spot_masks,
+                        load_spot_index, load_spot_pairs_from_files)
+from utils import df_to_file, file_to_df, get_snapshot_time
 
 
 def analyze_data():
@@ -17,14 +28,48 @@ def analyze_data():
     """
     directory_data = f"{CONFIG['directory']}/{CONFIG['subdirectory']}/data"
     directory_result = f"{CONFIG['directory']}/{CONFIG['subdirectory']}/result"
-    perpetual_exchanges_str = '_'.join(CONFIG['perpetual_exchanges'])
 
     # Load perpetual data from files
-    perpetual_data_df = create_perpetual_data_df_from_files(directory_data)
+    with stage_timer('analysis_load_perpetual_data'):
+        perpetual_data_df = create_perpetual_data_df_from_files(directory_data)
     if not perpetual_data_df:
         return
 
+    spot_index = None
+    if CONFIG['get_spot_perp_opportunities']:
+        with stage_timer('analysis_load_spot_data'):
+            spot_index = create_spot_index_from_files(directory_data)
+
     print(f"- Analyzing Funding rates from files")
+    results = find_opportunities(perpetual_data_df, spot_index, directory_result)
+    if CONFIG['liquidity_ranking']:
+        # Imported here, as sampling order books loads ccxt, which analysis does not need otherwise
+        from liquidity import rank_by_liquidity
+        with stage_timer('analysis_liquidity'):
+            results = rank_by_liquidity(results)
+    with stage_timer('analysis_save_results'):
+        save_results(results, directory_result)
+
+
+def find_opportunities(perpetual_data_df, spot_index, directory_stream=None):
+    """
+    Identifies Perpetual-Perpetual and Spot-Perpetual trading opportunities in loaded data.
+
+    Opportunities are collected chunk by chunk (see ResultCollector). With result_top_k only the best
+    opportunities of every result are kept, and with result_stream_format all of them are also streamed
+    to files while they are found.
+
+    Args:
+        perpetual_data_df (dict): Dictionary with exchange names as keys and dataframes as values.
+        spot_index (dict): Spot index created by build_spot_index, or None without spot data.
+        directory_stream (str, optional): Directory to stream the opportunities to. None disables streaming.
+
+    Returns:
+        dict: Result dataframes keyed by 'perp_perp', 'spot_perp_positive' and 'spot_perp_negative'.
+            Only the enabled and possible analyses are included.
+    """
+    results = {}
+    threshold = CONFIG['funding_rate_threshold']
 
     # Analyze Perpetual-Perpetual opportunities
     if CONFIG['get_perp_perp_opportunities']:
@@ -32,39 +77,73 @@ def analyze_data():
         if len(perpetual_data_df) < 2:
             print(f"Warning: Skip Perpetual-Perpetual opportunities analysis. More than 2 perpetual exchanges needed.")
         else:
-            perp_exchange_combinations = list(combinations(perpetual_data_df.keys(), 2))
-            final_df = pd.DataFrame()
-            for combination in perp_exchange_combinations:
-                exchange_1, exchange_2 = combination[0], combination[1]
-                df_1, df_2 = perpetual_data_df[exchange_1], perpetual_data_df[exchange_2]
+            with stage_timer('analysis_perp_perp'):
+                collector = create_result_collector(
+                    'perp_perp', 'rate_diff', directory_stream,
+                    unique_column='pair' if CONFIG['perp_perp_best_pair_only'] else None)
+                if CONFIG['perp_perp_engine'] == 'matrix':
+                    chunk_pairs = get_budget_chunk_pairs(perpetual_data_df, CONFIG['perp_perp_chunk_pairs'])
+                    chunks = generate_perp_perp_opportunities_matrix(perpetual_data_df, threshold,
+                                                                     CONFIG['perp_perp_best_pair_only'], chunk_pairs)
+                else:
+                    chunks = generate_perp_perp_opportunities_pairwise(perpetual_data_df, threshold)
+                for df in chunks:
+                    collector.add(df)
+                results['perp_perp'] = collector.result()
 
-                df = create_perp_perp_opportunities_df(exchange_1, exchange_2, df_1, df_2)
-                final_df = pd.concat([final_df, df], ignore_index=True)
+    # Analyze Spot-Perpetual opportunities
+    if CONFIG['get_spot_perp_opportunities'] and spot_index is not None:
+        print(f"-- Analyzing Spot-Perpetual opportunities")
 
-            final_df = final_df[final_df['rate_diff'] > CONFIG['funding_rate_threshold']]
-            final_df = final_df.sort_values(by='rate_diff', ascending=False, ignore_index=True)
+        with stage_timer('analysis_spot_perp'):
+            signs = [('spot_perp_positive', False), ('spot_perp_negative', True)]
+            collectors = {name: create_result_collector(name, 'rate', directory_stream, ascending=negative)
+                          for name, negative in signs}
+            for df in generate_spot_perp_opportunities(perpetual_data_df, spot_index,
+                                                       CONFIG['spot_perp_chunk_pairs']):
+                for name, negative in signs:
+                    collectors[name].add(filter_rates(df, negative=negative))
+            for name, collector in collectors.items():
+                results[name] = collector.result()
 
-            df_to_file(final_df, directory_result, f"result_perp_perp_{perpetual_exchanges_str}")
-            print(f"-- Analysis process finished. The data is saved in the directory: {directory_result}")
+    return results
 
-    # Analyze Spot-Perpetual opportunities
-    if CONFIG['get_spot_perp_opportunities']:
-        print(f"-- Analyzing Spot-Perpetual opportunities")
 
-        spot_pairs_df = create_spot_data_df_from_files(directory_data)
-        if spot_pairs_df.empty:
-            return
+def create_result_collector(name, sort_column, directory_stream, ascending=False, unique_column=None):
+    """
+    Creates the collector of one result with the top-K and streaming settings from the config.
+
+    Args:
+        name (str): Result name, e.g. 'perp_perp'.
+        sort_column (str): Column to rank the opportunities by.
+        directory_stream (str): Directory to stream the opportunities to, or None.
+        ascending (bool): Whether lower values are better.
+        unique_column (str, optional): Keep only the best row of every value of this column.
 
-        final_df = pd.DataFrame()
-        for perpetual_exchange, perpetual_rates_df in perpetual_data_df.items():
-            df = create_spot_perp_opportunites_df(perpetual_exchange, perpetual_rates_df, spot_pairs_df)
-            final_df = pd.concat([final_df, df], ignore_index=True)
-        positive_rates_df = filter_and_sort_rates(final_df, negative=False)
-        negative_rates_df = filter_and_sort_rates(final_df, negative=True)
+    Returns:
+        ResultCollector: Collector of the result.
+    """
+    stream_path = None
+    if directory_stream and CONFIG['result_stream_format']:
+        perpetual_exchanges_str = '_'.join(CONFIG['perpetual_exchanges'])
+        stream_path = f"{directory_stream}/stream_{name}_{perpetual_exchanges_str}.{CONFIG['result_stream_format']}"
+    return ResultCollector(sort_column, ascending, CONFIG['result_top_k'], unique_column, stream_path)
 
-        df_to_file(positive_rates_df, directory_result, f"result_spot_perp_positive_{perpetual_exchanges_str}")
-        df_to_file(negative_rates_df, directory_result, f"result_spot_perp_negative_{perpetual_exchanges_str}")
-        print(f"-- Analysis process finished. The data is saved in the directory: {directory_result}")
+
+def save_results(results, directory_result):
+    """
+    Saves result dataframes to files named result_<analysis>_<perpetual exchanges>.
+
+    Args:
+        results (dict): Result dataframes returned by find_opportunities.
+        directory_result (str): Directory to save the files.
+    """
+    if not results:
+        return
+    perpetual_exchanges_str = '_'.join(CONFIG['perpetual_exchanges'])
+    for name, df in results.items():
+        df_to_file(df, directory_result, f"result_{name}_{perpetual_exchanges_str}")
+    print(f"-- Analysis process finished. The data is saved in the directory: {directory_result}")
 
 
 def create_perpetual_data_df_from_files(directory_data):
@@ -78,40 +157,117 @@ def create_perpetual_data_df_from_files(directory_data):
         dict: Dictionary with exchange names as keys and dataframes as values.
     """
     perpetual_data = {}
+    snapshot_time = get_snapshot_time(directory_data)
     for exchange in CONFIG['perpetual_exchanges']:
-        df = file_to_df(f"{directory_data}", f"funding_rates_{exchange}")
+        df = file_to_df(f"{directory_data}", f"funding_rates_{exchange}", CONFIG['snapshot_format'])
         if not df.empty:
-            df['pair'] = df['pair'].apply(remove_leading_numbers)
-            perpetual_data[exchange] = df
+            perpetual_data[exchange] = prepare_perpetual_data_df(exchange, df, snapshot_time)
     if len(perpetual_data) == 0:
         print(f"- Exiting: Perpetual exchange data not found.")
         return False
     print(f"Data for perpetual exchanges ({', '.join(perpetual_data.keys())}) loaded successfully")
+    print_memory_report(get_memory_report(perpetual_data))
 
     return perpetual_data
 
 
-def create_spot_data_df_from_files(directory_data):
+def prepare_perpetual_data_df(exchange, df, snapshot_time=None):
     """
-    Creates a dataframe of spot trading pairs from files.
+    Prepares a dataframe of funding rates of one exchange for analysis.
+
+    Adds the APY columns from the funding history store and maps the exchange symbols to instruments
+    (see instrument_registry.py). The pair column then holds canonical symbols without leading numbers.
+    With compact_snapshots the dataframe is converted to the compact layout (see compact_snapshot.py).
+
+    Args:
+        exchange (str): Name of the exchange.
+        df (pd.DataFrame): Dataframe of funding rates as fetched from the exchange.
+        snapshot_time (int, optional): Time the rates were fetched in milliseconds. None for a fresh fetch.
+
+    Returns:
+        pd.DataFrame: Prepared dataframe.
+    """
+    if CONFIG['funding_history_store'] and CONFIG['apy_horizons_days']:
+        df = add_historical_apy_from_store(exchange, df, snapshot_time)
+    df = add_instrument_columns(df)
+    if CONFIG['compact_snapshots']:
+        df['historical_rates'] = parse_historical_rates(df['historical_rates'])
+        df = compact_perpetual_data_df(df)
+    return df
+
+
+def add_historical_apy_from_store(exchange, df, snapshot_time=None):
+    """
+    Adds funding statistics read from the funding history store: average APY columns for every period
+    of apy_horizons_days, rate volatility, percentage of positive fundings and the funding interval
+    (see compute_history_stats).
+
+    The periods end at the time the snapshot was fetched, so rates stored after it are not used
+    when an older snapshot is analyzed.
+
+    Args:
+        exchange (str): Name of the exchange.
+        df (pd.DataFrame): Dataframe of funding rates for the exchange with exchange symbols in the pair column.
+        snapshot_time (int, optional): Time the rates were fetched in milliseconds. None uses the current time.
+
+    Returns:
+        pd.DataFrame: The dataframe with the statistics columns. Pairs without stored history get empty values.
+    """
+    current_time = snapshot_time or int(datetime.datetime.now().timestamp() * 1000)
+    day_ms = 24 * 60 * 60 * 1000
+    store = open_funding_history_store()
+    history = load_funding_history(store, exchange, current_time - max(CONFIG['apy_horizons_days']) * day_ms,
+                                   current_time)
+    store.close()
+    rate_history = create_rate_history(history['symbol'].to_numpy(), history['timestamp'].to_numpy(),
+                                       history['rate'].to_numpy())
+    stats = compute_history_stats(rate_history, current_time, CONFIG['apy_horizons_days'])
+    stats = stats.reindex(df['pair'])
+    for column in stats.columns:
+        df[column] = stats[column].to_numpy()
+    return df
+
+
+def get_apy_horizon_columns():
+    """
+    Returns the names of the APY columns calculated from the funding history store.
+
+    Returns:
+        list: Column names, e.g. ['APY_3d', 'APY_7d'].
+    """
+    if not CONFIG['funding_history_store']:
+        return []
+    return [f'APY_{days}d' for days in sorted(CONFIG['apy_horizons_days'])]
+
+
+def get_history_stat_columns():
+    """
+    Returns the names of the other statistics columns calculated from the funding history store.
+
+    Returns:
+        list: Column names, empty if the statistics are not calculated.
+    """
+    if not CONFIG['funding_history_store'] or not CONFIG['apy_horizons_days']:
+        return []
+    return HISTORY_STAT_COLUMNS
+
+
+def create_spot_index_from_files(directory_data):
+    """
+    Loads the spot index saved with the snapshot (see spot_index.py).
+
+    Snapshots saved without a spot index are indexed from their spot pairs files.
 
     Args:
         directory_data (str): Directory containing files.
 
     Returns:
-        pd.DataFrame: DataFrame containing trading pairs and the exchanges where each pair is available.
+        dict: Spot index, or None if there is no spot data.
     """
-    spot_data = []
-    for exchange in CONFIG['spot_exchanges']:
-        df = file_to_df(f"{directory_data}", f"spot_pairs_{exchange}")
-        if not df.empty:
-            df['spot_exchange'] = exchange
-            spot_data.append(df)
-    if len(spot_data) == 0:
-        print("- Exiting: No spot data found")
-        return pd.DataFrame()
-    combined_df = pd.concat(spot_data).groupby('pair')['spot_exchange'].apply('/'.join).reset_index()
-    return combined_df
+    spot_index = load_spot_index(directory_data)
+    if spot_index is None:
+        spot_index = build_spot_index(load_spot_pairs_from_files(directory_data))
+    return spot_index
 
 
 def create_perp_perp_opportunities_df(exchange_1, exchange_2, df_1, df_2):
@@ -127,39 +283,52 @@ def create_perp_perp_opportunities_df(exchange_1, exchange_2, df_1, df_2):
     Returns:
         pd.DataFrame: DataFrame containing Perpetual-Perpetual trading opportunities.
     """
-    df = pd.merge(df_1, df_2, on='pair', how='inner')
+    df = pd.merge(expand_compact_df(df_1), expand_compact_df(df_2).drop(columns='pair'), on='instrument_id',
+                  how='inner')
+
+    # The second exchange is the short one if its rate is higher, otherwise the first one
+    swapped = (df['rate_x'] < df['rate_y']).to_numpy()
 
     # Identify short and long exchanges
-    df['short_exchange'] = exchange_1
-    df['long_exchange'] = exchange_2
-    df.loc[df['rate_x'] < df['rate_y'], ['short_exchange', 'long_exchange']] = exchange_2, exchange_1
+    df['short_exchange'] = np.where(swapped, exchange_2, exchange_1)
+    df['long_exchange'] = np.where(swapped, exchange_1, exchange_2)
 
     # Identify short and long rates
-    df['short_rate'] = df.apply(lambda x: x['rate_x'] if x['short_exchange'] == exchange_1 else x['rate_y'],
-                                axis=1)
-    df['long_rate'] = df.apply(lambda x: x['rate_x'] if x['long_exchange'] == exchange_1 else x['rate_y'],
-                               axis=1)
+    df['short_rate'] = np.where(swapped, df['rate_y'], df['rate_x'])
+    df['long_rate'] = np.where(swapped, df['rate_x'], df['rate_y'])
     df['rate_diff'] = df['short_rate'] - df['long_rate']
 
-    # Identify historical rates for short and long exchanges
-    df['historical_rates_x'] = df['historical_rates_x'].fillna('[]').apply(ast.literal_eval)
-    df['historical_rates_y'] = df['historical_rates_y'].fillna('[]').apply(ast.literal_eval)
+    # Identify contract multipliers, e.g. 1000 for 1000PEPE
+    df['short_multiplier'] = np.where(swapped, df['multiplier_y'], df['multiplier_x'])
+    df['long_multiplier'] = np.where(swapped, df['multiplier_x'], df['multiplier_y'])
 
-    df['short_historical_rates'] = df.apply(
-        lambda x: x['historical_rates_x'] if x['short_exchange'] == exchange_1
-        else x['historical_rates_y'], axis=1)
-    df['long_historical_rates'] = df.apply(
-        lambda x: x['historical_rates_x'] if x['long_exchange'] == exchange_1
-        else x['historical_rates_y'], axis=1)
+    # Identify historical rates for short and long exchanges
+    historical_rates_x = parse_historical_rates(df['historical_rates_x']).to_numpy()
+    historical_rates_y = parse_historical_rates(df['historical_rates_y']).to_numpy()
+    df['short_historical_rates'] = np.where(swapped, historical_rates_y, historical_rates_x)
+    df['long_historical_rates'] = np.where(swapped, historical_rates_x, historical_rates_y)
 
     # Calculate cumulative rates and average APY
-    df['short_cumulative_rate'] = df['short_historical_rates'].apply(sum)
-    df['long_cumulative_rate'] = df['long_historical_rates'].apply(sum)
+    df['short_cumulative_rate'] = sum_historical_rates(df['short_historical_rates'])
+    df['long_cumulative_rate'] = sum_historical_rates(df['long_historical_rates'])
 
     df['cumulative_rate_diff'] = df['short_cumulative_rate'] - df['long_cumulative_rate']
     df['APY_historical_average'] = 365 * df['cumulative_rate_diff'] / CONFIG['funding_historical_days']
     df['APY_historical_average'] = df['APY_historical_average'].round(decimals=2)
 
+    # Calculate APY of every period from the funding history store as the difference between short and long
+    apy_horizon_columns = get_apy_horizon_columns()
+    for column in apy_horizon_columns:
+        apy_difference = df[f'{column}_x'] - df[f'{column}_y']
+        df[column] = np.where(swapped, -apy_difference, apy_difference)
+        df[column] = df[column].round(decimals=2)
+
+    # Identify funding statistics of the short and long legs
+    history_stat_columns = get_history_stat_columns()
+    for column in history_stat_columns:
+        df[f'short_{column}'] = np.where(swapped, df[f'{column}_y'], df[f'{column}_x'])
+        df[f'long_{column}'] = np.where(swapped, df[f'{column}_x'], df[f'{column}_y'])
+
     # Identify amplitude as the maximum between two exchanges or the values with more data available
     # Assigning initial values
     df['mean_daily_amplitude'] = df[['mean_daily_amplitude_x', 'mean_daily_amplitude_y']].max(axis=1)
@@ -178,81 +347,316 @@ def create_perp_perp_opportunities_df(exchange_1, exchange_2, df_1, df_2):
     df.loc[condition_2, 'amplitude_days'] = df['amplitude_days_y']
 
     return df[
-        ['pair', 'rate_diff', f'APY_historical_average', 'short_exchange', 'long_exchange',
+        ['pair', 'rate_diff', f'APY_historical_average', *apy_horizon_columns, 'short_exchange', 'long_exchange',
          'mean_daily_amplitude', 'max_daily_amplitude', 'amplitude_days', 'short_rate', 'long_rate',
+         'short_multiplier', 'long_multiplier', *get_leg_columns(history_stat_columns),
          'short_cumulative_rate', 'long_cumulative_rate', 'short_historical_rates', 'long_historical_rates']]
 
 
-def create_spot_perp_opportunites_df(perpetual_exchange, perpetual_rates_df, spot_pairs_df):
+def generate_perp_perp_opportunities_pairwise(perpetual_data_df, threshold):
+    """
+    Generates dataframes of Perpetual-Perpetual trading opportunities for every combination of two exchanges.
+
+    Args:
+        perpetual_data_df (dict): Dictionary with exchange names as keys and dataframes as values.
+        threshold (float): Minimum rate difference.
+
+    Yields:
+        pd.DataFrame: Opportunities above the threshold of one combination of exchanges.
+    """
+    for exchange_1, exchange_2 in combinations(perpetual_data_df.keys(), 2):
+        df = create_perp_perp_opportunities_df(exchange_1, exchange_2, perpetual_data_df[exchange_1],
+                                               perpetual_data_df[exchange_2])
+        yield df[df['rate_diff'] > threshold]
+
+
+def create_perp_perp_opportunities_matrix_df(perpetual_data_df, threshold, best_pair_only=False):
+    """
+    Creates a dataframe of Perpetual-Perpetual trading opportunities between all exchanges in one pass.
+
+    Collects all chunks of generate_perp_perp_opportunities_matrix. The result has the same
+    columns as create_perp_perp_opportunities_df.
+
+    Args:
+        perpetual_data_df (dict): Dictionary with exchange names as keys and dataframes as values.
+        threshold (float): Minimum rate difference. Combinations at or below it are not built.
+        best_pair_only (bool): Whether to return only the exchanges with the highest and lowest rates of every pair.
+
+    Returns:
+        pd.DataFrame: DataFrame containing Perpetual-Perpetual trading opportunities.
+    """
+    return pd.concat(list(generate_perp_perp_opportunities_matrix(perpetual_data_df, threshold, best_pair_only)),
+                     ignore_index=True)
+
+
+def generate_perp_perp_opportunities_matrix(perpetual_data_df, threshold, best_pair_only=False, chunk_pairs=None):
+    """
+    Generates dataframes of Perpetual-Perpetual trading opportunities between all exchanges.
+
+    All exchanges are pivoted into pair x exchange matrices. Pairs whose highest and lowest rates
+    differ by no more than the threshold are pruned first, then every short/long leg combination
+    of the remaining pairs is found with one vectorized comparison per chunk of chunk_pairs pairs.
+    Every chunk has the same columns as create_perp_perp_opportunities_df.
+
+    Args:
+        perpetual_data_df (dict): Dictionary with exchange names as keys and dataframes as values.
+        threshold (float): Minimum rate difference. Combinations at or below it are not built.
+        best_pair_only (bool): Whether to return only the exchanges with the highest and lowest rates of every pair.
+        chunk_pairs (int, optional): Number of candidate pairs per chunk. None compares all pairs at once.
+
+    Yields:
+        pd.DataFrame: Opportunities of a chunk of pairs. At least one, possibly empty, dataframe is generated.
+    """
+    exchanges = np.array(list(perpetual_data_df.keys()))
+    apy_horizon_columns = get_apy_horizon_columns()
+    history_stat_columns = get_history_stat_columns()
+
+    # Stack all exchanges and pivot every column into a pair x exchange matrix. Pairs are identified by instrument id,
+    # and concatenating the categorical pair columns of compact dataframes would compare their categories
+    stacked_df = expand_compact_df(pd.concat([df.drop(columns='pair').drop_duplicates(subset='instrument_id')
+                                              .assign(exchange_index=index)
+                                              for index, df in enumerate(perpetual_data_df.values())],
+                                             ignore_index=True))
+    pair_codes, instrument_ids = pd.factorize(stacked_df['instrument_id'])
+    pairs = get_instrument_symbols(instrument_ids)
+    exchange_codes = stacked_df['exchange_index'].to_numpy()
+
+    def to_matrix(values, dtype=np.float64):
+        matrix = np.full((len(pairs), len(exchanges)), np.nan if dtype == np.float64 else None, dtype=dtype)
+        matrix[pair_codes, exchange_codes] = values
+        return matrix
+
+    historical_rates = parse_historical_rates(stacked_df['historical_rates'])
+    rates = to_matrix(stacked_df['rate'])
+    historical_rates_matrix = to_matrix(historical_rates.to_numpy(), dtype=object)
+    cumulative_rates = to_matrix(sum_historical_rates(historical_rates))
+    value_matrices = {column: to_matrix(stacked_df[column]) for column in
+                      ['mean_daily_amplitude', 'max_daily_amplitude', 'amplitude_days', 'multiplier',
+                       *apy_horizon_columns, *history_stat_columns]}
+
+    # Prune pairs that can not pass the threshold with any combination of exchanges
+    listed = ~np.isnan(rates)
+    highest_rates = np.where(listed, rates, -np.inf).max(axis=1)
+    lowest_rates = np.where(listed, rates, np.inf).min(axis=1)
+    with np.errstate(invalid='ignore'):
+        candidates = np.flatnonzero((listed.sum(axis=1) >= 2) & (highest_rates - lowest_rates > threshold))
+    exchange_order = np.triu(np.ones((len(exchanges), len(exchanges)), dtype=bool), k=1)
+    chunk_pairs = chunk_pairs or max(len(candidates), 1)
+    for chunk_start in range(0, max(len(candidates), 1), chunk_pairs):
+        chunk_candidates = candidates[chunk_start:chunk_start + chunk_pairs]
+        candidate_rates = rates[chunk_candidates]
+
+        # Find short and long legs. Equal rates are ordered by the exchange order, as in the pairwise analysis
+        if best_pair_only:
+            # The long leg is taken from the other exchanges, so a pair with equal rates everywhere
+            # is not paired with itself
+            short_index = np.nanargmax(candidate_rates, axis=1)
+            long_rates = candidate_rates.copy()
+            long_rates[np.arange(len(chunk_candidates)), short_index] = np.nan
+            long_index = np.nanargmin(long_rates, axis=1)
+            pair_index = chunk_candidates
+        else:
+            rate_diff = candidate_rates[:, :, None] - candidate_rates[:, None, :]
+            with np.errstate(invalid='ignore'):
+                mask = (rate_diff > threshold) & ((rate_diff > 0) | ((rate_diff == 0) & exchange_order))
+            candidate_index, short_index, long_index = np.nonzero(mask)
+            pair_index = chunk_candidates[candidate_index]
+
+        df = pd.DataFrame({'pair': pairs[pair_index],
+                           'short_exchange': pd.Categorical.from_codes(short_index, exchanges),
+                           'long_exchange': pd.Categorical.from_codes(long_index, exchanges),
+                           'short_rate': rates[pair_index, short_index],
+                           'long_rate': rates[pair_index, long_index]})
+        df['rate_diff'] = df['short_rate'] - df['long_rate']
+        df['short_multiplier'] = value_matrices['multiplier'][pair_index, short_index].astype(np.int64)
+        df['long_multiplier'] = value_matrices['multiplier'][pair_index, long_index].astype(np.int64)
+
+        # Calculate cumulative rates and average APY
+        df['short_cumulative_rate'] = cumulative_rates[pair_index, short_index]
+        df['long_cumulative_rate'] = cumulative_rates[pair_index, long_index]
+        cumulative_rate_diff = df['short_cumulative_rate'] - df['long_cumulative_rate']
+        df['APY_historical_average'] = (365 * cumulative_rate_diff
+                                        / CONFIG['funding_historical_days']).round(decimals=2)
+        for column in apy_horizon_columns:
+            matrix = value_matrices[column]
+            df[column] = (matrix[pair_index, short_index] - matrix[pair_index, long_index]).round(decimals=2)
+        for column in history_stat_columns:
+            df[f'short_{column}'] = value_matrices[column][pair_index, short_index]
+            df[f'long_{column}'] = value_matrices[column][pair_index, long_index]
+
+        # Identify amplitude as the maximum between two exchanges or the values with more data available
+        first_index, second_index = np.minimum(short_index, long_index), np.maximum(short_index, long_index)
+        days_first = value_matrices['amplitude_days'][pair_index, first_index]
+        days_second = value_matrices['amplitude_days'][pair_index, second_index]
+        condition_1 = days_first > days_second
+        condition_2 = days_second > days_first
+        for column in ['mean_daily_amplitude', 'max_daily_amplitude']:
+            value_first = value_matrices[column][pair_index, first_index]
+            value_second = value_matrices[column][pair_index, second_index]
+            df[column] = np.where(condition_1, value_first,
+                                  np.where(condition_2, value_second, np.fmax(value_first, value_second)))
+        df['amplitude_days'] = np.where(condition_2, days_second, days_first)
+
+        df['short_historical_rates'] = historical_rates_matrix[pair_index, short_index]
+        df['long_historical_rates'] = historical_rates_matrix[pair_index, long_index]
+
+        yield df[
+            ['pair', 'rate_diff', f'APY_historical_average', *apy_horizon_columns, 'short_exchange', 'long_exchange',
+             'mean_daily_amplitude', 'max_daily_amplitude', 'amplitude_days', 'short_rate', 'long_rate',
+             'short_multiplier', 'long_multiplier', *get_leg_columns(history_stat_columns),
+             'short_cumulative_rate', 'long_cumulative_rate', 'short_historical_rates', 'long_historical_rates']]
+
+
+def create_spot_perp_opportunites_df(perpetual_data_df, spot_index):
     """
-   Creates a dataframe of Spot-Perpetual trading opportunities by merging perpetual and spot dataframes
+   Creates a dataframe of Spot-Perpetual trading opportunities of all perpetual exchanges
+   by looking up their pairs in the spot index
 
    Args:
-       perpetual_exchange (str): Name of the perpetual exchange.
-       perpetual_rates_df (pd.DataFrame): DataFrame of funding rates for perpetual_exchange.
-       spot_pairs_df (pd.DataFrame): DataFrame of spot trading pairs.
+       perpetual_data_df (dict): Dictionary with exchange names as keys and dataframes as values.
+       spot_index (dict): Spot index created by build_spot_index.
 
    Returns:
        pd.DataFrame: DataFrame containing Spot-Perpetual trading opportunities.
    """
-    # Rename pair column to spot_pair in spot data dataframe
-    spot_pairs_df.rename(columns={'pair': 'spot_pair'}, inplace=True)
+    return pd.concat(list(generate_spot_perp_opportunities(perpetual_data_df, spot_index)), ignore_index=True)
 
-    # Create spot_pair column out of perpetual pair by splitting the string with ':'
-    perpetual_rates_df['spot_pair'] = perpetual_rates_df['pair'].str.split(':').str.get(0)
 
-    # Filter data below the threshold
-    perpetual_rates_df = perpetual_rates_df[perpetual_rates_df['rate'].abs() > CONFIG['funding_rate_threshold']]
+def generate_spot_perp_opportunities(perpetual_data_df, spot_index, chunk_pairs=None):
+    """
+    Generates dataframes of Spot-Perpetual trading opportunities of all perpetual exchanges,
+    chunk_pairs pairs of one exchange at a time, so they can be collected and streamed while they are found.
+
+    Args:
+        perpetual_data_df (dict): Dictionary with exchange names as keys and dataframes as values.
+        spot_index (dict): Spot index created by build_spot_index.
+        chunk_pairs (int, optional): Number of pairs of an exchange per chunk. None takes every exchange at once.
 
-    # Merge perpetual and spot dataframes
-    spot_perp_df = pd.merge(perpetual_rates_df, spot_pairs_df, on='spot_pair', how='inner')
+    Yields:
+        pd.DataFrame: Opportunities of a chunk of pairs with the columns of create_spot_perp_opportunites_df.
+            At least one, possibly empty, dataframe is generated per exchange.
+    """
+    # A required exchange without spot data lists no pair, so no pair passes
+    required_bits = get_exchange_bits(spot_index, CONFIG['spot_exchanges_required'])
+    missing_exchanges = [exchange for exchange in CONFIG['spot_exchanges_required']
+                         if exchange not in spot_index['exchanges']]
+    if missing_exchanges:
+        print(f"Required spot exchanges without spot data: {', '.join(missing_exchanges)}. "
+              f"No Spot-Perpetual opportunities are found")
+    for exchange, df in perpetual_data_df.items():
+        step = chunk_pairs or max(len(df), 1)
+        for chunk_start in range(0, max(len(df), 1), step):
+            yield create_spot_perp_chunk_df(exchange, df.iloc[chunk_start:chunk_start + step], spot_index,
+                                            required_bits, missing_exchanges)
+
+
+def create_spot_perp_chunk_df(exchange, df, spot_index, required_bits, missing_exchanges):
+    """
+    Creates a dataframe of the Spot-Perpetual trading opportunities of a chunk of pairs of one perpetual exchange.
 
-    # Add the column with the perpetual exchange name
-    spot_perp_df['perp_exchange'] = perpetual_exchange
+    Args:
+        exchange (str): Name of the perpetual exchange.
+        df (pd.DataFrame): Chunk of the dataframe of the exchange.
+        spot_index (dict): Spot index created by build_spot_index.
+        required_bits (int): Bits of the spot exchanges that must all list the spot pair.
+        missing_exchanges (list): Required spot exchanges without spot data.
+
+    Returns:
+        pd.DataFrame: DataFrame containing Spot-Perpetual trading opportunities.
+    """
+    # Filter data below the threshold
+    df = expand_compact_df(df)
+    spot_perp_df = df[df['rate'].abs() > CONFIG['funding_rate_threshold']].assign(perp_exchange=exchange)
+    spot_perp_df = spot_perp_df.reset_index(drop=True)
+
+    # Look up the spot exchanges that list the spot instrument with the same base and quote of every pair
+    masks = get_spot_masks(spot_index, spot_perp_df['spot_id'])
+    listed = (masks != 0) & ((masks & required_bits) == required_bits) & (not missing_exchanges)
+    spot_perp_df = spot_perp_df[listed].reset_index(drop=True)
+    spot_perp_df['spot_exchange'] = get_spot_exchange_names(spot_index, masks[listed])
 
     # Format historical rates and calculate average APY out of them
-    spot_perp_df['historical_rates'] = spot_perp_df['historical_rates'].fillna('[]').apply(ast.literal_eval)
-    spot_perp_df['APY_historical_average'] = 365 * spot_perp_df['historical_rates'].apply(sum) / CONFIG['funding_historical_days']
+    spot_perp_df['historical_rates'] = parse_historical_rates(spot_perp_df['historical_rates'])
+    spot_perp_df['APY_historical_average'] = (365 * sum_historical_rates(spot_perp_df['historical_rates'])
+                                              / CONFIG['funding_historical_days'])
 
     # Round APY
     spot_perp_df['APY_historical_average'] = spot_perp_df['APY_historical_average'].round(decimals=2)
 
     return spot_perp_df[
-        ['pair', 'rate', 'APY_historical_average', 'perp_exchange', 'spot_exchange',
-         'mean_daily_amplitude', 'max_daily_amplitude', 'amplitude_days', 'historical_rates']]
+        ['pair', 'rate', 'APY_historical_average', *get_apy_horizon_columns(), 'perp_exchange', 'spot_exchange',
+         'multiplier', 'mean_daily_amplitude', 'max_daily_amplitude', 'amplitude_days', *get_history_stat_columns(),
+         'historical_rates']]
 
 
-def filter_and_sort_rates(df, negative=False):
+def filter_rates(df, negative=False):
     """
-    Filters and sorts DataFrame with Spot-Perpetual trading opportunities based on specified conditions.
+    Filters DataFrame with Spot-Perpetual trading opportunities by the sign of the funding rate.
 
     Args:
         df (pd.DataFrame): DataFrame containing Spot-Perpetual trading opportunities
         negative (bool): Specifies whether to filter dataframes with positive or negative rates.
 
     Returns:
-        pd.DataFrame: Filtered and sorted DataFrame.
+        pd.DataFrame: Filtered DataFrame. APY columns of negative rates are negated, so positive APY is profit.
     """
     if negative:
-        df[f'APY_historical_average'] *= -1
-        filtered_df = df[df['rate'] < 0]
-        sorted_df = filtered_df.sort_values(by='rate', ascending=True, ignore_index=True)
+        filtered_df = df[df['rate'] < 0].copy()
+        filtered_df[f'APY_historical_average'] *= -1
+        filtered_df[get_apy_horizon_columns()] *= -1
     else:
         filtered_df = df[df['rate'] > 0]
-        sorted_df = filtered_df.sort_values(by='rate', ascending=False, ignore_index=True)
 
-    return sorted_df
+    return filtered_df
 
 
-def remove_leading_numbers(trading_pair):
+def parse_historical_rates(historical_rates):
     """
-    Removes leading numbers starting with '10', '100', '1000', etc., from a trading pair string.
+    Converts a column of historical rates to lists or arrays of floats.
+
+    Parquet snapshots store the rates as real lists, which are loaded as arrays and kept as they are,
+    like the array views of compact snapshots. Excel and CSV files store them as strings,
+    which are parsed with ast.literal_eval.
 
     Args:
-    - trading_pair (str): The trading pair string containing currency names and possibly leading numbers.
+        historical_rates (pd.Series): Column of historical rates. Missing values become empty lists.
 
     Returns:
-    - str: The trading pair string with leading numbers removed.
+        pd.Series: Column of lists or arrays of historical rates.
     """
-    return re.sub(r'^(10+)', '', trading_pair)
+    def parse(rates):
+        if isinstance(rates, str):
+            return ast.literal_eval(rates)
+        if rates is None or isinstance(rates, float):
+            return []
+        if isinstance(rates, np.ndarray):
+            return rates
+        return list(rates)
+
+    return historical_rates.apply(parse)
+
 
+def sum_historical_rates(historical_rates):
+    """
+    Sums every list of historical rates with one segment reduction over a ragged array of all rates.
+
+    Args:
+        historical_rates (pd.Series): Column of lists of historical rates.
+
+    Returns:
+        np.ndarray: Sum of the historical rates of every row. Empty lists sum to 0.
+    """
+    return sum_segments(create_rate_history_from_lists(historical_rates))
+
+
+def get_leg_columns(columns):
+    """
+    Returns the names of the short and long leg columns of Perpetual-Perpetual opportunities.
+
+    Args:
+        columns (list): Column names of one exchange, e.g. ['rate_volatility'].
+
+    Returns:
+        list: Column names, e.g. ['short_rate_volatility', 'long_rate_volatility'].
+    """
+    return [f'{leg}_{column}' for column in columns for leg in ['short', 'long']]
@@ -0,0 +1,290 @@
+import contextlib
+import glob
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from analyze_data import create_perpetual_data_df_from_files, create_spot_index_from_files, find_opportunities
+from config import CONFIG
+from funding_history import HOUR_MS
+from funding_history_store import open_funding_history_store, load_funding_history
+from instrument_registry import get_instrument_columns
+from utils import df_to_file, display_progress, get_snapshot_time
+
+# Realized funding of every exchange, loaded once per worker process by init_backtest_worker
+worker_history = {}
+
+
+def run_backtest():
+    """
+    Backtests the opportunities found in saved snapshots against the funding rates paid after them.
+
+    Every snapshot subdirectory of the main directory between backtest_start and backtest_end is analyzed
+    in a pool of worker processes, as analyze_data would analyze it. The best backtest_top_n opportunities
+    of every result are entered at the time of the snapshot and held for every period of backtest_holding_hours.
+    Their realized funding is read from the funding history store. The scored trades and the hit-rate
+    and PnL tables are saved to the directory/backtest_subdirectory folder.
+    """
+    print(f"- Backtest started")
+    directory_backtest = f"{CONFIG['directory']}/{CONFIG['backtest_subdirectory']}"
+    snapshots = get_backtest_snapshots()
+    if not snapshots:
+        print(f"- Exiting: No snapshots found in {CONFIG['directory']}")
+        return
+    print(f"-- Backtesting {len(snapshots)} snapshots ({snapshots[0][0]} to {snapshots[-1][0]})")
+
+    # Workers load the realized funding from the first snapshot to the end of the longest holding period
+    start_ms = min(snapshot_time for _, snapshot_time in snapshots)
+    end_ms = max(snapshot_time for _, snapshot_time in snapshots) + max(CONFIG['backtest_holding_hours']) * HOUR_MS
+    trades = []
+    with ProcessPoolExecutor(max_workers=CONFIG['backtest_workers'] or os.cpu_count(),
+                             initializer=init_backtest_worker, initargs=(dict(CONFIG), start_ms, end_ms)) as executor:
+        futures = {executor.submit(backtest_snapshot, subdirectory, snapshot_time): subdirectory
+                   for subdirectory, snapshot_time in snapshots}
+        for index, future in enumerate(as_completed(futures)):
+            try:
+                trades.append(future.result())
+            except Exception as e:
+                print(f"\nError: Backtest of snapshot {futures[future]} failed: {e}")
+            display_progress(index + 1, len(futures), info="Backtesting snapshots")
+    print("\r")
+
+    trades = [df for df in trades if not df.empty]
+    if not trades:
+        print(f"- Exiting: No opportunities found in the snapshots")
+        return
+    trades_df = pd.concat(trades, ignore_index=True).sort_values(['snapshot', 'result', 'rank'], ignore_index=True)
+    df_to_file(trades_df, directory_backtest, 'backtest_trades')
+    df_to_file(summarize_backtest(trades_df, ['result']), directory_backtest, 'backtest_summary')
+    df_to_file(summarize_backtest(trades_df, ['result', 'short_exchange', 'long_exchange']), directory_backtest,
+               'backtest_summary_exchanges')
+    print(f"- Backtest finished. The results are saved in the directory: {directory_backtest}")
+
+
+def get_backtest_snapshots():
+    """
+    Returns the snapshots to backtest: subdirectories of the main directory with perpetual funding rates files,
+    whose names are between backtest_start and backtest_end.
+
+    Snapshots are entered at the fetch time recorded in them (see get_snapshot_time).
+
+    Returns:
+        list: (subdirectory, snapshot time in milliseconds) tuples ordered by subdirectory name.
+    """
+    snapshots = []
+    for directory_data in sorted(glob.glob(f"{CONFIG['directory']}/*/data")):
+        subdirectory = os.path.basename(os.path.dirname(directory_data))
+        if CONFIG['backtest_start'] and subdirectory < CONFIG['backtest_start']:
+            continue
+        if CONFIG['backtest_end'] and subdirectory > CONFIG['backtest_end']:
+            continue
+        snapshot_time = get_snapshot_time(directory_data)
+        if snapshot_time is not None:
+            snapshots.append((subdirectory, snapshot_time))
+    return snapshots
+
+
+def init_backtest_worker(config, start_ms, end_ms):
+    """
+    Prepares a worker process: applies the config of the main process and loads the realized funding rates
+    of every perpetual exchange from the funding history store once for all snapshots of the worker.
+
+    APY columns from the store are not calculated for the snapshots, the opportunities are ranked
+    by current rates only.
+
+    Args:
+        config (dict): Config of the main process.
+        start_ms (int): Start of the funding rates to load in milliseconds.
+        end_ms (int): End of the funding rates to load in milliseconds.
+    """
+    CONFIG.update(config)
+    CONFIG.update(apy_horizons_days=[], result_top_k=CONFIG['backtest_top_n'], result_stream_format=None)
+    store = open_funding_history_store()
+    for exchange in CONFIG['perpetual_exchanges']:
+        history = load_funding_history(store, exchange, start_ms)
+        history = history[history['timestamp'] <= end_ms]
+        worker_history[exchange] = create_realized_funding(history)
+    store.close()
+
+
+def create_realized_funding(history):
+    """
+    Creates a lookup of the funding paid by every instrument of an exchange over any period.
+
+    Rows are keyed by instrument id and funding time, combined into one sorted int64 key, next to
+    the running sum of the rates. The funding of any number of (instrument, period) queries is then
+    the difference of the running sums at the two ends, found with one binary search.
+
+    Args:
+        history (pd.DataFrame): Stored funding rates with symbol, timestamp and rate columns.
+
+    Returns:
+        dict: Sorted keys, running sums of the rates in percent, ids of the instruments with stored rates
+            and the time of the last stored rate.
+    """
+    instrument_ids = get_instrument_columns(history['symbol'])[0]
+    keys = get_funding_keys(instrument_ids, history['timestamp'].to_numpy())
+    order = np.argsort(keys, kind='stable')
+    return {'keys': keys[order],
+            'cumulative_rates': np.r_[0, np.cumsum(100 * history['rate'].to_numpy()[order])],
+            'instrument_ids': np.unique(instrument_ids),
+            'end_ms': history['timestamp'].max() if len(history) else None}
+
+
+def get_funding_keys(instrument_ids, timestamps):
+    """
+    Combines instrument ids and funding times into sortable int64 keys. Millisecond timestamps use 42 bits.
+
+    Args:
+        instrument_ids (np.ndarray): Instrument ids.
+        timestamps (np.ndarray): Funding times in milliseconds.
+
+    Returns:
+        np.ndarray: Keys.
+    """
+    return (np.asarray(instrument_ids, dtype=np.int64) << 42) | np.asarray(timestamps, dtype=np.int64)
+
+
+def get_realized_funding(exchanges, pairs, start_ms, end_ms):
+    """
+    Returns the funding paid to a short position of every leg after start_ms and up to end_ms.
+
+    Args:
+        exchanges (np.ndarray): Perpetual exchange of every leg, None for spot legs.
+        pairs (np.ndarray): Canonical pair of every leg.
+        start_ms (int): Entry time in milliseconds.
+        end_ms (int): Exit time in milliseconds.
+
+    Returns:
+        np.ndarray: Sum of the funding rates in percent. 0 for spot legs and for legs without a funding
+            in the period, NaN for legs whose exchange has no stored rates up to end_ms or whose pair has
+            no stored rates at all.
+    """
+    realized = np.where(pd.isna(exchanges), 0.0, np.nan)
+    instrument_ids = get_instrument_columns(pd.Series(pairs, dtype=object))[0]
+    for exchange in pd.unique(exchanges[~pd.isna(exchanges)]):
+        funding = worker_history.get(exchange)
+        if funding is None or funding['end_ms'] is None or funding['end_ms'] < end_ms:
+            continue
+        legs = exchanges == exchange
+        start = np.searchsorted(funding['keys'], get_funding_keys(instrument_ids[legs], start_ms), side='right')
+        end = np.searchsorted(funding['keys'], get_funding_keys(instrument_ids[legs], end_ms), side='right')
+        paid = funding['cumulative_rates'][end] - funding['cumulative_rates'][start]
+        realized[legs] = np.where(np.isin(instrument_ids[legs], funding['instrument_ids']), paid, np.nan)
+    return realized
+
+
+def backtest_snapshot(subdirectory, snapshot_time):
+    """
+    Analyzes one snapshot and scores its best opportunities. Runs in a worker process.
+
+    Args:
+        subdirectory (str): Subdirectory of the snapshot.
+        snapshot_time (int): Time of the snapshot in milliseconds.
+
+    Returns:
+        pd.DataFrame: Scored trades (see score_trades), empty if the snapshot has no opportunities.
+    """
+    directory_data = f"{CONFIG['directory']}/{subdirectory}/data"
+    # The analysis of hundreds of snapshots would flood the output, progress is shown by the main process
+    with contextlib.redirect_stdout(io.StringIO()):
+        perpetual_data_df = create_perpetual_data_df_from_files(directory_data)
+        if not perpetual_data_df:
+            return pd.DataFrame()
+        spot_index = create_spot_index_from_files(directory_data) if CONFIG['get_spot_perp_opportunities'] else None
+        results = find_opportunities(perpetual_data_df, spot_index)
+    trades = create_trades_df(results)
+    if trades.empty:
+        return trades
+    trades.insert(0, 'snapshot', subdirectory)
+    return score_trades(trades, snapshot_time)
+
+
+def create_trades_df(results):
+    """
+    Turns the best opportunities of every result into trades with a short and a long leg.
+
+    Perpetual-Perpetual trades are short on the exchange with the higher rate and long on the other.
+    Spot-Perpetual trades are short on the perpetual exchange for positive rates and long for negative
+    rates, the spot leg has no exchange.
+
+    Args:
+        results (dict): Result dataframes returned by find_opportunities.
+
+    Returns:
+        pd.DataFrame: Trades with result, rank, pair, short_exchange, long_exchange and entry_rate columns.
+            The entry rate is the funding rate in percent the trade is expected to collect per funding.
+    """
+    trades = []
+    for name, df in results.items():
+        df = df.head(CONFIG['backtest_top_n'])
+        if df.empty:
+            continue
+        if name == 'perp_perp':
+            short_exchange, long_exchange, entry_rate = df['short_exchange'], df['long_exchange'], df['rate_diff']
+        elif name == 'spot_perp_positive':
+            short_exchange, long_exchange, entry_rate = df['perp_exchange'], None, df['rate']
+        else:
+            short_exchange, long_exchange, entry_rate = None, df['perp_exchange'], -df['rate']
+        trades.append(pd.DataFrame({'result': name,
+                                    'rank': np.arange(1, len(df) + 1),
+                                    'pair': df['pair'].astype(object).to_numpy(),
+                                    'short_exchange': np.asarray(short_exchange, dtype=object),
+                                    'long_exchange': np.asarray(long_exchange, dtype=object),
+                                    'entry_rate': entry_rate.to_numpy()}))
+    return pd.concat(trades, ignore_index=True) if trades else pd.DataFrame()
+
+
+def score_trades(trades, snapshot_time):
+    """
+    Adds the realized funding of every trade for every holding period of backtest_holding_hours:
+    the funding collected on the short leg minus the funding paid on the long leg, in percent.
+
+    Args:
+        trades (pd.DataFrame): Trades created by create_trades_df.
+        snapshot_time (int): Entry time in milliseconds.
+
+    Returns:
+        pd.DataFrame: Trades with a realized_<N>h column per holding period. Periods that are not covered
+            by the funding history store are NaN.
+    """
+    for hours in sorted(CONFIG['backtest_holding_hours']):
+        end_ms = snapshot_time + hours * HOUR_MS
+        short_funding = get_realized_funding(trades['short_exchange'].to_numpy(), trades['pair'].to_numpy(),
+                                             snapshot_time, end_ms)
+        long_funding = get_realized_funding(trades['long_exchange'].to_numpy(), trades['pair'].to_numpy(),
+                                            snapshot_time, end_ms)
+        trades[f'realized_{hours}h'] = (short_funding - long_funding).round(decimals=6)
+    return trades
+
+
+def summarize_backtest(trades_df, group_columns):
+    """
+    Aggregates scored trades into a hit-rate and PnL table.
+
+    Args:
+        trades_df (pd.DataFrame): Scored trades of all snapshots.
+        group_columns (list): Columns to group the trades by, e.g. ['result'].
+
+    Returns:
+        pd.DataFrame: One row per group and holding period with the number of scored trades, the percentage
+            of trades with positive realized funding, and the mean, median and total realized funding in percent.
+    """
+    summaries = []
+    for hours in sorted(CONFIG['backtest_holding_hours']):
+        column = f'realized_{hours}h'
+        scored = trades_df[trades_df[column].notna()].assign(hit=lambda df: df[column] > 0)
+        if scored.empty:
+            continue
+        summary = scored.groupby(group_columns, dropna=False).agg(trades=(column, 'size'),
+                                                                  hit_rate=('hit', 'mean'),
+                                                                  mean_pnl=(column, 'mean'),
+                                                                  median_pnl=(column, 'median'),
+                                                                  total_pnl=(column, 'sum'),
+                                                                  mean_entry_rate=('entry_rate', 'mean'))
+        summary['hit_rate'] *= 100
+        summary.insert(0, 'holding_hours', hours)
+        summaries.append(summary.round(decimals=4).reset_index())
+    return pd.concat(summaries, ignore_index=True) if summaries else pd.DataFrame()
@@ -0,0 +1,368 @@
+import argparse
+import asyncio
+import contextlib
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import fetch_data
+from analyze_data import (create_perp_perp_opportunities_df,
+                          create_perp_perp_opportunities_matrix_df, create_spot_perp_opportunites_df,
+                          get_apy_horizon_columns, get_history_stat_columns, parse_historical_rates)
+from config import CONFIG
+from fake_exchange import FakeExchange, AsyncFakeExchange
+from fetch_data import get_funding_rates_for_pairs, get_historical_funding_rates_for_pairs, get_daily_amplitude
+from fetch_data_async import fetch_perpetual_data
+from instrument_registry import add_instrument_columns
+from spot_index import build_spot_index
+from utils import df_to_file, file_to_df
+
+BENCHMARK_SIZES = [1000, 10000, 100000]
+# Modules imported by every command of the scanner. 'all' is every stage at once, as imported before
+# the stages were loaded on demand
+STARTUP_COMMANDS = {'analyze': ['analyze_data'],
+                    'fetch': ['fetch_data'],
+                    'all': ['fetch_data', 'analyze_data', 'backtest', 'scanner_daemon']}
+# Peak memory is read from /proc, as ru_maxrss keeps the peak of the benchmark process across exec on Linux
+STARTUP_SCRIPT = """
+import json, sys
+import funding_rate_arbitrage_scanner
+{imports}
+try:
+    with open('/proc/self/status') as file:
+        rss_mb = next(int(line.split()[1]) for line in file if line.startswith('VmHWM')) / 1024
+except (OSError, StopIteration):
+    rss_mb = None
+print(json.dumps({{'ccxt': 'ccxt' in sys.modules, 'rss_mb': rss_mb}}))
+"""
+
+
+def benchmark_fetch_modes(markets=100, latency=0.05, rate_limit=1):
+    """
+    Compares the sync and async fetch modes on a fake exchange without network access.
+
+    Both modes are paced by the request scheduler at the same rate limit. The default one is high enough
+    for the latency to be the limit, which is what the async mode overlaps. At the rate limit of a real
+    exchange both modes take about the same time. The funding history and candle stores are off,
+    so both modes make the same requests, and anything written goes to a temporary directory.
+
+    Args:
+        markets (int): Number of perpetual pairs of the fake exchange.
+        latency (float): Simulated round trip time of every request in seconds.
+        rate_limit (int): Advertised milliseconds between requests of the fake exchange.
+
+    Returns:
+        dict: Elapsed seconds and number of requests of each mode and the speedup of the async mode.
+    """
+    hours = CONFIG['funding_historical_days'] * 24
+
+    with tempfile.TemporaryDirectory() as directory, \
+            config_overrides(directory=directory, funding_history_store=False, candle_store=False):
+        exchange = FakeExchange('fake_sync', markets=markets, latency=latency, rate_limit=rate_limit)
+        start = time.perf_counter()
+        get_funding_rates_for_pairs(exchange, exchange.symbols)
+        get_historical_funding_rates_for_pairs(exchange, exchange.symbols, hours=hours)
+        get_daily_amplitude(exchange, exchange.symbols)
+        sync_seconds = time.perf_counter() - start
+
+        async_exchange = AsyncFakeExchange('fake_async', markets=markets, latency=latency, rate_limit=rate_limit)
+        start = time.perf_counter()
+        asyncio.run(fetch_perpetual_data(async_exchange, async_exchange.symbols, hours=hours))
+        async_seconds = time.perf_counter() - start
+
+    return {'sync_seconds': round(sync_seconds, 3), 'sync_requests': exchange.request_count,
+            'async_seconds': round(async_seconds, 3), 'async_requests': async_exchange.request_count,
+            'speedup': round(sync_seconds / async_seconds, 1), 'rate_limit': rate_limit}
+
+
+def benchmark_startup(repeats=5):
+    """
+    Measures how long the scanner takes to start every command, in a new interpreter every time.
+
+    The scanner script and the modules of the command are imported without running it,
+    so the time does not depend on the data or the network.
+
+    Args:
+        repeats (int): Number of runs of every command. The median time is reported.
+
+    Returns:
+        dict: Median seconds, peak memory in MB and whether ccxt was loaded, for every command in STARTUP_COMMANDS.
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for command, modules in STARTUP_COMMANDS.items():
+        script = STARTUP_SCRIPT.format(imports='\n'.join(f"import {module}" for module in modules))
+        seconds = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True,
+                                    cwd=directory).stdout
+            seconds.append(time.perf_counter() - start)
+        report = json.loads(output.splitlines()[-1])
+        rss_mb = round(report['rss_mb'], 1) if report['rss_mb'] is not None else None
+        results[command] = {'seconds': round(statistics.median(seconds), 3), 'rss_mb': rss_mb, 'ccxt': report['ccxt']}
+    return results
+
+
+def create_synthetic_funding_rates_df(pairs=1000, history_length=9, seed=0):
+    """
+    Creates a dataframe with the columns of a funding_rates_{exchange} snapshot filled with random data.
+
+    Args:
+        pairs (int): Number of rows.
+        history_length (int): Number of historical rates per pair.
+        seed (int): Seed of the random generator.
+
+    Returns:
+        pd.DataFrame: Synthetic funding rates dataframe.
+    """
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'pair': [f"COIN{index}/USDT:USDT" for index in range(pairs)],
+        'rate': rng.uniform(-0.1, 0.1, pairs).round(3),
+        'historical_rates': [list(rates) for rates in rng.uniform(-0.1, 0.1, (pairs, history_length)).round(3)],
+        'mean_daily_amplitude': rng.uniform(1, 20, pairs).round(2),
+        'max_daily_amplitude': rng.uniform(20, 60, pairs).round(2),
+        'amplitude_days': rng.integers(1, 100, pairs),
+    })
+    for column in get_apy_horizon_columns():
+        df[column] = rng.uniform(-50, 50, pairs).round(2)
+    for column in get_history_stat_columns():
+        df[column] = rng.uniform(0, 100, pairs).round(2)
+    return df
+
+
+def benchmark_snapshot_formats(pairs=5000, file_formats=('xlsx', 'csv', 'parquet')):
+    """
+    Measures writing a snapshot file and loading it back with parsed historical rates in every file format.
+
+    Args:
+        pairs (int): Number of rows of the snapshot.
+        file_formats (tuple): File formats to compare.
+
+    Returns:
+        dict: Write and load-and-parse seconds and file size in bytes of every file format.
+    """
+    df = create_synthetic_funding_rates_df(pairs)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for file_format in file_formats:
+            start = time.perf_counter()
+            df_to_file(df, directory, 'funding_rates_benchmark', file_format)
+            write_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            loaded_df = file_to_df(directory, 'funding_rates_benchmark', file_format)
+            parse_historical_rates(loaded_df['historical_rates'])
+            load_seconds = time.perf_counter() - start
+
+            results[file_format] = {
+                'write_seconds': round(write_seconds, 3), 'load_seconds': round(load_seconds, 3),
+                'bytes': os.path.getsize(f"{directory}/funding_rates_benchmark.{file_format}")}
+    return results
+
+
+@contextlib.contextmanager
+def config_overrides(**values):
+    """
+    Temporarily changes config values and restores them afterwards.
+
+    Args:
+        **values: Config keys and their values.
+    """
+    previous = {key: CONFIG[key] for key in values}
+    CONFIG.update(values)
+    try:
+        yield
+    finally:
+        CONFIG.update(previous)
+
+
+def benchmark_fetch_and_save(markets, exchanges=2, latency=0.0, rate_limit=1, max_requests_per_second=None):
+    """
+    Measures fetch_and_save_data with fake perpetual and spot exchanges in a temporary data directory.
+
+    Every exchange has its own id per size, so nothing is reused from the market cache of another measurement.
+    Funding history and candle stores start empty, so this is the cost of a first run.
+
+    Args:
+        markets (int): Number of perpetual pairs of every fake exchange.
+        exchanges (int): Number of fake exchanges. All of them are used as perpetual and spot exchanges.
+        latency (float): Simulated round trip time of every request in seconds.
+        rate_limit (int): Advertised milliseconds between requests, used by the request scheduler.
+        max_requests_per_second (int, optional): Request cap of the fake exchanges. None means no throttling.
+
+    Returns:
+        dict: Elapsed seconds, number of requests and number of throttled requests.
+    """
+    exchange_names = [f"fake{index}_{markets}" for index in range(exchanges)]
+    fake_exchanges = []
+
+    def init_fake_exchange(exchange_name):
+        exchange = FakeExchange(exchange_name, markets=markets, latency=latency, rate_limit=rate_limit,
+                                max_requests_per_second=max_requests_per_second)
+        fake_exchanges.append(exchange)
+        return exchange
+
+    init_exchange = fetch_data.init_exchange
+    with tempfile.TemporaryDirectory() as directory, \
+            config_overrides(directory=directory, perpetual_exchanges=exchange_names, spot_exchanges=exchange_names,
+                             fetch_mode='sync', parallel_exchanges=False):
+        fetch_data.init_exchange = init_fake_exchange
+        try:
+            start = time.perf_counter()
+            fetch_data.fetch_and_save_data()
+            seconds = time.perf_counter() - start
+        finally:
+            fetch_data.init_exchange = init_exchange
+
+    return {'seconds': round(seconds, 3),
+            'requests': sum(exchange.request_count for exchange in fake_exchanges),
+            'throttled': sum(exchange.throttled_count for exchange in fake_exchanges)}
+
+
+def benchmark_analysis(pairs, exchanges=3):
+    """
+    Measures every create_*_opportunities_df function on synthetic data of several exchanges.
+
+    Every exchange lists the same pairs with different random rates, like the prepared data of analyze_data.
+
+    Args:
+        pairs (int): Number of pairs per exchange.
+        exchanges (int): Number of perpetual exchanges.
+
+    Returns:
+        dict: Elapsed seconds and number of result rows keyed by function name.
+    """
+    perpetual_data_df = {}
+    for index in range(exchanges):
+        df = create_synthetic_funding_rates_df(pairs, seed=index)
+        perpetual_data_df[f"exchange{index}"] = add_instrument_columns(df)
+    spot_pairs = pd.DataFrame({'pair': [f"COIN{index}/USDT" for index in range(0, pairs, 2)]})
+    spot_index = build_spot_index({'exchange0': spot_pairs})
+    exchange_names = list(perpetual_data_df.keys())
+    threshold = CONFIG['funding_rate_threshold']
+
+    def run_pairwise():
+        return pd.concat([create_perp_perp_opportunities_df(exchange_1, exchange_2, perpetual_data_df[exchange_1],
+                                                            perpetual_data_df[exchange_2])
+                          for index, exchange_1 in enumerate(exchange_names)
+                          for exchange_2 in exchange_names[index + 1:]], ignore_index=True)
+
+    def run_matrix():
+        return create_perp_perp_opportunities_matrix_df(perpetual_data_df, threshold)
+
+    def run_spot_perp():
+        return create_spot_perp_opportunites_df(perpetual_data_df, spot_index)
+
+    results = {}
+    for name, function in [('create_perp_perp_opportunities_df', run_pairwise),
+                           ('create_perp_perp_opportunities_matrix_df', run_matrix),
+                           ('create_spot_perp_opportunites_df', run_spot_perp)]:
+        start = time.perf_counter()
+        df = function()
+        results[name] = {'seconds': round(time.perf_counter() - start, 3), 'rows': len(df)}
+    return results
+
+
+def get_git_commit():
+    """
+    Returns the commit the benchmark runs on, so results of different runs can be matched with code changes.
+
+    Returns:
+        str: Commit hash, or None outside of a git checkout.
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark_suite(sizes=BENCHMARK_SIZES, fetch_sizes=BENCHMARK_SIZES):
+    """
+    Runs the fetch, analysis and file round trip benchmarks at every size.
+
+    Args:
+        sizes (list): Numbers of pairs for the analysis and file round trip benchmarks.
+        fetch_sizes (list): Numbers of pairs per exchange for the fetch_and_save_data benchmark.
+
+    Returns:
+        list: One record per benchmark and size with its measurements.
+    """
+    records = []
+    for markets in fetch_sizes:
+        print(f"- Benchmark fetch_and_save_data: {markets} pairs")
+        records.append({'benchmark': 'fetch_and_save_data', 'pairs': markets, **benchmark_fetch_and_save(markets)})
+    for pairs in sizes:
+        print(f"- Benchmark analysis: {pairs} pairs")
+        for name, result in benchmark_analysis(pairs).items():
+            records.append({'benchmark': name, 'pairs': pairs, **result})
+        print(f"- Benchmark file round trip: {pairs} pairs")
+        for file_format, result in benchmark_snapshot_formats(pairs).items():
+            records.append({'benchmark': f"file_round_trip_{file_format}", 'pairs': pairs, **result})
+    return records
+
+
+def save_benchmark_results(records, path):
+    """
+    Saves benchmark records with the details of the run to a JSON file.
+
+    Args:
+        records (list): Records returned by run_benchmark_suite.
+        path (str): Path to the JSON file.
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    run = {'created': datetime.datetime.now().isoformat(timespec='seconds'), 'commit': get_git_commit(),
+           'python': platform.python_version(), 'platform': platform.platform(),
+           'pandas': pd.__version__, 'numpy': np.__version__, 'results': records}
+    with open(path, 'w') as file:
+        json.dump(run, file, indent=2)
+
+
+def main():
+    """
+    Runs the benchmarks, prints the results and saves them to a JSON file.
+    """
+    parser = argparse.ArgumentParser(description="Benchmark fetch and analysis on fake exchanges.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=BENCHMARK_SIZES,
+                        help="numbers of pairs for the analysis and file round trip benchmarks")
+    parser.add_argument('--fetch-sizes', type=int, nargs='+', default=BENCHMARK_SIZES,
+                        help="numbers of pairs per exchange for the fetch_and_save_data benchmark")
+    parser.add_argument('--output', default=None,
+                        help="path to the JSON results file, by default benchmarks/benchmark_<time>.json "
+                             "inside the data directory")
+    args = parser.parse_args()
+
+    result = benchmark_fetch_modes()
+    print(f"- Fetch modes at {result['rate_limit']} ms between requests: "
+          f"sync {result['sync_seconds']}s ({result['sync_requests']} requests), "
+          f"async {result['async_seconds']}s ({result['async_requests']} requests), speedup x{result['speedup']}")
+
+    startup = benchmark_startup()
+    print("- Startup: " + ', '.join(f"{command} {result['seconds']}s ({result['rss_mb']} MB"
+                                    f"{', ccxt' if result['ccxt'] else ''})" for command, result in startup.items()))
+
+    records = run_benchmark_suite(args.sizes, args.fetch_sizes)
+    for record in records:
+        print(f"-- {record['benchmark']} ({record['pairs']} pairs): "
+              + ', '.join(f"{key} {value}" for key, value in record.items() if key not in ('benchmark', 'pairs')))
+
+    path = args.output or f"{CONFIG['directory']}/benchmarks/benchmark_{datetime.datetime.now():%Y%m%d_%H%M%S}.json"
+    startup_records = [{'benchmark': f"startup_{command}", **result} for command, result in startup.items()]
+    save_benchmark_results(startup_records + records, path)
+    print(f"- Benchmark results saved to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+import os
+import sqlite3
+
+from config import CONFIG
+
+
+def open_candle_store(path=None):
+    """
+    Opens the local candle store, creating it if needed.
+
+    Candles are kept in an SQLite database, one row per exchange, symbol, timeframe and candle timestamp.
+    Every thread must open its own connection.
+
+    Args:
+        path (str, optional): Path to the database file. Defaults to candle_store_file in the data directory.
+
+    Returns:
+        sqlite3.Connection: Connection to the candle store.
+    """
+    path = path or f"{CONFIG['directory']}/{CONFIG['candle_store_file']}"
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    connection = sqlite3.connect(path, timeout=30)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS candles (
+            exchange TEXT NOT NULL,
+            symbol TEXT NOT NULL,
+            timeframe TEXT NOT NULL,
+            timestamp INTEGER NOT NULL,
+            open REAL, high REAL, low REAL, close REAL, volume REAL,
+            PRIMARY KEY (exchange, symbol, timeframe, timestamp)
+        ) WITHOUT ROWID""")
+    return connection
+
+
+def get_fetch_start(connection, exchange_id, symbol, timeframe, start_ms):
+    """
+    Returns the timestamp from which candles have to be fetched to bring the store up to date.
+
+    The last stored candle is fetched again because it may have been incomplete when it was saved.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the candle store.
+        exchange_id (str): Exchange id.
+        symbol (str): Trading pair symbol.
+        timeframe (str): Candle timeframe, e.g. '1d'.
+        start_ms (int): Start of the required period in milliseconds.
+
+    Returns:
+        int: Timestamp in milliseconds.
+    """
+    row = connection.execute(
+        "SELECT MAX(timestamp) FROM candles WHERE exchange = ? AND symbol = ? AND timeframe = ?",
+        (exchange_id, symbol, timeframe)).fetchone()
+    last_timestamp = row[0]
+    if last_timestamp is None:
+        return start_ms
+    return max(start_ms, last_timestamp)
+
+
+def save_candles(connection, exchange_id, symbol, timeframe, candles):
+    """
+    Saves candles to the store, replacing stored candles with the same timestamp.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the candle store.
+        exchange_id (str): Exchange id.
+        symbol (str): Trading pair symbol.
+        timeframe (str): Candle timeframe, e.g. '1d'.
+        candles (list): List of candles in the ccxt format [timestamp, open, high, low, close, volume].
+    """
+    if not candles:
+        return
+    with connection:
+        connection.executemany(
+            "INSERT OR REPLACE INTO candles VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(exchange_id, symbol, timeframe, *candle[:6]) for candle in candles])
+
+
+def load_candles(connection, exchange_id, symbol, timeframe, start_ms, end_ms):
+    """
+    Loads stored candles of the period [start_ms, end_ms).
+
+    Args:
+        connection (sqlite3.Connection): Connection to the candle store.
+        exchange_id (str): Exchange id.
+        symbol (str): Trading pair symbol.
+        timeframe (str): Candle timeframe, e.g. '1d'.
+        start_ms (int): Start of the period in milliseconds.
+        end_ms (int): End of the period in milliseconds.
+
+    Returns:
+        list: List of candles in the ccxt format [timestamp, open, high, low, close, volume].
+    """
+    rows = connection.execute(
+        "SELECT timestamp, open, high, low, close, volume FROM candles "
+        "WHERE exchange = ? AND symbol = ? AND timeframe = ? AND timestamp >= ? AND timestamp < ? "
+        "ORDER BY timestamp",
+        (exchange_id, symbol, timeframe, start_ms, end_ms)).fetchall()
+    return [list(row) for row in rows]
@@ -0,0 +1,117 @@
+import json
+import os
+import threading
+
+# Checkpoint log of the current fetch run: path, open file and the rows read back on resume,
+# keyed by (exchange, endpoint) and pair. None while no fetch run is checkpointed
+checkpoint = None
+checkpoint_lock = threading.Lock()
+
+
+def get_checkpoint_path(directory_data):
+    """
+    Returns the path to the checkpoint log of a snapshot.
+
+    Args:
+        directory_data (str): Data directory of the snapshot.
+
+    Returns:
+        str: Path to the log file, next to the data directory.
+    """
+    return f"{os.path.dirname(directory_data)}/fetch_checkpoint.jsonl"
+
+
+def start_checkpoint_log(directory_data, resume=False):
+    """
+    Starts checkpointing a fetch run. Every row fetched for a pair is appended to the log as soon as it arrives,
+    one JSON line per exchange, endpoint and pair.
+
+    With resume, the rows of the log left by an interrupted run are read back and kept, so the fetch functions
+    use them instead of requesting the pairs again. Otherwise the log is started empty.
+
+    Args:
+        directory_data (str): Data directory of the snapshot.
+        resume (bool): Whether to continue the log of a previous run.
+
+    Returns:
+        int: Number of rows read back from the log.
+    """
+    global checkpoint
+    path = get_checkpoint_path(directory_data)
+    rows = {}
+    if resume and os.path.exists(path):
+        rows = read_checkpoint_log(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with checkpoint_lock:
+        checkpoint = {'path': path, 'file': open(path, 'a' if resume else 'w'), 'rows': rows}
+    return sum(len(pair_rows) for pair_rows in rows.values())
+
+
+def read_checkpoint_log(path):
+    """
+    Reads the rows of a checkpoint log. A last line cut off by a crash is skipped.
+
+    Args:
+        path (str): Path to the log file.
+
+    Returns:
+        dict: Rows keyed by (exchange, endpoint) and pair. A later row of a pair replaces an earlier one.
+    """
+    rows = {}
+    with open(path) as file:
+        for line in file:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            rows.setdefault((entry['exchange'], entry['endpoint']), {})[entry['pair']] = entry['row']
+    return rows
+
+
+def get_checkpointed_rows(exchange_id, endpoint):
+    """
+    Returns the rows of an exchange and endpoint already in the checkpoint log.
+
+    Args:
+        exchange_id (str): Exchange id.
+        endpoint (str): Endpoint, e.g. 'rates', 'history', 'amplitude' or 'spot_pairs'.
+
+    Returns:
+        dict: Rows keyed by pair. Empty if no fetch run is checkpointed.
+    """
+    with checkpoint_lock:
+        if checkpoint is None:
+            return {}
+        return dict(checkpoint['rows'].get((exchange_id, endpoint), {}))
+
+
+def save_checkpoint_rows(exchange_id, endpoint, rows):
+    """
+    Appends fetched rows to the checkpoint log. Nothing is written if no fetch run is checkpointed.
+
+    Lines are flushed right away, so they survive a crash of the process.
+
+    Args:
+        exchange_id (str): Exchange id.
+        endpoint (str): Endpoint of the rows.
+        rows (list): Row dicts with the pair under 'pair'.
+    """
+    with checkpoint_lock:
+        if checkpoint is None:
+            return
+        for row in rows:
+            entry = {'exchange': exchange_id, 'endpoint': endpoint, 'pair': row['pair'], 'row': row}
+            # Numpy scalars, e.g. amplitudes, are written as Python numbers
+            checkpoint['file'].write(json.dumps(entry, default=lambda value: value.tolist()) + '\n')
+        checkpoint['file'].flush()
+
+
+def stop_checkpoint_log():
+    """
+    Stops checkpointing and closes the log. The log is kept, so missing pairs can still be fetched with resume.
+    """
+    global checkpoint
+    with checkpoint_lock:
+        if checkpoint is not None:
+            checkpoint['file'].close()
+            checkpoint = None
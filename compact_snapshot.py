@@ -0,0 +1,173 @@
+import sys
+
+import numpy as np
+import pandas as pd
+from config import CONFIG
+from funding_history import create_rate_history_from_lists
+from instrument_registry import get_symbol_dtype
+
+# Columns kept as float32 and the decimals they are rounded to when converted back to float64.
+# Rates and amplitudes are fetched with 3 and 2 decimals, so they are restored exactly
+FLOAT32_COLUMNS = {'rate': 6, 'mean_daily_amplitude': 4, 'max_daily_amplitude': 4, 'amplitude_days': 0}
+INT32_COLUMNS = ['instrument_id', 'spot_id', 'multiplier']
+HISTORY_COLUMNS = ['historical_rates']
+# Estimated size of one opportunity row of the analysis results, used to split the analysis within the budget
+BYTES_PER_OPPORTUNITY = 400
+
+
+def compact_perpetual_data_df(df):
+    """
+    Converts a prepared dataframe of funding rates of one exchange to a compact layout.
+
+    The pair column becomes categorical with the instrument id as code and the categories shared by all
+    exchanges (see get_symbol_dtype). Rates and amplitudes become float32 and instrument ids int32.
+    The historical rates of all pairs are copied into one numeric buffer, and every cell of the
+    historical_rates column becomes a view of its slice instead of a list of Python floats.
+
+    Args:
+        df (pd.DataFrame): Dataframe prepared by prepare_perpetual_data_df.
+
+    Returns:
+        pd.DataFrame: Compact dataframe with the same columns.
+    """
+    columns = {'pair': pd.Categorical.from_codes(df['instrument_id'], dtype=get_symbol_dtype())}
+    for column in FLOAT32_COLUMNS:
+        if column in df:
+            columns[column] = df[column].astype(np.float32)
+    for column in INT32_COLUMNS:
+        if column in df:
+            columns[column] = df[column].astype(np.int32)
+    for column in HISTORY_COLUMNS:
+        if column in df:
+            columns[column] = compact_history_column(df[column])
+    return df.assign(**columns)
+
+
+def compact_history_column(historical_rates):
+    """
+    Copies a column of historical rates into one buffer with a view of it per row.
+
+    The buffer stays float64, so the rates are exact. Most of the saving comes from replacing
+    a Python float object per rate with 8 bytes in the buffer.
+
+    Args:
+        historical_rates (pd.Series): Column of historical rates as lists or arrays (see parse_historical_rates).
+
+    Returns:
+        pd.Series: Column of array views with the index of the input.
+    """
+    history = create_rate_history_from_lists(historical_rates)
+    buffer, offsets = history['values'], history['offsets']
+    views = np.empty(len(historical_rates), dtype=object)
+    # Assigned one by one, numpy would turn views of equal length into a 2D array
+    for index, (start, end) in enumerate(zip(offsets[:-1], offsets[1:])):
+        views[index] = buffer[start:end]
+    return pd.Series(views, index=historical_rates.index, dtype=object)
+
+
+def expand_compact_df(df):
+    """
+    Converts the float32 columns of a compact dataframe back to float64, rounded to the decimals they
+    were stored with, so calculations and results are the same as with the full layout.
+
+    Args:
+        df (pd.DataFrame): Compact or full dataframe.
+
+    Returns:
+        pd.DataFrame: Dataframe with float64 rates and amplitudes.
+    """
+    columns = {column: df[column].astype(np.float64).round(decimals=decimals)
+               for column, decimals in FLOAT32_COLUMNS.items()
+               if column in df and df[column].dtype == np.float32}
+    return df.assign(**columns) if columns else df
+
+
+def get_df_memory_bytes(df, counted=None):
+    """
+    Returns the memory used by a dataframe, including the contents of list and array cells.
+
+    Array views that share a buffer count the buffer once. Lists count a Python float per item.
+    Categories shared with dataframes measured before, e.g. of other exchanges, are not counted again.
+
+    Args:
+        df (pd.DataFrame): Dataframe.
+        counted (set, optional): Ids of categories already counted. Updated with the categories of df.
+
+    Returns:
+        int: Number of bytes.
+    """
+    counted = set() if counted is None else counted
+    total = int(df.index.memory_usage())
+    buffers = {}
+    for column in df.columns:
+        values = df[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            total += values.cat.codes.values.nbytes
+            if id(values.cat.categories) not in counted:
+                counted.add(id(values.cat.categories))
+                total += int(values.cat.categories.memory_usage(deep=True))
+        elif values.dtype != object or values.empty:
+            total += int(values.memory_usage(index=False))
+        else:
+            total += int(values.memory_usage(index=False, deep=True))
+            if isinstance(values.iloc[0], list):
+                total += sum(map(len, values)) * sys.getsizeof(0.0)
+            elif isinstance(values.iloc[0], np.ndarray):
+                # The size of an array view does not include the buffer it shares
+                buffers.update((id(value.base), value.base.nbytes) for value in values if value.base is not None)
+    return total + sum(buffers.values())
+
+
+def get_memory_report(perpetual_data_df):
+    """
+    Returns the memory used by the loaded funding rates of every exchange.
+
+    Args:
+        perpetual_data_df (dict): Dictionary with exchange names as keys and dataframes as values.
+
+    Returns:
+        dict: Number of rows and bytes of every exchange under 'exchanges', and the total bytes under 'total_bytes'.
+    """
+    counted = set()
+    exchanges = {exchange: {'rows': len(df), 'bytes': get_df_memory_bytes(df, counted)}
+                 for exchange, df in perpetual_data_df.items()}
+    return {'exchanges': exchanges, 'total_bytes': sum(report['bytes'] for report in exchanges.values())}
+
+
+def print_memory_report(report):
+    """
+    Prints the memory report and warns if the loaded data alone exceeds the memory budget.
+
+    Args:
+        report (dict): Report returned by get_memory_report.
+    """
+    details = ', '.join(f"{exchange}: {exchange_report['rows']} pairs, {exchange_report['bytes'] / 2 ** 20:.1f} MB"
+                        for exchange, exchange_report in report['exchanges'].items())
+    print(f"Memory of loaded data: {report['total_bytes'] / 2 ** 20:.1f} MB ({details})")
+    budget = CONFIG['memory_budget_mb']
+    if budget and report['total_bytes'] > budget * 2 ** 20:
+        print(f"Warning: Loaded data exceeds the memory budget of {budget} MB")
+
+
+def get_budget_chunk_pairs(perpetual_data_df, chunk_pairs):
+    """
+    Returns the number of pairs the matrix engine may compare at once within the memory budget.
+
+    The budget left after the loaded data is divided by the estimated working set of one pair:
+    the exchange x exchange comparison and the opportunity rows it may produce.
+
+    Args:
+        perpetual_data_df (dict): Dictionary with exchange names as keys and dataframes as values.
+        chunk_pairs (int): Number of pairs per chunk without a budget, None for all pairs.
+
+    Returns:
+        int: Number of pairs per chunk, None for all pairs.
+    """
+    budget = CONFIG['memory_budget_mb']
+    if not budget:
+        return chunk_pairs
+    exchanges = len(perpetual_data_df)
+    bytes_per_pair = exchanges * exchanges * 10 + exchanges * (exchanges - 1) // 2 * BYTES_PER_OPPORTUNITY
+    free_bytes = budget * 2 ** 20 - get_memory_report(perpetual_data_df)['total_bytes']
+    budget_pairs = max(int(free_bytes // bytes_per_pair), 100)
+    return min(chunk_pairs, budget_pairs) if chunk_pairs else budget_pairs
@@ -9,14 +9,96 @@ CONFIG = {
     # Specify exchange IDs according to the CCXT library format.
     # For a list of supported exchange IDs, refer to: https://docs.ccxt.com/#/?id=exchanges
 
+    'spot_exchanges_required': [],
+    # Spot exchanges that must all list the spot pair of a Spot-Perpetual opportunity, e.g. the ones you hold
+    # balances on. Empty list keeps pairs listed on any of the spot exchanges above
+
     'fetch_and_save_data': True,
     # Whether the script should fetch funding rates from exchanges and save them to files
     # You can fetch the data first and then change this option to False and analyze the data
 
+    'fetch_resume': False,
+    # Whether to continue an interrupted fetch of the same subdirectory instead of starting over.
+    # Every fetched pair is appended to fetch_checkpoint.jsonl in the subdirectory as it arrives (the work queue
+    # in 'sharded' fetch mode), and pairs found there are not fetched again. Also set by the --resume option
+
     'analyze_data_from_files': True,
     # Whether the script should analyze previously saved data from files.
     # Specify directory and subdirectory where files are located below.
 
+    'daemon_mode': False,
+    # Whether to run the scanner continuously instead of fetching and analyzing once.
+    # Exchanges and markets are loaded once, data is refreshed on the schedules below
+    # and the opportunities are updated in memory after every refresh
+
+    'daemon_refresh_intervals': {'rates': 60, 'history': 3600, 'amplitude': 6 * 3600},
+    # Maximum number of seconds between refreshes of current rates, historical rates and daily amplitudes
+    # in daemon mode
+
+    'daemon_funding_lead_seconds': 60,
+    # In daemon mode, current rates are also refreshed this many seconds before the next funding time of an exchange
+
+    'daemon_funding_delay_seconds': 30,
+    # In daemon mode, current and historical rates are also refreshed this many seconds after the funding time
+
+    'funding_rate_source': 'rest',
+    # Where the daemon takes current funding rates from. Define 'rest' or 'stream'
+    # 'rest' fetches them on the daemon_refresh_intervals schedule.
+    # 'stream' keeps a latest-rate table per exchange up to date from websocket streams (ccxt.pro watchFundingRates
+    # or watchFundingRate). Exchanges without them are polled over REST every stream_rest_poll_seconds.
+    # No ccxt.pro exchange of the pinned ccxt 4.2.10 has them yet, so with it every real exchange is polled over REST
+
+    'stream_refresh_seconds': 10,
+    # How often the daemon reads the latest-rate tables and runs the analysis when funding_rate_source is 'stream'
+
+    'stream_rest_poll_seconds': 60,
+    # Interval of REST polling for exchanges whose funding rates can not be streamed
+
+    'stream_max_reconnects': 10,
+    # Number of reconnects in a row after which a websocket stream is given up and the exchange is polled over REST
+
+    'daemon_save_results': True,
+    # Whether the daemon saves the results to files after every analysis.
+    # The files are saved in the directory/daemon_subdirectory/result folder
+
+    'daemon_subdirectory': 'daemon',
+    # Subdirectory within the main directory for the daemon results
+
+    'api_server': False,
+    # Whether the daemon serves the latest opportunities over a local HTTP API (see results_api.py).
+    # GET /results lists the results, GET /results/<name>?pair=&exchange=&side=&limit= returns the best matching
+    # opportunities. Responses carry an ETag, so clients polling with If-None-Match get 304 until the next analysis
+
+    'api_host': '127.0.0.1',
+    'api_port': 8000,
+    # Address the API server listens on
+
+    'api_default_limit': 100,
+    # Number of opportunities returned by a result query without a limit parameter. None returns all of them
+
+    'backtest_mode': False,
+    # Whether to backtest the opportunities of saved snapshots instead of fetching and analyzing once.
+    # Every snapshot subdirectory of the main directory is analyzed, its best opportunities are entered at the time
+    # of the snapshot, and their realized funding is read from the funding history store (funding_history_store)
+
+    'backtest_start': None,
+    'backtest_end': None,
+    # First and last snapshot subdirectory to backtest, e.g. '20240501_01' and '20240531_99'.
+    # Subdirectories are compared by name. None means no limit
+
+    'backtest_top_n': 10,
+    # Number of best opportunities of every result entered per snapshot
+
+    'backtest_holding_hours': [8, 24, 72],
+    # Holding periods in hours over which the realized funding of every entered opportunity is scored.
+    # Periods that end after the last stored funding rate of an exchange are not scored
+
+    'backtest_workers': None,
+    # Number of worker processes analyzing snapshots at the same time. None means the number of CPU cores
+
+    'backtest_subdirectory': 'backtest',
+    # Subdirectory within the main directory for the backtest trades and hit-rate and PnL tables
+
     'directory': 'funding_data',
     # Directory where the current funding rates should be saved
 
@@ -24,7 +106,105 @@ CONFIG = {
     # Subdirectory within the main directory to save the current funding rates data.
 
     'file_format': 'xlsx',
-    # The file format for saving and importing files. Define 'csv' or 'xlsx'
+    # The file format of the analysis results. Define 'csv', 'xlsx' or 'parquet'
+
+    'snapshot_format': 'parquet',
+    # The file format for saving and importing the fetched data. Define 'parquet', 'csv' or 'xlsx'
+    # Parquet is much faster to write and read and stores historical rates as real lists.
+    # Files of older snapshots saved in another format, e.g. xlsx before this option was added,
+    # are read in the format of their extension
+
+    'parquet_compression': 'zstd',
+    # Compression of Parquet files: 'zstd', 'snappy', 'gzip' or None
+
+    'fetch_mode': 'sync',
+    # How per-pair requests are made. Define 'sync', 'async' or 'sharded'
+    # 'sync' makes one blocking request after another.
+    # 'async' uses the asyncio version of CCXT and keeps several requests in flight at once.
+    # 'sharded' splits the work into units of exchange, endpoint and batch of pairs in a queue file,
+    # which local worker processes and workers on other hosts work through (see the shard_* options below)
+
+    'async_max_in_flight': 20,
+    # Maximum number of simultaneous requests to one exchange in 'async' fetch mode
+
+    'async_endpoint_limits': {'funding_rate': 20, 'funding_rate_history': 10, 'ohlcv': 5, 'order_book': 10},
+    # Maximum number of simultaneous requests per endpoint of one exchange in 'async' fetch mode and while
+    # sampling order books (liquidity_ranking). The exchange-wide async_max_in_flight limit applies on top of these
+
+    'shard_workers': 4,
+    # Number of local worker processes in 'sharded' fetch mode, besides the main process that also takes units.
+    # Workers on other hosts can join with: python fetch_data.py <directory/subdirectory/fetch_queue.sqlite>
+    # Only on a shared filesystem whose file locks work across hosts (e.g. NFSv4 with locking), see README
+
+    'shard_batch_pairs': 50,
+    # Number of pairs per work unit in 'sharded' fetch mode
+
+    'shard_max_leases_per_exchange': 1,
+    # Maximum number of work units of one exchange in progress at the same time in 'sharded' fetch mode.
+    # Every worker paces its own requests, so more than 1 multiplies the request rate to the exchange.
+    # Raise it only for workers on different hosts (IP addresses)
+
+    'shard_lease_seconds': 600,
+    # Time after which a work unit claimed by a worker that has not finished it is given to another worker
+
+    'shard_max_attempts': 3,
+    # Number of attempts after which a failing work unit is given up
+
+    'shard_poll_seconds': 1,
+    # How often idle workers check the queue for units whose lease has expired
+
+    'funding_rates_chunk_size': None,
+    # Maximum number of pairs per request when current funding rates are fetched with the bulk endpoint
+    # (fetchFundingRates). None means all pairs in one request.
+    # Exchanges without the bulk endpoint are requested pair by pair
+
+    'parallel_exchanges': False,
+    # Whether to fetch data from all configured exchanges at the same time, each one in its own thread.
+    # Every exchange has its own rate limit, so the total time is close to the time of the slowest exchange.
+    # An error on one exchange does not stop the others
+
+    'parallel_workers': None,
+    # Maximum number of exchanges fetched at the same time when parallel_exchanges is True.
+    # None means all of them
+
+    'metrics': True,
+    # Whether to record latency, request, retry, error and response size metrics of every exchange endpoint
+    # and the durations of the fetch and analysis stages. They are saved to metrics.json and metrics.prom
+    # (Prometheus textfile format) in the metrics folder at the end of a run, and after every round in daemon mode
+
+    'market_cache': True,
+    # Whether to keep the markets of every exchange in a cache file and reuse them across runs.
+    # Markets of an exchange configured both as perpetual and spot exchange are downloaded once
+
+    'market_cache_ttl_hours': 24,
+    # Age after which cached markets are refreshed. Stale markets are still used while they are
+    # refreshed in a background thread, so only the first run waits for the download
+
+    'market_cache_subdirectory': 'market_cache',
+    # Directory for the market cache files inside directory
+
+    'request_scheduler': True,
+    # Whether requests go through the per-exchange request scheduler (request_scheduler.py).
+    # It paces requests with a token bucket refilled at the exchange rate limit, halves the rate when the
+    # exchange answers with throttling errors and retries network errors with exponential backoff.
+    # If False, the built-in throttling of CCXT is used and failed requests are not retried
+
+    'rate_limit_burst': 10,
+    # Number of request tokens an idle exchange accumulates, i.e. how many requests may be sent at once
+
+    'endpoint_weights': {'markets': 1, 'funding_rate': 1, 'funding_rates': 10, 'funding_rate_history': 1,
+                         'ohlcv': 1, 'order_book': 1, 'order_books': 10},
+    # Number of request tokens each endpoint costs. Endpoints not listed cost 1
+
+    'max_retries_per_request': 5,
+    # Maximum number of retries of one request after network or throttling errors
+
+    'max_retries_per_run': 500,
+    # Maximum number of retries per exchange object over the whole run. Once spent, errors are not retried
+
+    'retry_base_backoff_seconds': 1,
+    'retry_max_backoff_seconds': 30,
+    # Wait before a retry: base * 2 ** attempt seconds, capped at the max, with random jitter
 
     'funding_historical_days': 3,
     # Number of days for historical funding rates that used for calculating average daily rate
@@ -34,9 +214,87 @@ CONFIG = {
     # Amplitude is the percentage difference between the daily high and low, relative to the opening price.
     # Higher amplitudes indicate greater asset volatility.
 
+    'candle_store': True,
+    # Whether to keep daily candles in a local store and fetch only the candles after the last stored one.
+    # Amplitudes are then calculated from the store, so later runs make one small request per pair
+
+    'candle_store_file': 'candles.sqlite',
+    # SQLite file of the candle store inside the directory defined above
+
+    'funding_history_store': True,
+    # Whether to keep funding rate history in a local store, one row per exchange, symbol and funding time.
+    # Only funding rates newer than the stored ones are fetched, and analysis reads APY windows from the store
+
+    'funding_history_store_file': 'funding_history.sqlite',
+    # SQLite file of the funding history store inside the directory defined above
+
+    'funding_history_backfill_days': 30,
+    # Number of days of funding history to download for a pair that is not in the store yet.
+    # It should cover the longest of the apy_horizons_days below
+
+    'apy_horizons_days': [],
+    # Periods in days for which the average APY is calculated from the funding history store, e.g. [1, 3, 7, 30].
+    # Each one adds an APY_<N>d column to the analysis results. The rate volatility, the percentage
+    # of positive fundings and the funding interval are calculated over the longest period and added as well.
+    # Empty list disables these columns, so the results keep the columns of earlier versions
+
     'funding_rate_threshold': 0.01,
     # Minimum funding rate (or rate difference). Data below this threshold will be filtered out
 
+    'perp_perp_engine': 'matrix',
+    # How Perpetual-Perpetual opportunities are found. Define 'matrix' or 'pairwise'
+    # 'matrix' compares all exchanges at once in a pair x exchange rate matrix and scales with many exchanges.
+    # 'pairwise' merges every combination of two exchanges separately
+
+    'perp_perp_best_pair_only': False,
+    # Whether to keep only the best exchange combination (highest rate difference) of every pair
+
+    'perp_perp_chunk_pairs': 10000,
+    # Number of pairs the 'matrix' engine compares at once. Opportunities are collected chunk by chunk,
+    # which bounds the memory of the comparison. None compares all pairs at once
+
+    'spot_perp_chunk_pairs': 10000,
+    # Number of pairs of a perpetual exchange looked up in the spot index at once. Spot-Perpetual opportunities
+    # are collected and streamed chunk by chunk. None takes all pairs of an exchange at once
+
+    'compact_snapshots': True,
+    # Whether loaded funding rates are kept in a compact layout: categorical pairs, float32 rates and amplitudes,
+    # int32 ids, and the historical rates of each exchange in one numeric buffer instead of lists of Python floats.
+    # Calculations convert rates back to float64 rounded to the fetched decimals, so results are unchanged
+
+    'memory_budget_mb': None,
+    # Memory in MB for the loaded funding rates and the analysis. The memory of the loaded data is reported
+    # when it is loaded, and the 'matrix' engine compares fewer pairs at once to stay within the budget.
+    # None disables the budget
+
+    'result_top_k': None,
+    # Number of best opportunities kept in every result, e.g. 50. They are selected without sorting
+    # all opportunities, and only this many rows are kept in memory and saved. None keeps all opportunities
+
+    'result_stream_format': None,
+    # Define 'jsonl' or 'csv' to also stream all opportunities to stream_<result>_* files in the result folder
+    # while they are found, in the order they are found. None disables streaming
+
+    'liquidity_ranking': False,
+    # Whether to sample the order books of the best opportunities of every result and re-rank them by the
+    # expected net yield after the cost of entering and leaving both legs. Needs network access during analysis
+
+    'liquidity_top_n': 20,
+    # Number of best opportunities of every result whose order books are sampled. The opportunities below them
+    # keep their order after the re-ranked ones
+
+    'liquidity_notional': 10000,
+    # Position size of every leg in quote currency (e.g. USDT) used to walk the order books
+
+    'liquidity_order_book_limit': 50,
+    # Number of price levels per side requested for every order book
+
+    'liquidity_holding_days': 7,
+    # Holding period over which the expected funding is weighed against the trading costs
+
+    'liquidity_funding_interval_hours': 8,
+    # Funding interval of pairs whose interval is unknown. Intervals are known with the funding history store
+
     'get_spot_perp_opportunities': True,
     # Whether to analyze opportunities between Spot and Perpetual markets
 
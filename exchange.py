@@ -1,6 +1,10 @@
 import ccxt
 import datetime
 
+from config import CONFIG
+from market_cache import get_trading_pairs
+from request_scheduler import scheduled_call, scheduled_call_async
+
 
 def init_exchange(exchange_name):
     """
@@ -12,13 +16,53 @@ def init_exchange(exchange_name):
     Returns:
         ccxt.Exchange: Initialized exchange object.
     """
-    return getattr(ccxt, exchange_name)()
+    # The request scheduler paces the requests itself, so the built-in throttling of ccxt is turned off
+    return getattr(ccxt, exchange_name)({'enableRateLimit': not CONFIG['request_scheduler']})
+
+
+def init_async_exchange(exchange_name):
+    """
+    Initialize an asyncio exchange object using its name.
+
+    Args:
+        exchange_name (str): Name of the exchange.
+
+    Returns:
+        ccxt.async_support.Exchange: Initialized asyncio exchange object. It must be closed after use.
+    """
+    # ccxt.async_support and ccxt.pro load their own module of every exchange, so they are imported
+    # only by the fetch modes and the daemon that use them
+    import ccxt.async_support as ccxt_async
+
+    return getattr(ccxt_async, exchange_name)({'enableRateLimit': not CONFIG['request_scheduler']})
+
+
+def init_stream_exchange(exchange_name):
+    """
+    Initialize an exchange object that can watch websocket streams using its name.
+
+    Exchanges without websocket support in ccxt.pro get an asyncio exchange object, which only has REST methods.
+
+    Args:
+        exchange_name (str): Name of the exchange.
+
+    Returns:
+        ccxt.pro.Exchange: Initialized exchange object. It must be closed after use.
+    """
+    import ccxt.async_support as ccxt_async
+    import ccxt.pro as ccxt_pro
+
+    module = ccxt_pro if exchange_name in ccxt_pro.exchanges else ccxt_async
+    return getattr(module, exchange_name)({'enableRateLimit': not CONFIG['request_scheduler']})
 
 
 def get_all_trading_pairs(exchange, perpetual=False):
     """
     Fetch all trading pairs for the given exchange.
 
+    Markets are read from the market cache (see market_cache.py), so they are downloaded at most once
+    per market_cache_ttl_hours for all roles of the exchange.
+
     Args:
         exchange (ccxt.Exchange): Exchange object.
         perpetual (bool): Whether to fetch perpetual trading pairs.
@@ -27,10 +71,23 @@ def get_all_trading_pairs(exchange, perpetual=False):
         list: List of trading pairs.
     """
     try:
-        markets = exchange.fetch_markets()
+        return get_trading_pairs(exchange, perpetual)
     except Exception as e:
         print(f"Error fetching pairs for {exchange.name}: {e}")
         return []
+
+
+def filter_trading_pairs(markets, perpetual=False):
+    """
+    Select active spot or perpetual trading pairs from a list of markets.
+
+    Args:
+        markets (list): List of ccxt market structures.
+        perpetual (bool): Whether to select perpetual trading pairs.
+
+    Returns:
+        list: List of trading pairs.
+    """
     if not perpetual:
         trading_pairs = [market['symbol'] for market in markets if 'spot' in market['type'] and market['active']]
     else:
@@ -47,11 +104,149 @@ def get_funding_rate(exchange, pair):
         pair (str): Trading pair symbol.
 
     Returns:
-        float: Current funding rate.
+        dict: Current funding rate in percent under 'rate' and the next funding timestamp under 'next_funding_time'.
+    """
+    market_data = scheduled_call(exchange, 'funding_rate', exchange.fetch_funding_rate, pair)
+    return parse_funding_rate(market_data)
+
+
+async def get_funding_rate_async(exchange, pair):
+    """
+    Asyncio version of get_funding_rate.
+
+    Args:
+        exchange (ccxt.async_support.Exchange): Asyncio exchange object.
+        pair (str): Trading pair symbol.
+
+    Returns:
+        dict: Current funding rate in percent under 'rate' and the next funding timestamp under 'next_funding_time'.
+    """
+    market_data = await scheduled_call_async(exchange, 'funding_rate', exchange.fetch_funding_rate, pair)
+    return parse_funding_rate(market_data)
+
+
+def parse_funding_rate(market_data):
+    """
+    Extract the funding rate and the next funding time from a ccxt funding rate structure.
+
+    Args:
+        market_data (dict): Funding rate structure.
+
+    Returns:
+        dict: Current funding rate in percent under 'rate' and the next funding timestamp
+            in milliseconds under 'next_funding_time'. The timestamp is None if the exchange does not report it.
+    """
+    return {'rate': round(market_data['fundingRate'] * 100, 3),
+            'next_funding_time': market_data.get('fundingTimestamp') or market_data.get('nextFundingTimestamp')}
+
+
+def has_bulk_funding_rates(exchange):
+    """
+    Check whether the exchange can return funding rates of many trading pairs in one request.
+
+    Args:
+        exchange (ccxt.Exchange): Exchange object.
+
+    Returns:
+        bool: True if the exchange supports fetchFundingRates.
+    """
+    return bool(exchange.has.get('fetchFundingRates'))
+
+
+def get_funding_rate_stream_method(exchange):
+    """
+    Check how the exchange can push funding rate updates over websocket.
+
+    Args:
+        exchange (ccxt.pro.Exchange): Exchange object.
+
+    Returns:
+        str: 'watchFundingRates' for one stream of many pairs, 'watchFundingRate' for one stream per pair,
+            or None if funding rates have to be polled over REST.
+    """
+    for method in ('watchFundingRates', 'watchFundingRate'):
+        if exchange.has.get(method):
+            return method
+    return None
+
+
+async def watch_funding_rates(exchange, pairs):
+    """
+    Wait for the next funding rate updates of several trading pairs from the websocket stream.
+
+    Args:
+        exchange (ccxt.pro.Exchange): Exchange object that supports watchFundingRates.
+        pairs (list): List of trading pair symbols.
+
+    Returns:
+        dict: Updated funding rates and next funding times (see parse_funding_rate) keyed by trading pair symbol.
+    """
+    market_data = await exchange.watch_funding_rates(pairs)
+    return {pair: parse_funding_rate(data) for pair, data in market_data.items()
+            if data.get('fundingRate') is not None}
+
+
+async def watch_funding_rate(exchange, pair):
+    """
+    Wait for the next funding rate update of a trading pair from the websocket stream.
+
+    Args:
+        exchange (ccxt.pro.Exchange): Exchange object that supports watchFundingRate.
+        pair (str): Trading pair symbol.
+
+    Returns:
+        dict: Current funding rate in percent under 'rate' and the next funding timestamp under 'next_funding_time'.
+    """
+    market_data = await exchange.watch_funding_rate(pair)
+    return parse_funding_rate(market_data)
+
+
+def get_funding_rates(exchange, pairs):
+    """
+    Fetch the current funding rates for several trading pairs with one request.
+
+    Args:
+        exchange (ccxt.Exchange): Exchange object.
+        pairs (list): List of trading pair symbols.
+
+    Returns:
+        dict: Current funding rates and next funding times (see parse_funding_rate) keyed by trading pair symbol.
+    """
+    market_data = scheduled_call(exchange, 'funding_rates', exchange.fetch_funding_rates, pairs)
+    return parse_funding_rates(market_data, pairs)
+
+
+async def get_funding_rates_async(exchange, pairs):
+    """
+    Asyncio version of get_funding_rates.
+
+    Args:
+        exchange (ccxt.async_support.Exchange): Asyncio exchange object.
+        pairs (list): List of trading pair symbols.
+
+    Returns:
+        dict: Current funding rates and next funding times (see parse_funding_rate) keyed by trading pair symbol.
     """
-    market_data = exchange.fetch_funding_rate(pair)
-    current_rate = round(market_data['fundingRate'] * 100, 3)
-    return current_rate
+    market_data = await scheduled_call_async(exchange, 'funding_rates', exchange.fetch_funding_rates, pairs)
+    return parse_funding_rates(market_data, pairs)
+
+
+def parse_funding_rates(market_data, pairs):
+    """
+    Extract funding rates of the requested pairs from a fetchFundingRates response.
+
+    Args:
+        market_data (dict): Funding rate structures keyed by trading pair symbol.
+        pairs (list): List of requested trading pair symbols.
+
+    Returns:
+        dict: Current funding rates and next funding times (see parse_funding_rate) keyed by trading pair symbol.
+    """
+    rates = {}
+    for pair in pairs:
+        if market_data.get(pair, {}).get('fundingRate') is not None:
+            rates[pair] = parse_funding_rate(market_data[pair])
+    return rates
 
 
 def get_historical_funding_rates(exchange, pair, hours=24):
@@ -66,21 +261,103 @@ def get_historical_funding_rates(exchange, pair, hours=24):
     Returns:
         list: List of historical funding rates.
     """
-    current_time_ms = int(datetime.datetime.now().timestamp() * 1000)
-    hours_in_ms = hours * 60 * 60 * 1000
-    since = current_time_ms - hours_in_ms
-    market_data = exchange.fetch_funding_rate_history(pair, since=since, limit=100)
+    since = get_since_ms(hours)
+    market_data = scheduled_call(exchange, 'funding_rate_history', exchange.fetch_funding_rate_history,
+                                 pair, since=since, limit=100)
     historical_rates = [round(100 * rate['fundingRate'], 3) for rate in market_data]
     return historical_rates
 
 
+async def get_historical_funding_rates_async(exchange, pair, hours=24):
+    """
+    Asyncio version of get_historical_funding_rates.
+
+    Args:
+        exchange (ccxt.async_support.Exchange): Asyncio exchange object.
+        pair (str): Trading pair symbol.
+        hours (int): Number of hours of historical data to fetch. Default is 24 hours.
+
+    Returns:
+        list: List of historical funding rates.
+    """
+    since = get_since_ms(hours)
+    market_data = await scheduled_call_async(exchange, 'funding_rate_history', exchange.fetch_funding_rate_history,
+                                             pair, since=since, limit=100)
+    historical_rates = [round(100 * rate['fundingRate'], 3) for rate in market_data]
+    return historical_rates
+
+
+def get_funding_rate_history(exchange, pair, since, limit=100):
+    """
+    Fetch all funding rates of a trading pair after a timestamp, page by page.
+
+    Args:
+        exchange (ccxt.Exchange): Exchange object.
+        pair (str): Trading pair symbol.
+        since (int): Timestamp in milliseconds of the earliest funding rate to fetch.
+        limit (int): Maximum number of funding rates per request. Default is 100.
+
+    Returns:
+        list: List of (timestamp, funding rate) tuples.
+    """
+    history = []
+    while True:
+        market_data = scheduled_call(exchange, 'funding_rate_history', exchange.fetch_funding_rate_history,
+                                     pair, since=since, limit=limit)
+        history.extend((rate['timestamp'], rate['fundingRate']) for rate in market_data if rate['timestamp'] >= since)
+        # Stop if the page is not full or the exchange ignores since and keeps returning the same page
+        if len(market_data) < limit or market_data[-1]['timestamp'] < since:
+            break
+        since = market_data[-1]['timestamp'] + 1
+    return history
+
+
+async def get_funding_rate_history_async(exchange, pair, since, limit=100):
+    """
+    Asyncio version of get_funding_rate_history.
+
+    Args:
+        exchange (ccxt.async_support.Exchange): Asyncio exchange object.
+        pair (str): Trading pair symbol.
+        since (int): Timestamp in milliseconds of the earliest funding rate to fetch.
+        limit (int): Maximum number of funding rates per request. Default is 100.
+
+    Returns:
+        list: List of (timestamp, funding rate) tuples.
+    """
+    history = []
+    while True:
+        market_data = await scheduled_call_async(exchange, 'funding_rate_history',
+                                                 exchange.fetch_funding_rate_history, pair, since=since, limit=limit)
+        history.extend((rate['timestamp'], rate['fundingRate']) for rate in market_data if rate['timestamp'] >= since)
+        if len(market_data) < limit or market_data[-1]['timestamp'] < since:
+            break
+        since = market_data[-1]['timestamp'] + 1
+    return history
+
+
+def get_since_ms(hours):
+    """
+    Calculate the timestamp in milliseconds of the moment N hours ago.
+
+    Args:
+        hours (int): Number of hours back from now.
+
+    Returns:
+        int: Timestamp in milliseconds.
+    """
+    current_time_ms = int(datetime.datetime.now().timestamp() * 1000)
+    hours_in_ms = hours * 60 * 60 * 1000
+    return current_time_ms - hours_in_ms
+
+
 def get_ohlc(exchange, trading_pair, start_date_ms, end_date_ms, timeframe='1m', limit=1000):
     """Fetch OHLC data for a specific symbol and timeframe."""
 
     all_candles = []
     since = start_date_ms
     while True:
-        ohlc = exchange.fetch_ohlcv(trading_pair, timeframe, since, limit)
+        ohlc = scheduled_call(exchange, 'ohlcv', exchange.fetch_ohlcv, trading_pair, timeframe, since, limit)
         if not ohlc:
             break
         # Check if the last candle's timestamp exceeds end_date_ms
@@ -90,5 +367,73 @@ def get_ohlc(exchange, trading_pair, start_date_ms, end_date_ms, timeframe='1m',
             all_candles.extend(candles_within_range)
             break  # Exit the loop since we have included the candles within the range
         all_candles.extend(ohlc)
+        # Stop if the last candle is the current one, there is nothing after it yet
+        if ohlc[-1][0] + exchange.parse_timeframe(timeframe) * 1000 > end_date_ms:
+            break
         since = ohlc[-1][0] + 1  # Start from the next millisecond after the last fetched candle
     return all_candles
+
+
+async def get_ohlc_async(exchange, trading_pair, start_date_ms, end_date_ms, timeframe='1m', limit=1000):
+    """Asyncio version of get_ohlc. Pages are fetched sequentially as each one depends on the previous."""
+
+    all_candles = []
+    since = start_date_ms
+    while True:
+        ohlc = await scheduled_call_async(exchange, 'ohlcv', exchange.fetch_ohlcv,
+                                          trading_pair, timeframe, since, limit)
+        if not ohlc:
+            break
+        if ohlc[-1][0] > end_date_ms:
+            candles_within_range = [candle for candle in ohlc if start_date_ms <= candle[0] < end_date_ms]
+            all_candles.extend(candles_within_range)
+            break
+        all_candles.extend(ohlc)
+        if ohlc[-1][0] + exchange.parse_timeframe(timeframe) * 1000 > end_date_ms:
+            break
+        since = ohlc[-1][0] + 1
+    return all_candles
+
+
+def has_bulk_order_books(exchange):
+    """
+    Check whether the exchange can return order books of many trading pairs in one request.
+
+    Args:
+        exchange (ccxt.Exchange): Exchange object.
+
+    Returns:
+        bool: True if the exchange supports fetchOrderBooks.
+    """
+    return bool(exchange.has.get('fetchOrderBooks'))
+
+
+async def get_order_book_async(exchange, pair, limit=None):
+    """
+    Fetch the order book of a trading pair.
+
+    Args:
+        exchange (ccxt.async_support.Exchange): Asyncio exchange object.
+        pair (str): Trading pair symbol.
+        limit (int, optional): Number of price levels per side.
+
+    Returns:
+        dict: Bids and asks as [price, amount] lists under 'bids' and 'asks', best first.
+    """
+    return await scheduled_call_async(exchange, 'order_book', exchange.fetch_order_book, pair, limit)
+
+
+async def get_order_books_async(exchange, pairs, limit=None):
+    """
+    Fetch the order books of several trading pairs in one request.
+
+    Args:
+        exchange (ccxt.async_support.Exchange): Asyncio exchange object that supports fetchOrderBooks.
+        pairs (list): List of trading pair symbols.
+        limit (int, optional): Number of price levels per side.
+
+    Returns:
+        dict: Order books (see get_order_book_async) of the requested pairs keyed by trading pair symbol.
+    """
+    order_books = await scheduled_call_async(exchange, 'order_books', exchange.fetch_order_books, pairs, limit)
+    return {pair: order_books[pair] for pair in pairs if pair in order_books}
@@ -0,0 +1,277 @@
+import asyncio
+import collections
+import datetime
+import json
+import random
+import time
+import zlib
+
+import ccxt
+
+FUNDING_INTERVAL_MS = 8 * 60 * 60 * 1000
+TIMEFRAME_MS = {'1m': 60 * 1000, '1h': 60 * 60 * 1000, '1d': 24 * 60 * 60 * 1000}
+
+
+class FakeExchange:
+    """
+    Offline stand-in for a ccxt exchange.
+
+    It implements the subset of the ccxt unified API used by this project and answers every request
+    with deterministic synthetic data after a simulated network latency. Use it to measure the
+    fetch pipeline without network access.
+
+    Args:
+        exchange_id (str): Exchange id reported by the object.
+        markets (int): Number of swap markets to generate. The same number of spot markets is generated.
+        latency (float): Simulated round trip time of every request in seconds.
+        bulk_funding_rates (bool): Whether the exchange supports fetchFundingRates.
+        rate_limit (int): Advertised milliseconds between requests, like ccxt's rateLimit.
+        max_requests_per_second (int, optional): Requests allowed in any one-second window. Requests above it
+            fail with ccxt.RateLimitExceeded. None means no throttling.
+        error_rate (float): Share of requests that fail with ccxt.NetworkError.
+        bulk_order_books (bool): Whether the exchange supports fetchOrderBooks.
+    """
+
+    def __init__(self, exchange_id='fake', markets=500, latency=0.05, bulk_funding_rates=True, rate_limit=50,
+                 max_requests_per_second=None, error_rate=0.0, bulk_order_books=True):
+        self.id = exchange_id
+        self.name = exchange_id.capitalize()
+        self.latency = latency
+        self.rateLimit = rate_limit
+        self.max_requests_per_second = max_requests_per_second
+        self.error_rate = error_rate
+        self.request_count = 0
+        self.throttled_count = 0
+        self.error_count = 0
+        self._request_times = collections.deque()
+        self._errors = random.Random(zlib.crc32(exchange_id.encode()))
+        self.has = {'fetchFundingRate': True, 'fetchFundingRates': bulk_funding_rates,
+                    'fetchFundingRateHistory': True, 'fetchOHLCV': True, 'fetchOrderBook': True,
+                    'fetchOrderBooks': bulk_order_books}
+        self.symbols = [f"COIN{index}/USDT" for index in range(markets)]
+        self.markets = None
+
+    def _markets(self):
+        markets = []
+        for symbol in self.symbols:
+            base, quote = symbol.split('/')
+            markets.append({'symbol': f"{symbol}:{quote}", 'base': base, 'quote': quote, 'settle': quote,
+                            'type': 'swap', 'active': True, 'contractSize': 1})
+            markets.append({'symbol': symbol, 'base': base, 'quote': quote, 'settle': None,
+                            'type': 'spot', 'active': True, 'contractSize': None})
+        return markets
+
+    def _random(self, symbol, salt=0):
+        return random.Random(zlib.crc32(f"{self.id}:{symbol}:{salt}".encode()))
+
+    def _funding_rate(self, symbol):
+        timestamp = now_ms()
+        return {'symbol': symbol, 'fundingRate': self._random(symbol).uniform(-0.001, 0.001), 'timestamp': timestamp,
+                'fundingTimestamp': timestamp - timestamp % FUNDING_INTERVAL_MS + FUNDING_INTERVAL_MS}
+
+    def _funding_rate_history(self, symbol, since=None, limit=None):
+        end = now_ms()
+        start = since if since is not None else end - 100 * FUNDING_INTERVAL_MS
+        start = start - start % FUNDING_INTERVAL_MS + FUNDING_INTERVAL_MS
+        history = []
+        for timestamp in range(start, end, FUNDING_INTERVAL_MS):
+            rate = self._random(symbol, timestamp).uniform(-0.001, 0.001)
+            history.append({'symbol': symbol, 'fundingRate': rate, 'timestamp': timestamp})
+        return history[:limit] if limit else history
+
+    def _ohlcv(self, symbol, timeframe='1m', since=None, limit=None):
+        step = TIMEFRAME_MS[timeframe]
+        limit = limit or 500
+        end = now_ms()
+        start = since if since is not None else end - limit * step
+        start = start - start % step + (step if start % step else 0)
+        candles = []
+        for timestamp in range(start, end, step):
+            rng = self._random(symbol, timestamp)
+            open_price = rng.uniform(1, 100)
+            high = open_price * (1 + rng.uniform(0, 0.1))
+            low = open_price * (1 - rng.uniform(0, 0.1))
+            candles.append([timestamp, open_price, high, low, rng.uniform(low, high), rng.uniform(0, 1e6)])
+            if len(candles) == limit:
+                break
+        return candles
+
+    def _order_book(self, symbol, limit=None):
+        rng = self._random(symbol, 'book')
+        mid = rng.uniform(1, 100)
+        spread = mid * rng.uniform(0.0001, 0.005)
+        # Depth per level in quote currency varies by orders of magnitude, so some pairs are illiquid
+        level_notional = 10 ** rng.uniform(2, 6)
+        tick = mid * rng.uniform(0.0001, 0.001)
+        levels = range(limit or 100)
+        return {'symbol': symbol, 'timestamp': now_ms(),
+                'bids': [[mid - spread / 2 - tick * level, level_notional / mid * rng.uniform(0.5, 1.5)]
+                         for level in levels],
+                'asks': [[mid + spread / 2 + tick * level, level_notional / mid * rng.uniform(0.5, 1.5)]
+                         for level in levels]}
+
+    def set_markets(self, markets):
+        self.markets = {market['symbol']: market for market in markets}
+        return self.markets
+
+    @staticmethod
+    def parse_timeframe(timeframe):
+        return TIMEFRAME_MS[timeframe] // 1000
+
+    def _check_request(self):
+        self.request_count += 1
+        now = time.monotonic()
+        if self.max_requests_per_second is not None:
+            while self._request_times and self._request_times[0] <= now - 1:
+                self._request_times.popleft()
+            if len(self._request_times) >= self.max_requests_per_second:
+                self.throttled_count += 1
+                raise ccxt.RateLimitExceeded(f"{self.id} rate limit exceeded")
+            self._request_times.append(now)
+        if self.error_rate and self._errors.random() < self.error_rate:
+            self.error_count += 1
+            raise ccxt.NetworkError(f"{self.id} connection reset")
+
+    def _respond(self, payload):
+        self._check_request()
+        time.sleep(self.latency)
+        return payload
+
+    def fetch_markets(self):
+        return self._respond(self._markets())
+
+    def fetch_funding_rate(self, symbol):
+        return self._respond(self._funding_rate(symbol))
+
+    def fetch_funding_rates(self, symbols=None):
+        symbols = symbols if symbols is not None else self.symbols
+        return self._respond({symbol: self._funding_rate(symbol) for symbol in symbols})
+
+    def fetch_funding_rate_history(self, symbol, since=None, limit=None):
+        return self._respond(self._funding_rate_history(symbol, since, limit))
+
+    def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=None):
+        return self._respond(self._ohlcv(symbol, timeframe, since, limit))
+
+    def fetch_order_book(self, symbol, limit=None):
+        return self._respond(self._order_book(symbol, limit))
+
+    def fetch_order_books(self, symbols=None, limit=None):
+        symbols = symbols if symbols is not None else self.symbols
+        return self._respond({symbol: self._order_book(symbol, limit) for symbol in symbols})
+
+
+class AsyncFakeExchange(FakeExchange):
+    """
+    Asyncio version of FakeExchange that mirrors the ccxt.async_support API.
+    """
+
+    async def _respond(self, payload):
+        self._check_request()
+        await asyncio.sleep(self.latency)
+        return payload
+
+    async def close(self):
+        pass
+
+
+class AsyncFakeStreamingExchange(AsyncFakeExchange):
+    """
+    AsyncFakeExchange that also watches funding rates over websocket, like a ccxt.pro exchange.
+
+    It connects to a stand-in server started with start_fake_funding_rate_server. Like ccxt.pro, a dropped
+    connection makes the pending watch call fail with ccxt.NetworkError, and the next call opens
+    a new connection and subscribes again. It needs aiohttp, which the other fake exchanges do not.
+
+    Args:
+        ws_url (str): URL of the stand-in websocket server.
+        **kwargs: Arguments of FakeExchange.
+    """
+
+    def __init__(self, ws_url, **kwargs):
+        super().__init__(**kwargs)
+        self.ws_url = ws_url
+        self.has['watchFundingRates'] = True
+        self.connection_count = 0
+        self._session = None
+        self._ws = None
+
+    async def watch_funding_rates(self, symbols):
+        import aiohttp
+
+        if self._ws is None or self._ws.closed:
+            if self._session is None:
+                self._session = aiohttp.ClientSession()
+            try:
+                self._ws = await self._session.ws_connect(self.ws_url)
+            except aiohttp.ClientError as e:
+                raise ccxt.NetworkError(f"{self.id} websocket connection failed: {e}")
+            self.connection_count += 1
+            await self._ws.send_json({'op': 'subscribe', 'symbols': symbols})
+        message = await self._ws.receive()
+        if message.type != aiohttp.WSMsgType.TEXT:
+            self._ws = None
+            raise ccxt.NetworkError(f"{self.id} websocket connection closed")
+        return {rate['symbol']: rate for rate in json.loads(message.data)}
+
+    async def close(self):
+        if self._ws is not None:
+            await self._ws.close()
+        if self._session is not None:
+            await self._session.close()
+
+
+async def start_fake_funding_rate_server(exchange, interval=0.05, batch_size=50, drop_after=None):
+    """
+    Starts a local websocket server that pushes funding rate updates of a fake exchange.
+
+    A client subscribes by sending {'op': 'subscribe', 'symbols': [...]}. The server then sends a JSON list
+    of funding rate structures every interval, cycling through the subscribed symbols.
+
+    Args:
+        exchange (FakeExchange): Fake exchange whose funding rates are pushed.
+        interval (float): Seconds between messages.
+        batch_size (int): Number of symbols per message.
+        drop_after (int, optional): Number of messages after which the server closes every connection,
+            to test reconnects. None means connections are never dropped.
+
+    Returns:
+        tuple: aiohttp AppRunner, to be cleaned up after use, and the websocket URL.
+    """
+    from aiohttp import web
+
+    async def handle(request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        subscription = await ws.receive_json()
+        symbols = subscription['symbols']
+        sent = 0
+        while not ws.closed and (drop_after is None or sent < drop_after):
+            start = sent * batch_size % len(symbols)
+            batch = symbols[start:start + batch_size]
+            rates = []
+            for symbol in batch:
+                rate = exchange._funding_rate(symbol)
+                rate['fundingRate'] += exchange._random(symbol, sent).uniform(-0.0001, 0.0001)
+                rates.append(rate)
+            await ws.send_str(json.dumps(rates))
+            sent += 1
+            await asyncio.sleep(interval)
+        await ws.close()
+        return ws
+
+    app = web.Application()
+    app.router.add_get('/ws', handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    host, port = runner.addresses[0][:2]
+    return runner, f"ws://{host}:{port}/ws"
+
+
+def now_ms():
+    """
+    Returns the current timestamp in milliseconds.
+    """
+    return int(datetime.datetime.now().timestamp() * 1000)
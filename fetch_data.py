@@ -1,9 +1,36 @@
+import argparse
 import datetime
+import functools
+import json
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import chain, zip_longest
 
 import pandas as pd
 from config import CONFIG
-from exchange import init_exchange, get_all_trading_pairs, get_funding_rate, get_historical_funding_rates, get_ohlc
-from utils import df_to_file, display_progress
+from candle_store import open_candle_store, get_fetch_start, save_candles, load_candles
+from checkpoint_log import (get_checkpoint_path, get_checkpointed_rows, save_checkpoint_rows, start_checkpoint_log,
+                            stop_checkpoint_log)
+from funding_history_store import (open_funding_history_store, get_fetch_start as get_history_fetch_start,
+                                   save_funding_rates, load_funding_rates)
+from exchange import (init_exchange, get_all_trading_pairs, get_funding_rate, get_funding_rates,
+                      get_funding_rate_history, get_historical_funding_rates, get_ohlc, get_since_ms,
+                      has_bulk_funding_rates)
+from fetch_data_async import run_perpetual_fetch_async
+from fetch_queue import (open_fetch_queue, enqueue_work_units, requeue_work_units, claim_work_unit, complete_work_unit,
+                         release_work_unit, get_queue_progress, load_work_results, load_work_store_rows,
+                         get_failed_work_units)
+from market_cache import get_markets
+from spot_index import build_spot_index, load_spot_pairs_from_files, save_spot_index
+from utils import (df_to_file, display_progress, get_amplitude_stats, get_snapshot_info_path, save_snapshot_time,
+                   split_into_chunks)
+
+# Endpoints of the work units of a perpetual exchange in a sharded fetch
+SHARD_ENDPOINTS = ['rates', 'history', 'amplitude']
 
 
 def fetch_and_save_data():
@@ -12,53 +39,383 @@ def fetch_and_save_data():
 
     This function iterates over the configured perpetual exchanges, fetches funding rates data
     for all perpetual trading pairs, retrieves current and historical rates, merges the dataframes,
-    and saves them to files.
+    and saves them to files. If parallel_exchanges is enabled in the config, every exchange
+    is processed in its own thread. In the 'sharded' fetch mode the work is split into units
+    that worker processes take from a queue (see run_sharded_fetch).
+
+    Every fetched pair is appended to a checkpoint log in the snapshot directory (see checkpoint_log.py).
+    With fetch_resume, e.g. after a crash, pairs already in the log are not fetched again.
     """
     print(f"- Fetching data started")
     directory_data = f"{CONFIG['directory']}/{CONFIG['subdirectory']}/data"
-    perp_exchanges = [init_exchange(exchange) for exchange in CONFIG['perpetual_exchanges']]
-    spot_exchanges = [init_exchange(exchange) for exchange in CONFIG['spot_exchanges']]
 
-    # Saving perpetual data
-    for exchange in perp_exchanges:
-        print(f"-- Fetching perpetual data for {exchange.name}")
+    # The snapshot is analyzed as of the time its fetch started. A resumed fetch keeps the time of the run it continues
+    if not (CONFIG['fetch_resume'] and os.path.exists(get_snapshot_info_path(directory_data))):
+        save_snapshot_time(directory_data, int(time.time() * 1000))
+
+    tasks = [(fetch_and_save_perpetual_data, exchange_name) for exchange_name in CONFIG['perpetual_exchanges']]
+    if CONFIG['get_spot_perp_opportunities']:
+        tasks += [(fetch_and_save_spot_data, exchange_name) for exchange_name in CONFIG['spot_exchanges']]
+
+    if CONFIG['fetch_mode'] == 'sharded':
+        # The work queue keeps the finished units itself
+        run_sharded_fetch(directory_data)
+    else:
+        resumed_rows = start_checkpoint_log(directory_data, resume=CONFIG['fetch_resume'])
+        if resumed_rows:
+            print(f"-- Resuming: {resumed_rows} results of pairs read from {get_checkpoint_path(directory_data)}")
+        try:
+            if CONFIG['parallel_exchanges']:
+                run_tasks_in_parallel(tasks, directory_data)
+            else:
+                for task, exchange_name in tasks:
+                    task(init_exchange(exchange_name), directory_data)
+        finally:
+            stop_checkpoint_log()
+
+    # Index the spot pairs of all spot exchanges once, so every analysis of the snapshot can reuse the index
+    if CONFIG['get_spot_perp_opportunities']:
+        spot_index = build_spot_index(load_spot_pairs_from_files(directory_data))
+        if spot_index is not None:
+            save_spot_index(spot_index, directory_data)
+
+    print(f"- Fetching process finished. The data is saved in the directory: {directory_data}\n")
+
+
+def run_tasks_in_parallel(tasks, directory_data):
+    """
+    Runs exchange tasks on a thread pool. An error in one task does not affect the others.
+
+    Args:
+        tasks (list): List of (task function, exchange name) tuples.
+        directory_data (str): Directory to save the files.
+    """
+    def run_task(task, exchange_name):
+        threading.current_thread().name = exchange_name
+        task(init_exchange(exchange_name), directory_data)
+
+    max_workers = CONFIG['parallel_workers'] or len(tasks)
+    failed = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(run_task, task, exchange_name): (task.__name__, exchange_name)
+                   for task, exchange_name in tasks}
+        for future in as_completed(futures):
+            task_name, exchange_name = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Error: {task_name} failed for {exchange_name}: {e}")
+                failed.append(exchange_name)
+    if failed:
+        print(f"-- Fetching failed for: {', '.join(failed)}")
+
+
+def get_fetch_queue_path(directory_data):
+    """
+    Returns the path to the work queue of a sharded fetch of a snapshot.
+
+    Args:
+        directory_data (str): Data directory of the snapshot.
+
+    Returns:
+        str: Path to the queue file, next to the data directory.
+    """
+    return f"{os.path.dirname(directory_data)}/fetch_queue.sqlite"
+
+
+def run_sharded_fetch(directory_data, exchange_factory=None):
+    """
+    Fetches the data of all exchanges through a work queue shared by several worker processes.
+
+    The coordinator splits the pairs of every perpetual exchange into batches of shard_batch_pairs and
+    enqueues one work unit per exchange, endpoint and batch, plus one unit per spot exchange. Units of
+    different exchanges are interleaved, so the workers spread over the exchanges. shard_workers local
+    worker processes are started, and workers on other hosts can join with the same queue file
+    (python fetch_data.py <queue file>). The coordinator works on the queue too until all units are finished,
+    then merges the results into the usual snapshot files.
+
+    With fetch_resume, the queue of an interrupted run is kept: its finished units are not fetched again.
 
-        # Get all perpetual trading pairs
-        perp_trading_pairs = get_all_trading_pairs(exchange, perpetual=True)
-        if not perp_trading_pairs:
+    Args:
+        directory_data (str): Directory to save the files.
+        exchange_factory (callable, optional): Function creating an exchange object from its name, used by the
+            coordinator and the local workers, e.g. to fetch from fake exchanges. Defaults to init_exchange.
+    """
+    queue_path = get_fetch_queue_path(directory_data)
+    connection = open_fetch_queue(queue_path)
+    if CONFIG['fetch_resume'] and requeue_work_units(connection):
+        progress = get_queue_progress(connection)
+        print(f"-- Resuming the work queue in {queue_path}: {progress['done']} work units already done, "
+              f"{progress['pending']} left, {CONFIG['shard_workers']} local workers")
+    else:
+        units = create_work_units(exchange_factory)
+        enqueue_work_units(connection, units)
+        print(f"-- {len(units)} work units queued in {queue_path}, {CONFIG['shard_workers']} local workers")
+
+    workers = [multiprocessing.Process(target=run_fetch_worker,
+                                       args=(queue_path, f"{get_worker_name()}-{index}", exchange_factory),
+                                       daemon=True)
+               for index in range(CONFIG['shard_workers'])]
+    for worker in workers:
+        worker.start()
+    run_fetch_worker(queue_path, exchange_factory=exchange_factory)
+    for worker in workers:
+        worker.join()
+
+    merge_sharded_results(connection, directory_data)
+    progress = get_queue_progress(connection)
+    print(f"-- Work units done: {progress['done']}, failed: {progress['failed']}")
+    for exchange_name, endpoint, pairs_count, error in get_failed_work_units(connection):
+        print(f"Error: {endpoint} of {pairs_count} pairs failed for {exchange_name}: {error}")
+    connection.close()
+
+
+def create_work_units(exchange_factory=None):
+    """
+    Splits the fetch of all exchanges into work units, interleaved by exchange.
+
+    Args:
+        exchange_factory (callable, optional): Function creating an exchange object from its name.
+            Defaults to init_exchange.
+
+    Returns:
+        list: List of (exchange, endpoint, pairs) tuples.
+    """
+    units_by_exchange = []
+    for exchange_name in CONFIG['perpetual_exchanges']:
+        pairs = get_all_trading_pairs((exchange_factory or init_exchange)(exchange_name), perpetual=True)
+        print(f" {len(pairs)} perpetual trading pairs found for {exchange_name}")
+        batches = split_into_chunks(pairs, CONFIG['shard_batch_pairs'])
+        units_by_exchange.append([(exchange_name, endpoint, batch)
+                                  for batch in batches for endpoint in SHARD_ENDPOINTS])
+    if CONFIG['get_spot_perp_opportunities']:
+        units_by_exchange += [[(exchange_name, 'spot_pairs', [])] for exchange_name in CONFIG['spot_exchanges']]
+    return [unit for unit in chain.from_iterable(zip_longest(*units_by_exchange)) if unit is not None]
+
+
+def get_worker_name():
+    """
+    Returns the name of the current worker process, unique across hosts sharing a queue.
+
+    Returns:
+        str: Host name and process id.
+    """
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def run_fetch_worker(queue_path, worker=None, exchange_factory=None):
+    """
+    Takes work units from the queue of a sharded fetch and runs them until all units are finished.
+
+    While other workers hold the leases of the remaining units, the worker waits, so it can take over
+    the units of a worker that dies. Exchange objects are created once per worker and exchange.
+
+    Besides the records of a unit, its result holds the funding rates and candles the worker fetched into its
+    local stores. A worker on another host has its own stores, so the coordinator saves these rows into its
+    stores when it merges the results (see merge_sharded_results).
+
+    Args:
+        queue_path (str): Path to the queue file.
+        worker (str, optional): Name of the worker. Defaults to the host name and process id.
+        exchange_factory (callable, optional): Function creating an exchange object from its name.
+            Defaults to init_exchange.
+    """
+    worker = worker or get_worker_name()
+    exchange_factory = exchange_factory or init_exchange
+    connection = open_fetch_queue(queue_path)
+    exchanges = {}
+    while True:
+        unit = claim_work_unit(connection, worker)
+        if unit is None:
+            progress = get_queue_progress(connection)
+            if progress['pending'] == 0 and progress['leased'] == 0:
+                break
+            time.sleep(CONFIG['shard_poll_seconds'])
             continue
-        print(f" {len(perp_trading_pairs)} perpetual trading pairs found")
+        try:
+            if unit['exchange'] not in exchanges:
+                exchanges[unit['exchange']] = exchange_factory(unit['exchange'])
+                if CONFIG['market_cache']:
+                    get_markets(exchanges[unit['exchange']])
+            store_rows = []
+            df = run_work_unit(exchanges[unit['exchange']], unit['endpoint'], unit['pairs'], store_rows)
+            result = {'records': json.loads(df.to_json(orient='records')), 'store_rows': store_rows}
+            complete_work_unit(connection, unit['id'], worker, json.dumps(result))
+        except Exception as e:
+            print(f"Error: Work unit {unit['endpoint']} for {unit['exchange']} failed on {worker}: {e}")
+            release_work_unit(connection, unit['id'], worker, str(e))
+    connection.close()
+
+
+def run_work_unit(exchange, endpoint, pairs, store_rows=None):
+    """
+    Fetches the data of one work unit.
 
+    Args:
+        exchange (ccxt.Exchange): Exchange object.
+        endpoint (str): 'rates', 'history', 'amplitude' or 'spot_pairs'.
+        pairs (list): Trading pairs of the unit. Spot units fetch all spot pairs of the exchange.
+        store_rows (list, optional): List to which the funding rates or candles fetched into the local stores
+            are appended (see get_historical_funding_rates_for_pairs and get_daily_amplitude).
+
+    Returns:
+        pd.DataFrame: Fetched data.
+    """
+    if endpoint == 'rates':
+        return get_funding_rates_for_pairs(exchange, pairs)
+    if endpoint == 'history':
+        return get_historical_funding_rates_for_pairs(exchange, pairs, hours=CONFIG['funding_historical_days'] * 24,
+                                                      store_rows=store_rows)
+    if endpoint == 'amplitude':
+        return get_daily_amplitude(exchange, pairs, store_rows=store_rows)
+    if endpoint == 'spot_pairs':
+        return get_spot_pairs(exchange)
+    raise ValueError(f"Unknown endpoint {endpoint}")
+
+
+def merge_sharded_results(connection, directory_data):
+    """
+    Merges the results of the work units of every exchange and saves them to the snapshot files.
+
+    The funding rates and candles fetched by the workers are saved into the stores of this host first,
+    so the analysis finds the funding history of the pairs fetched by workers on other hosts.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the work queue.
+        directory_data (str): Directory to save the files.
+    """
+    for exchange_name in CONFIG['perpetual_exchanges']:
+        save_work_store_rows(connection, exchange_name)
+        df_rates = pd.DataFrame(load_work_results(connection, exchange_name, 'rates'))
+        if df_rates.empty:
+            continue
+        # Batches that returned no rows still need the columns for the merge
+        df_historical_rates = pd.DataFrame(load_work_results(connection, exchange_name, 'history'),
+                                           columns=['pair', 'historical_rates'])
+        df_daily_amplitude = pd.DataFrame(load_work_results(connection, exchange_name, 'amplitude'),
+                                          columns=['pair', 'mean_daily_amplitude', 'max_daily_amplitude',
+                                                   'amplitude_days'])
+        intersection_df = merge_perpetual_data(df_rates, df_historical_rates, df_daily_amplitude)
+        df_to_file(intersection_df, directory_data, f"funding_rates_{exchange_name}", CONFIG['snapshot_format'])
+    if CONFIG['get_spot_perp_opportunities']:
+        for exchange_name in CONFIG['spot_exchanges']:
+            spot_pairs = pd.DataFrame(load_work_results(connection, exchange_name, 'spot_pairs'), columns=['pair'])
+            df_to_file(spot_pairs, directory_data, f"spot_pairs_{exchange_name}", CONFIG['snapshot_format'])
+
+
+def save_work_store_rows(connection, exchange_name):
+    """
+    Saves the funding rates and candles that the workers fetched for an exchange into the local stores.
+    Rows that are already stored are skipped or replaced, so the rows of local workers do no harm.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the work queue.
+        exchange_name (str): Exchange id.
+    """
+    if CONFIG['funding_history_store']:
+        store = open_funding_history_store()
+        for pair, history in group_rows_by_pair(load_work_store_rows(connection, exchange_name, 'history')).items():
+            save_funding_rates(store, exchange_name, pair, history)
+        store.close()
+    if CONFIG['candle_store']:
+        store = open_candle_store()
+        for pair, candles in group_rows_by_pair(load_work_store_rows(connection, exchange_name, 'amplitude')).items():
+            save_candles(store, exchange_name, pair, '1d', candles)
+        store.close()
+
+
+def group_rows_by_pair(rows):
+    """
+    Groups store rows sent by the workers by pair.
+
+    Args:
+        rows (list): Lists with the pair first, followed by the values of the store row.
+
+    Returns:
+        dict: Lists of values keyed by pair.
+    """
+    rows_by_pair = {}
+    for pair, *values in rows:
+        rows_by_pair.setdefault(pair, []).append(values)
+    return rows_by_pair
+
+
+def fetch_and_save_perpetual_data(exchange, directory_data):
+    """
+    Fetches current rates, historical rates and daily amplitudes of all perpetual pairs
+    of the exchange and saves them to a file.
+
+    Args:
+        exchange (ccxt.Exchange): Exchange object.
+        directory_data (str): Directory to save the file.
+    """
+    print(f"-- Fetching perpetual data for {exchange.name}")
+
+    # Get all perpetual trading pairs
+    perp_trading_pairs = get_all_trading_pairs(exchange, perpetual=True)
+    if not perp_trading_pairs:
+        return
+    print(f" {len(perp_trading_pairs)} perpetual trading pairs found for {exchange.name}")
+
+    hours = CONFIG['funding_historical_days'] * 24
+    if CONFIG['fetch_mode'] == 'async':
+        # Get current rates, historical rates and daily amplitudes concurrently
+        df_rates, df_historical_rates, df_daily_amplitude = run_perpetual_fetch_async(
+            exchange.id, perp_trading_pairs, hours=hours)
+    else:
         # Get all funding rates
         df_rates = get_funding_rates_for_pairs(exchange, perp_trading_pairs)
 
         # Get historical funding rates
-        hours = CONFIG['funding_historical_days'] * 24
         df_historical_rates = get_historical_funding_rates_for_pairs(exchange, perp_trading_pairs, hours=hours)
 
         # Get daily amplitude data
         df_daily_amplitude = get_daily_amplitude(exchange, perp_trading_pairs)
 
-        # Merge and save data to file
-        intersection_df = pd.merge(df_rates, df_historical_rates, on='pair', how='left')
-        intersection_df = pd.merge(intersection_df, df_daily_amplitude, on='pair', how='left')
+    # Merge and save data to file
+    intersection_df = merge_perpetual_data(df_rates, df_historical_rates, df_daily_amplitude)
 
-        df_to_file(intersection_df, directory_data, f"funding_rates_{exchange.id}")
+    df_to_file(intersection_df, directory_data, f"funding_rates_{exchange.id}", CONFIG['snapshot_format'])
 
-    # Saving spot data
-    if CONFIG['get_spot_perp_opportunities']:
-        for exchange in spot_exchanges:
-            print(f"-- Fetching spot pairs for {exchange.name}")
-            spot_pairs = get_spot_pairs(exchange)
-            df_to_file(spot_pairs, directory_data, f"spot_pairs_{exchange.id}")
 
-    print(f"- Fetching process finished. The data is saved in the directory: {directory_data}\n")
+def merge_perpetual_data(df_rates, df_historical_rates, df_daily_amplitude):
+    """
+    Merges current rates, historical rates and daily amplitudes of an exchange into one dataframe.
+
+    Args:
+        df_rates (pd.DataFrame): DataFrame containing current funding rates for each pair.
+        df_historical_rates (pd.DataFrame): DataFrame containing historical funding rates for each pair.
+        df_daily_amplitude (pd.DataFrame): DataFrame containing mean and max amplitude for each pair.
+
+    Returns:
+        pd.DataFrame: Merged dataframe with one row per pair of df_rates.
+    """
+    intersection_df = pd.merge(df_rates, df_historical_rates, on='pair', how='left')
+    intersection_df = pd.merge(intersection_df, df_daily_amplitude, on='pair', how='left')
+    return intersection_df
+
+
+def fetch_and_save_spot_data(exchange, directory_data):
+    """
+    Fetches spot trading pairs of the exchange and saves them to a file.
+
+    Args:
+        exchange (ccxt.Exchange): Exchange object.
+        directory_data (str): Directory to save the file.
+    """
+    print(f"-- Fetching spot pairs for {exchange.name}")
+    spot_pairs = get_spot_pairs(exchange)
+    df_to_file(spot_pairs, directory_data, f"spot_pairs_{exchange.id}", CONFIG['snapshot_format'])
 
 
 def get_funding_rates_for_pairs(exchange, trading_pairs):
     """
     Fetches current funding rates for specified trading pairs.
 
+    The bulk endpoint is used if the exchange supports it, one request per chunk of
+    funding_rates_chunk_size pairs. Otherwise the rates are fetched pair by pair.
+    Pairs already in the checkpoint log of the run are not requested again (see checkpoint_log.py).
+
     Args:
         exchange (ccxt.Exchange): Exchange object.
         trading_pairs (list): List of trading pairs.
@@ -66,56 +423,125 @@ def get_funding_rates_for_pairs(exchange, trading_pairs):
     Returns:
         pd.DataFrame: DataFrame containing current funding rates for each pair.
     """
+    if has_bulk_funding_rates(exchange):
+        return get_funding_rates_for_pairs_in_bulk(exchange, trading_pairs)
+
+    print(f" Current funding rates for {exchange.name}: per-pair requests ({len(trading_pairs)})")
+    checkpointed = get_checkpointed_rows(exchange.id, 'rates')
     total_pairs = len(trading_pairs)
     data = []
     for index, pair in enumerate(trading_pairs):
+        if pair in checkpointed:
+            data.append(checkpointed[pair])
+            continue
         try:
             current_rate = get_funding_rate(exchange, pair)
             if current_rate is not None:
-                data.append({'pair': pair, 'rate': current_rate})
+                data.append({'pair': pair, **current_rate})
+                save_checkpoint_rows(exchange.id, 'rates', data[-1:])
         except Exception as e:
             print(f"Error fetching funding rate for {pair}: {e}")
             continue
-        display_progress(index, total_pairs, info="Getting current funding rates")
+        display_progress(index, total_pairs, info=f"Getting current funding rates ({exchange.id})")
     print("\r")
     return pd.DataFrame(data)
 
 
-def get_historical_funding_rates_for_pairs(exchange, trading_pairs, hours=24):
+def get_funding_rates_for_pairs_in_bulk(exchange, trading_pairs):
+    """
+    Fetches current funding rates for specified trading pairs using the bulk endpoint.
+    Pairs already in the checkpoint log of the run are not requested again.
+
+    Args:
+        exchange (ccxt.Exchange): Exchange object.
+        trading_pairs (list): List of trading pairs.
+
+    Returns:
+        pd.DataFrame: DataFrame containing current funding rates for each pair.
+    """
+    rows = get_checkpointed_rows(exchange.id, 'rates')
+    pending_pairs = [pair for pair in trading_pairs if pair not in rows]
+    chunks = split_into_chunks(pending_pairs, CONFIG['funding_rates_chunk_size'])
+    print(f" Current funding rates for {exchange.name}: bulk endpoint ({len(chunks)} requests)")
+    for index, chunk in enumerate(chunks):
+        try:
+            rates = get_funding_rates(exchange, chunk)
+        except Exception as e:
+            print(f"Error fetching funding rates for {len(chunk)} pairs: {e}")
+            continue
+        chunk_rows = [{'pair': pair, **rates[pair]} for pair in chunk if pair in rates]
+        save_checkpoint_rows(exchange.id, 'rates', chunk_rows)
+        rows.update((row['pair'], row) for row in chunk_rows)
+        display_progress(index + 1, len(chunks), info=f"Getting current funding rates ({exchange.id})")
+    print("\r")
+    return pd.DataFrame([rows[pair] for pair in trading_pairs if pair in rows])
+
+
+def get_historical_funding_rates_for_pairs(exchange, trading_pairs, hours=24, store_rows=None):
     """
     Fetches historical funding rates for specified trading pairs.
 
+    If funding_history_store is enabled in the config, only funding rates newer than the stored ones
+    are fetched and the historical rates are read from the funding history store.
+    Pairs already in the checkpoint log of the run are not requested again.
+
     Args:
         exchange (ccxt.Exchange): Exchange object.
         trading_pairs (list): List of trading pairs.
         hours (int): Number of hours of historical data to fetch. Default is 24 hours.
+        store_rows (list, optional): List to which the funding rates fetched into the store are appended
+            as [pair, timestamp, rate] lists, e.g. to send them from a worker of a sharded fetch to its coordinator.
 
     Returns:
         pd.DataFrame: DataFrame containing historical funding rates for each pair.
     """
+    store = open_funding_history_store() if CONFIG['funding_history_store'] else None
+    backfill_since = get_since_ms(CONFIG['funding_history_backfill_days'] * 24)
+    checkpointed = get_checkpointed_rows(exchange.id, 'history')
     total_pairs = len(trading_pairs)
     data = []
     for index, pair in enumerate(trading_pairs):
+        if pair in checkpointed:
+            data.append(checkpointed[pair])
+            continue
         try:
-            historical_rates = get_historical_funding_rates(exchange, pair, hours)
+            if store:
+                since = get_history_fetch_start(store, exchange.id, pair, min(backfill_since, get_since_ms(hours)))
+                new_history = get_funding_rate_history(exchange, pair, since)
+                save_funding_rates(store, exchange.id, pair, new_history)
+                if store_rows is not None:
+                    store_rows.extend([pair, timestamp, rate] for timestamp, rate in new_history)
+                history = load_funding_rates(store, exchange.id, pair, get_since_ms(hours))
+                historical_rates = [round(100 * rate, 3) for _, rate in history]
+            else:
+                historical_rates = get_historical_funding_rates(exchange, pair, hours)
             if historical_rates:
                 data.append({'pair': pair, 'historical_rates': historical_rates})
+                save_checkpoint_rows(exchange.id, 'history', data[-1:])
         except Exception as e:
             print(f"Error fetching historical funding rate for {pair}: {e}")
             continue
-        display_progress(index, total_pairs, info="Getting historical funding rates")
+        display_progress(index, total_pairs, info=f"Getting historical funding rates ({exchange.id})")
     print("\r")
+    if store:
+        store.close()
     return pd.DataFrame(data)
 
 
-def get_daily_amplitude(exchange, trading_pairs):
+def get_daily_amplitude(exchange, trading_pairs, store_rows=None):
     """
     Fetches daily candle data of specified trading pairs and calculate mean and max amplitude.
     Amplitude is defined as high - low of a daily candle in percentage
 
+    If candle_store is enabled in the config, only candles newer than the stored ones are fetched
+    and the amplitude is calculated from the candle store.
+    Pairs already in the checkpoint log of the run are not requested again.
+
     Args:
         exchange (ccxt.Exchange): Exchange object.
         trading_pairs (list): List of trading pairs.
+        store_rows (list, optional): List to which the candles fetched into the store are appended
+            as [pair, timestamp, open, high, low, close, volume] lists.
 
     Returns:
         pd.DataFrame: DataFrame containing mean and max amplitude for each pair.
@@ -123,29 +549,34 @@ def get_daily_amplitude(exchange, trading_pairs):
     days = CONFIG['amplitude_days']
     current_time = int(datetime.datetime.now().timestamp() * 1000)
     start_time = current_time - days * 24 * 60 * 60 * 1000
+    store = open_candle_store() if CONFIG['candle_store'] else None
+    checkpointed = get_checkpointed_rows(exchange.id, 'amplitude')
     total_pairs = len(trading_pairs)
     data = []
     for index, pair in enumerate(trading_pairs):
+        if pair in checkpointed:
+            data.append(checkpointed[pair])
+            continue
         try:
-            ohlc_data = get_ohlc(exchange, pair, start_date_ms=start_time, end_date_ms=current_time, timeframe='1d')
+            if store:
+                since = get_fetch_start(store, exchange.id, pair, '1d', start_time)
+                new_candles = get_ohlc(exchange, pair, start_date_ms=since, end_date_ms=current_time, timeframe='1d')
+                save_candles(store, exchange.id, pair, '1d', new_candles)
+                if store_rows is not None:
+                    store_rows.extend([pair, *candle[:6]] for candle in new_candles)
+                ohlc_data = load_candles(store, exchange.id, pair, '1d', start_time, current_time)
+            else:
+                ohlc_data = get_ohlc(exchange, pair, start_date_ms=start_time, end_date_ms=current_time, timeframe='1d')
         except Exception as e:
             print(f"Error fetching ohlc data for {pair}: {e}")
             continue
-        df = pd.DataFrame(ohlc_data, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-
-        df['amplitude'] = 100 * (df['high'] - df['low']) / df['open']
-
-        mean_amplitude = round(df['amplitude'].mean(), 2)
-        max_amplitude = round(df['amplitude'].max(), 2)
-        amplitude_days = len(df)
+        data.append(get_amplitude_stats(pair, ohlc_data))
+        save_checkpoint_rows(exchange.id, 'amplitude', data[-1:])
 
-        data.append({'pair': pair,
-                     'mean_daily_amplitude': mean_amplitude,
-                     'max_daily_amplitude': max_amplitude,
-                     'amplitude_days': amplitude_days})
-
-        display_progress(index, total_pairs, info="Getting daily amplitudes")
+        display_progress(index, total_pairs, info=f"Getting daily amplitudes ({exchange.id})")
     print("\r")
+    if store:
+        store.close()
     return pd.DataFrame(data)
 
 
@@ -165,3 +596,22 @@ def get_spot_pairs(exchange):
     except Exception as e:
         print(f"Error fetching spot pairs for {exchange.name}: {e}")
         return pd.DataFrame(columns=['pair'])
+
+
+if __name__ == '__main__':
+    # Joins a sharded fetch as a worker, e.g. on another host: python fetch_data.py <queue file>
+    parser = argparse.ArgumentParser(description="Join a sharded fetch as a worker.")
+    parser.add_argument('queue_path', help="path to the fetch_queue.sqlite file of the fetch")
+    parser.add_argument('--fake-markets', type=int, default=None,
+                        help="fetch from fake exchanges with this number of pairs instead, to try a setup "
+                             "without network access. The coordinator must use the same fake exchanges")
+    parser.add_argument('--fake-latency', type=float, default=0.05,
+                        help="simulated round trip time of the fake exchanges in seconds")
+    arguments = parser.parse_args()
+    exchange_factory = None
+    if arguments.fake_markets is not None:
+        from fake_exchange import FakeExchange
+
+        exchange_factory = functools.partial(FakeExchange, markets=arguments.fake_markets,
+                                             latency=arguments.fake_latency)
+    run_fetch_worker(arguments.queue_path, exchange_factory=exchange_factory)
@@ -0,0 +1,305 @@
+import asyncio
+import datetime
+
+import pandas as pd
+from candle_store import open_candle_store, get_fetch_start, save_candles, load_candles
+from checkpoint_log import get_checkpointed_rows, save_checkpoint_rows
+from config import CONFIG
+from exchange import (init_async_exchange, get_funding_rate_async, get_funding_rates_async,
+                      get_funding_rate_history_async, get_historical_funding_rates_async, get_ohlc_async,
+                      get_since_ms, has_bulk_funding_rates)
+from market_cache import apply_cached_markets
+from funding_history_store import (open_funding_history_store, get_fetch_start as get_history_fetch_start,
+                                   save_funding_rates, load_funding_rates)
+from utils import display_progress, get_amplitude_stats, split_into_chunks
+
+
+def run_perpetual_fetch_async(exchange_name, trading_pairs, hours=24):
+    """
+    Fetches current rates, historical rates and daily amplitudes of perpetual pairs using asyncio.
+
+    This is the blocking entry point of the async fetch mode. It creates an asyncio exchange object,
+    runs all requests on its own event loop and closes the exchange afterwards.
+
+    Args:
+        exchange_name (str): Name of the exchange.
+        trading_pairs (list): List of trading pairs.
+        hours (int): Number of hours of historical data to fetch. Default is 24 hours.
+
+    Returns:
+        tuple: DataFrames with current rates, historical rates and daily amplitudes.
+    """
+    return asyncio.run(fetch_with_new_exchange(exchange_name, trading_pairs, hours))
+
+
+async def fetch_with_new_exchange(exchange_name, trading_pairs, hours):
+    """
+    Creates an asyncio exchange object, fetches perpetual data with it and closes it.
+
+    Args:
+        exchange_name (str): Name of the exchange.
+        trading_pairs (list): List of trading pairs.
+        hours (int): Number of hours of historical data to fetch.
+
+    Returns:
+        tuple: DataFrames with current rates, historical rates and daily amplitudes.
+    """
+    exchange = init_async_exchange(exchange_name)
+    apply_cached_markets(exchange)
+    try:
+        return await fetch_perpetual_data(exchange, trading_pairs, hours)
+    finally:
+        await exchange.close()
+
+
+async def fetch_perpetual_data(exchange, trading_pairs, hours=24):
+    """
+    Fetches current rates, historical rates and daily amplitudes of perpetual pairs concurrently.
+
+    The number of requests in flight is limited per exchange by async_max_in_flight
+    and per endpoint by async_endpoint_limits from the config.
+
+    Args:
+        exchange (ccxt.async_support.Exchange): Asyncio exchange object.
+        trading_pairs (list): List of trading pairs.
+        hours (int): Number of hours of historical data to fetch. Default is 24 hours.
+
+    Returns:
+        tuple: DataFrames with current rates, historical rates and daily amplitudes.
+    """
+    limits = create_request_limits(CONFIG['async_max_in_flight'], CONFIG['async_endpoint_limits'])
+    df_rates, df_historical_rates, df_daily_amplitude = await asyncio.gather(
+        get_funding_rates_for_pairs(exchange, trading_pairs, limits),
+        get_historical_funding_rates_for_pairs(exchange, trading_pairs, limits, hours=hours),
+        get_daily_amplitude(exchange, trading_pairs, limits))
+    print("\r")
+    return df_rates, df_historical_rates, df_daily_amplitude
+
+
+def create_request_limits(max_in_flight, endpoint_limits):
+    """
+    Creates semaphores that limit the number of requests in flight.
+
+    Args:
+        max_in_flight (int): Maximum number of simultaneous requests to the exchange.
+        endpoint_limits (dict): Maximum number of simultaneous requests per endpoint.
+
+    Returns:
+        dict: Semaphores keyed by endpoint name, plus the exchange-wide one under 'exchange'.
+    """
+    limits = {endpoint: asyncio.Semaphore(limit) for endpoint, limit in endpoint_limits.items()}
+    limits['exchange'] = asyncio.Semaphore(max_in_flight)
+    return limits
+
+
+async def call_limited(limits, endpoint, coroutine_function, *args, **kwargs):
+    """
+    Awaits a request once both the endpoint and the exchange limits allow it.
+
+    The endpoint slot is taken first so that requests waiting for a busy endpoint
+    do not hold exchange slots that other endpoints could use. Endpoints without their own
+    limit are only limited by the exchange one.
+
+    Args:
+        limits (dict): Semaphores created by create_request_limits.
+        endpoint (str): Endpoint name.
+        coroutine_function (callable): Coroutine function making the request.
+
+    Returns:
+        The result of the request.
+    """
+    if endpoint not in limits:
+        async with limits['exchange']:
+            return await coroutine_function(*args, **kwargs)
+    async with limits[endpoint]:
+        async with limits['exchange']:
+            return await coroutine_function(*args, **kwargs)
+
+
+async def gather_for_pairs(exchange_id, endpoint, trading_pairs, fetch_pair, info):
+    """
+    Runs a fetch coroutine for every trading pair and displays the progress as the results arrive.
+
+    Rows are appended to the checkpoint log of the run as they arrive, and pairs already in the log
+    are not fetched again (see checkpoint_log.py).
+
+    Args:
+        exchange_id (str): Exchange id.
+        endpoint (str): Endpoint of the rows in the checkpoint log, e.g. 'history'.
+        trading_pairs (list): List of trading pairs.
+        fetch_pair (callable): Coroutine function taking a pair and returning a row dict or None.
+        info (str): Progress description.
+
+    Returns:
+        list: Rows returned for the pairs, in the order of trading_pairs. Failed pairs are skipped.
+    """
+    checkpointed = get_checkpointed_rows(exchange_id, endpoint)
+    total_pairs = len(trading_pairs)
+    completed = 0
+
+    async def run(pair):
+        nonlocal completed
+        if pair in checkpointed:
+            row = checkpointed[pair]
+        else:
+            row = await fetch_pair(pair)
+            if row is not None:
+                save_checkpoint_rows(exchange_id, endpoint, [row])
+        completed += 1
+        display_progress(completed, total_pairs, info=info)
+        return row
+
+    rows = await asyncio.gather(*(run(pair) for pair in trading_pairs))
+    return [row for row in rows if row is not None]
+
+
+async def get_funding_rates_for_pairs(exchange, trading_pairs, limits):
+    """
+    Fetches current funding rates for specified trading pairs concurrently.
+
+    The bulk endpoint is used if the exchange supports it, otherwise the rates are fetched pair by pair.
+
+    Args:
+        exchange (ccxt.async_support.Exchange): Asyncio exchange object.
+        trading_pairs (list): List of trading pairs.
+        limits (dict): Semaphores created by create_request_limits.
+
+    Returns:
+        pd.DataFrame: DataFrame containing current funding rates for each pair.
+    """
+    if has_bulk_funding_rates(exchange):
+        return await get_funding_rates_for_pairs_in_bulk(exchange, trading_pairs, limits)
+
+    print(f" Current funding rates for {exchange.name}: per-pair requests ({len(trading_pairs)})")
+
+    async def fetch_pair(pair):
+        try:
+            current_rate = await call_limited(limits, 'funding_rate', get_funding_rate_async, exchange, pair)
+        except Exception as e:
+            print(f"Error fetching funding rate for {pair}: {e}")
+            return None
+        if current_rate is None:
+            return None
+        return {'pair': pair, **current_rate}
+
+    data = await gather_for_pairs(exchange.id, 'rates', trading_pairs, fetch_pair,
+                                  info=f"Getting current funding rates ({exchange.id})")
+    return pd.DataFrame(data)
+
+
+async def get_funding_rates_for_pairs_in_bulk(exchange, trading_pairs, limits):
+    """
+    Fetches current funding rates for specified trading pairs using the bulk endpoint, chunks concurrently.
+    Pairs already in the checkpoint log of the run are not requested again.
+
+    Args:
+        exchange (ccxt.async_support.Exchange): Asyncio exchange object.
+        trading_pairs (list): List of trading pairs.
+        limits (dict): Semaphores created by create_request_limits.
+
+    Returns:
+        pd.DataFrame: DataFrame containing current funding rates for each pair.
+    """
+    rows = get_checkpointed_rows(exchange.id, 'rates')
+    pending_pairs = [pair for pair in trading_pairs if pair not in rows]
+    chunks = split_into_chunks(pending_pairs, CONFIG['funding_rates_chunk_size'])
+    print(f" Current funding rates for {exchange.name}: bulk endpoint ({len(chunks)} requests)")
+
+    async def fetch_chunk(chunk):
+        try:
+            rates = await call_limited(limits, 'funding_rate', get_funding_rates_async, exchange, chunk)
+        except Exception as e:
+            print(f"Error fetching funding rates for {len(chunk)} pairs: {e}")
+            return []
+        chunk_rows = [{'pair': pair, **rates[pair]} for pair in chunk if pair in rates]
+        save_checkpoint_rows(exchange.id, 'rates', chunk_rows)
+        return chunk_rows
+
+    for chunk_rows in await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunks)):
+        rows.update((row['pair'], row) for row in chunk_rows)
+    return pd.DataFrame([rows[pair] for pair in trading_pairs if pair in rows])
+
+
+async def get_historical_funding_rates_for_pairs(exchange, trading_pairs, limits, hours=24):
+    """
+    Fetches historical funding rates for specified trading pairs concurrently.
+
+    If funding_history_store is enabled in the config, only funding rates newer than the stored ones
+    are fetched and the historical rates are read from the funding history store.
+
+    Args:
+        exchange (ccxt.async_support.Exchange): Asyncio exchange object.
+        trading_pairs (list): List of trading pairs.
+        limits (dict): Semaphores created by create_request_limits.
+        hours (int): Number of hours of historical data to fetch. Default is 24 hours.
+
+    Returns:
+        pd.DataFrame: DataFrame containing historical funding rates for each pair.
+    """
+    store = open_funding_history_store() if CONFIG['funding_history_store'] else None
+    backfill_since = get_since_ms(CONFIG['funding_history_backfill_days'] * 24)
+
+    async def fetch_pair(pair):
+        try:
+            if store:
+                since = get_history_fetch_start(store, exchange.id, pair, min(backfill_since, get_since_ms(hours)))
+                history = await call_limited(limits, 'funding_rate_history', get_funding_rate_history_async,
+                                             exchange, pair, since)
+                save_funding_rates(store, exchange.id, pair, history)
+                history = load_funding_rates(store, exchange.id, pair, get_since_ms(hours))
+                historical_rates = [round(100 * rate, 3) for _, rate in history]
+            else:
+                historical_rates = await call_limited(limits, 'funding_rate_history',
+                                                      get_historical_funding_rates_async, exchange, pair, hours)
+        except Exception as e:
+            print(f"Error fetching historical funding rate for {pair}: {e}")
+            return None
+        if not historical_rates:
+            return None
+        return {'pair': pair, 'historical_rates': historical_rates}
+
+    data = await gather_for_pairs(exchange.id, 'history', trading_pairs, fetch_pair,
+                                  info=f"Getting historical funding rates ({exchange.id})")
+    if store:
+        store.close()
+    return pd.DataFrame(data)
+
+
+async def get_daily_amplitude(exchange, trading_pairs, limits):
+    """
+    Fetches daily candle data of specified trading pairs concurrently and calculate mean and max amplitude.
+
+    If candle_store is enabled in the config, only candles newer than the stored ones are fetched
+    and the amplitude is calculated from the candle store.
+
+    Args:
+        exchange (ccxt.async_support.Exchange): Asyncio exchange object.
+        trading_pairs (list): List of trading pairs.
+        limits (dict): Semaphores created by create_request_limits.
+
+    Returns:
+        pd.DataFrame: DataFrame containing mean and max amplitude for each pair.
+    """
+    days = CONFIG['amplitude_days']
+    current_time = int(datetime.datetime.now().timestamp() * 1000)
+    start_time = current_time - days * 24 * 60 * 60 * 1000
+    store = open_candle_store() if CONFIG['candle_store'] else None
+
+    async def fetch_pair(pair):
+        try:
+            since = get_fetch_start(store, exchange.id, pair, '1d', start_time) if store else start_time
+            ohlc_data = await call_limited(limits, 'ohlcv', get_ohlc_async, exchange, pair,
+                                           start_date_ms=since, end_date_ms=current_time, timeframe='1d')
+            if store:
+                save_candles(store, exchange.id, pair, '1d', ohlc_data)
+                ohlc_data = load_candles(store, exchange.id, pair, '1d', start_time, current_time)
+        except Exception as e:
+            print(f"Error fetching ohlc data for {pair}: {e}")
+            return None
+        return get_amplitude_stats(pair, ohlc_data)
+
+    data = await gather_for_pairs(exchange.id, 'amplitude', trading_pairs, fetch_pair,
+                                  info=f"Getting daily amplitudes ({exchange.id})")
+    if store:
+        store.close()
+    return pd.DataFrame(data)
@@ -0,0 +1,210 @@
+import json
+import os
+import sqlite3
+import time
+
+from config import CONFIG
+
+
+def open_fetch_queue(path):
+    """
+    Opens the work queue of a sharded fetch, creating it if needed.
+
+    Work units are kept in an SQLite database, one row per exchange, endpoint and batch of pairs.
+    Workers claim units with a lease: a claimed unit whose lease expires, e.g. because its worker died,
+    is claimed again by another worker. Every process or thread must open its own connection.
+
+    The database uses the rollback journal rather than WAL. WAL keeps its index in shared memory, which
+    processes on different hosts do not share, while the rollback journal only needs file locks.
+    Workers on other hosts are therefore only safe on a shared filesystem whose POSIX byte-range locks
+    work across hosts, e.g. NFSv4 with locking enabled. On other network filesystems the queue can be
+    corrupted, and only workers on the host of the queue file are supported.
+
+    Args:
+        path (str): Path to the database file.
+
+    Returns:
+        sqlite3.Connection: Connection to the work queue.
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+    connection.execute("PRAGMA journal_mode=DELETE")
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS work_units (
+            id INTEGER PRIMARY KEY,
+            exchange TEXT NOT NULL,
+            endpoint TEXT NOT NULL,
+            pairs TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            worker TEXT,
+            lease_expires REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            result TEXT
+        )""")
+    return connection
+
+
+def enqueue_work_units(connection, units):
+    """
+    Replaces the work units of the queue.
+
+    Units are claimed in the order they are given.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the work queue.
+        units (list): List of (exchange, endpoint, pairs) tuples.
+    """
+    connection.execute("BEGIN IMMEDIATE")
+    connection.execute("DELETE FROM work_units")
+    connection.executemany("INSERT INTO work_units (exchange, endpoint, pairs) VALUES (?, ?, ?)",
+                           [(exchange, endpoint, json.dumps(pairs)) for exchange, endpoint, pairs in units])
+    connection.execute("COMMIT")
+
+
+def requeue_work_units(connection):
+    """
+    Returns the unfinished and failed work units of an interrupted run to the queue, keeping the finished ones.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the work queue.
+
+    Returns:
+        int: Number of units in the queue, finished or not. 0 if there is no run to resume.
+    """
+    connection.execute("UPDATE work_units SET status = 'pending', worker = NULL, lease_expires = NULL, attempts = 0 "
+                       "WHERE status != 'done'")
+    return connection.execute("SELECT COUNT(*) FROM work_units").fetchone()[0]
+
+
+def claim_work_unit(connection, worker):
+    """
+    Claims the first pending work unit, or a unit whose lease has expired.
+
+    Units of an exchange that already has shard_max_leases_per_exchange active leases are skipped,
+    so the workers together stay within the rate limit of the exchange.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the work queue.
+        worker (str): Name of the worker.
+
+    Returns:
+        dict: Id, exchange, endpoint and pairs of the unit, or None if no unit can be claimed now.
+    """
+    now = time.time()
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        row = connection.execute("""
+            SELECT id, exchange, endpoint, pairs FROM work_units AS unit
+            WHERE (status = 'pending' OR (status = 'leased' AND lease_expires < :now))
+            AND (SELECT COUNT(*) FROM work_units AS leased WHERE leased.exchange = unit.exchange
+                 AND leased.status = 'leased' AND leased.lease_expires >= :now) < :max_leases
+            ORDER BY id LIMIT 1""",
+            {'now': now, 'max_leases': CONFIG['shard_max_leases_per_exchange']}).fetchone()
+        if row is not None:
+            connection.execute(
+                "UPDATE work_units SET status = 'leased', worker = ?, lease_expires = ?, attempts = attempts + 1 "
+                "WHERE id = ?", (worker, now + CONFIG['shard_lease_seconds'], row[0]))
+        connection.execute("COMMIT")
+    except sqlite3.Error:
+        connection.execute("ROLLBACK")
+        raise
+    if row is None:
+        return None
+    return {'id': row[0], 'exchange': row[1], 'endpoint': row[2], 'pairs': json.loads(row[3])}
+
+
+def complete_work_unit(connection, unit_id, worker, result):
+    """
+    Stores the result of a work unit. The result of a worker that lost its lease to another worker is dropped.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the work queue.
+        unit_id (int): Id of the unit.
+        worker (str): Name of the worker.
+        result (str): Result as a JSON object with the records of the unit under 'records' and the rows
+            the worker fetched into its local stores under 'store_rows'.
+    """
+    connection.execute("UPDATE work_units SET status = 'done', result = ?, lease_expires = NULL "
+                       "WHERE id = ? AND worker = ? AND status = 'leased'", (result, unit_id, worker))
+
+
+def release_work_unit(connection, unit_id, worker, error):
+    """
+    Returns a failed work unit to the queue, or marks it as failed after shard_max_attempts attempts.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the work queue.
+        unit_id (int): Id of the unit.
+        worker (str): Name of the worker.
+        error (str): Error message.
+    """
+    connection.execute("UPDATE work_units SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                       "error = ?, lease_expires = NULL WHERE id = ? AND worker = ? AND status = 'leased'",
+                       (CONFIG['shard_max_attempts'], error, unit_id, worker))
+
+
+def get_queue_progress(connection):
+    """
+    Returns the number of work units in every status.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the work queue.
+
+    Returns:
+        dict: Number of units keyed by status: 'pending', 'leased', 'done' and 'failed'.
+    """
+    progress = {'pending': 0, 'leased': 0, 'done': 0, 'failed': 0}
+    progress.update(connection.execute("SELECT status, COUNT(*) FROM work_units GROUP BY status").fetchall())
+    return progress
+
+
+def load_work_results(connection, exchange, endpoint):
+    """
+    Loads the results of the finished work units of an exchange and endpoint.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the work queue.
+        exchange (str): Exchange id.
+        endpoint (str): Endpoint of the units.
+
+    Returns:
+        list: Records of all units, in the order the units were enqueued.
+    """
+    rows = connection.execute("SELECT result FROM work_units WHERE exchange = ? AND endpoint = ? AND status = 'done' "
+                              "ORDER BY id", (exchange, endpoint)).fetchall()
+    return [record for (result,) in rows for record in json.loads(result)['records']]
+
+
+def load_work_store_rows(connection, exchange, endpoint):
+    """
+    Loads the store rows that the workers fetched for the finished work units of an exchange and endpoint.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the work queue.
+        exchange (str): Exchange id.
+        endpoint (str): Endpoint of the units.
+
+    Returns:
+        list: Store rows of all units, each one a list with the pair first.
+    """
+    rows = connection.execute("SELECT result FROM work_units WHERE exchange = ? AND endpoint = ? AND status = 'done' "
+                              "ORDER BY id", (exchange, endpoint)).fetchall()
+    return [row for (result,) in rows for row in json.loads(result)['store_rows']]
+
+
+def get_failed_work_units(connection):
+    """
+    Returns the work units that failed shard_max_attempts times.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the work queue.
+
+    Returns:
+        list: List of (exchange, endpoint, number of pairs, error) tuples.
+    """
+    rows = connection.execute("SELECT exchange, endpoint, pairs, error FROM work_units WHERE status = 'failed' "
+                              "ORDER BY id").fetchall()
+    return [(exchange, endpoint, len(json.loads(pairs)), error) for exchange, endpoint, pairs, error in rows]
@@ -0,0 +1,161 @@
+import numpy as np
+import pandas as pd
+
+HOUR_MS = 60 * 60 * 1000
+DAY_MS = 24 * HOUR_MS
+
+# Columns added by compute_history_stats besides the APY_<N>d columns
+HISTORY_STAT_COLUMNS = ['rate_volatility', 'positive_intervals_pct', 'funding_interval_hours']
+
+
+def create_rate_history(symbols, timestamps, rates):
+    """
+    Creates a ragged funding rate history from rows sorted by symbol and timestamp.
+
+    The history of all symbols is kept in flat numeric arrays. The rates of the i-th symbol are
+    values[offsets[i]:offsets[i + 1]], and their funding times are the same slice of timestamps.
+
+    Args:
+        symbols (np.ndarray): Symbol of every row.
+        timestamps (np.ndarray): Funding time of every row in milliseconds.
+        rates (np.ndarray): Funding rate of every row.
+
+    Returns:
+        dict: Unique symbols, offsets, timestamps and values of the history.
+    """
+    symbols = np.asarray(symbols, dtype=object)
+    starts = np.flatnonzero(np.r_[True, symbols[1:] != symbols[:-1]]) if len(symbols) else np.empty(0, dtype=np.int64)
+    return {'symbols': symbols[starts],
+            'offsets': np.append(starts, len(symbols)).astype(np.int64),
+            'timestamps': np.asarray(timestamps, dtype=np.int64),
+            'values': np.asarray(rates, dtype=np.float64)}
+
+
+def create_rate_history_from_lists(historical_rates):
+    """
+    Creates a ragged history from a column of lists of rates, e.g. the historical_rates column of a snapshot.
+
+    The lists carry no funding times, so the history has no timestamps.
+
+    Args:
+        historical_rates (pd.Series): Column of lists of rates.
+
+    Returns:
+        dict: Offsets and values of the history, one segment per row.
+    """
+    lengths = np.fromiter(map(len, historical_rates), dtype=np.int64, count=len(historical_rates))
+    if len(historical_rates) and all(isinstance(rates, np.ndarray) for rates in historical_rates):
+        # Arrays, e.g. loaded from Parquet or views of a compact snapshot, are copied without Python floats
+        values = np.concatenate([*historical_rates, np.empty(0)]).astype(np.float64, copy=False)
+    else:
+        values = np.fromiter((rate for rates in historical_rates for rate in rates), dtype=np.float64,
+                             count=lengths.sum())
+    return {'symbols': None, 'offsets': np.r_[0, np.cumsum(lengths)], 'timestamps': None, 'values': values}
+
+
+def get_segment_ids(offsets):
+    """
+    Returns the segment number of every value of a ragged history.
+
+    Args:
+        offsets (np.ndarray): Offsets of the history.
+
+    Returns:
+        np.ndarray: Segment number of every value.
+    """
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+
+def sum_segments(history, weights=None, segment_ids=None):
+    """
+    Sums the values of every segment of a ragged history.
+
+    Args:
+        history (dict): Ragged history.
+        weights (np.ndarray, optional): Values to sum instead of the history values, one per history value.
+        segment_ids (np.ndarray, optional): Segment numbers returned by get_segment_ids, to reuse them
+            across several sums of the same history.
+
+    Returns:
+        np.ndarray: Sum of every segment. Empty segments sum to 0.
+    """
+    offsets = history['offsets']
+    values = history['values'] if weights is None else weights
+    if segment_ids is None:
+        segment_ids = get_segment_ids(offsets)
+    return np.bincount(segment_ids, weights=values, minlength=len(offsets) - 1)
+
+
+def get_funding_intervals(history, segment_ids=None):
+    """
+    Returns the funding interval of every symbol as the median time between its funding times.
+
+    The median ignores gaps in the stored history and exchanges that changed the interval for a few fundings.
+
+    Args:
+        history (dict): Ragged history with timestamps.
+        segment_ids (np.ndarray, optional): Segment numbers returned by get_segment_ids.
+
+    Returns:
+        np.ndarray: Funding interval in hours of every symbol, NaN for symbols with fewer than two rates.
+    """
+    offsets, timestamps = history['offsets'], history['timestamps']
+    if segment_ids is None:
+        segment_ids = get_segment_ids(offsets)
+    same_segment = segment_ids[1:] == segment_ids[:-1]
+    gaps = np.diff(timestamps)[same_segment]
+    gap_segments = segment_ids[1:][same_segment]
+    # Sort the gaps of every segment and pick the middle one
+    sorted_gaps = gaps[np.lexsort((gaps, gap_segments))]
+    gap_counts = np.maximum(np.diff(offsets) - 1, 0)
+    gap_offsets = np.r_[0, np.cumsum(gap_counts)[:-1]]
+    intervals = np.full(len(gap_counts), np.nan)
+    has_gaps = gap_counts > 0
+    intervals[has_gaps] = sorted_gaps[gap_offsets[has_gaps] + (gap_counts[has_gaps] - 1) // 2] / HOUR_MS
+    return intervals
+
+
+def compute_history_stats(history, current_time, horizons_days):
+    """
+    Calculates funding statistics of every symbol of a ragged history for several periods at once.
+
+    Every statistic is a segment reduction over the flat arrays, with no loop over symbols:
+    - APY_<N>d: average APY in percent over the past N days. It is annualized over the time the stored
+      rates cover (number of rates times the funding interval), capped at N days, so pairs listed
+      recently or with a short funding interval are not understated.
+    - rate_volatility: standard deviation of the rates in percent over the longest period.
+    - positive_intervals_pct: percentage of fundings with a positive rate over the longest period.
+    - funding_interval_hours: funding interval of the symbol (see get_funding_intervals).
+
+    Args:
+        history (dict): Ragged history with timestamps and fractional rates, e.g. 0.0001 for 0.01%.
+        current_time (int): Current time in milliseconds.
+        horizons_days (list): Periods in days.
+
+    Returns:
+        pd.DataFrame: Statistics indexed by symbol. Without periods there are no statistics, and no columns.
+    """
+    if not horizons_days:
+        return pd.DataFrame(index=history['symbols'])
+    timestamps, values = history['timestamps'], 100 * history['values']
+    segment_ids = get_segment_ids(history['offsets'])
+    intervals = get_funding_intervals(history, segment_ids)
+    stats = {}
+    for days in sorted(horizons_days):
+        in_window = timestamps >= current_time - days * DAY_MS
+        window_values = np.where(in_window, values, 0)
+        window_counts = sum_segments(history, in_window.astype(np.float64), segment_ids)
+        covered_days = np.fmin(days, window_counts * intervals / 24)
+        covered_days = np.where(np.isnan(covered_days) | (covered_days <= 0), days, covered_days)
+        apy = 365 * sum_segments(history, window_values, segment_ids) / covered_days
+        stats[f'APY_{days}d'] = np.where(window_counts > 0, apy, np.nan).round(decimals=2)
+
+    # The loop leaves the window of the longest period
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = sum_segments(history, window_values, segment_ids) / window_counts
+        variance = sum_segments(history, window_values ** 2, segment_ids) / window_counts - mean ** 2
+        stats['rate_volatility'] = np.sqrt(np.maximum(variance, 0)).round(decimals=4)
+        positive_counts = sum_segments(history, (in_window & (values > 0)).astype(np.float64), segment_ids)
+        stats['positive_intervals_pct'] = (100 * positive_counts / window_counts).round(decimals=1)
+    stats['funding_interval_hours'] = intervals.round(decimals=2)
+    return pd.DataFrame(stats, index=history['symbols'])
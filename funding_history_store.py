@@ -0,0 +1,117 @@
+import os
+import sqlite3
+
+import pandas as pd
+from config import CONFIG
+
+
+def open_funding_history_store(path=None):
+    """
+    Opens the local funding history store, creating it if needed.
+
+    Funding rates are kept in an SQLite database, one row per exchange, symbol and funding timestamp.
+    Rows are only ever appended. Every thread must open its own connection.
+
+    Args:
+        path (str, optional): Path to the database file.
+            Defaults to funding_history_store_file in the data directory.
+
+    Returns:
+        sqlite3.Connection: Connection to the funding history store.
+    """
+    path = path or f"{CONFIG['directory']}/{CONFIG['funding_history_store_file']}"
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    connection = sqlite3.connect(path, timeout=30)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("""
+        CREATE TABLE IF NOT EXISTS funding_rates (
+            exchange TEXT NOT NULL,
+            symbol TEXT NOT NULL,
+            timestamp INTEGER NOT NULL,
+            rate REAL NOT NULL,
+            PRIMARY KEY (exchange, symbol, timestamp)
+        ) WITHOUT ROWID""")
+    return connection
+
+
+def get_fetch_start(connection, exchange_id, symbol, start_ms):
+    """
+    Returns the timestamp from which funding rates have to be fetched to bring the store up to date.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the funding history store.
+        exchange_id (str): Exchange id.
+        symbol (str): Trading pair symbol.
+        start_ms (int): Start of the period to backfill if nothing is stored for the symbol yet.
+
+    Returns:
+        int: Timestamp in milliseconds, one millisecond after the stored high-water mark.
+    """
+    row = connection.execute(
+        "SELECT MAX(timestamp) FROM funding_rates WHERE exchange = ? AND symbol = ?",
+        (exchange_id, symbol)).fetchone()
+    last_timestamp = row[0]
+    if last_timestamp is None:
+        return start_ms
+    return max(start_ms, last_timestamp + 1)
+
+
+def save_funding_rates(connection, exchange_id, symbol, history):
+    """
+    Appends funding rates to the store. Rates that are already stored are skipped.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the funding history store.
+        exchange_id (str): Exchange id.
+        symbol (str): Trading pair symbol.
+        history (list): List of (timestamp, rate) tuples.
+    """
+    if not history:
+        return
+    with connection:
+        connection.executemany(
+            "INSERT OR IGNORE INTO funding_rates VALUES (?, ?, ?, ?)",
+            [(exchange_id, symbol, timestamp, rate) for timestamp, rate in history])
+
+
+def load_funding_rates(connection, exchange_id, symbol, start_ms):
+    """
+    Loads stored funding rates of one symbol starting from a timestamp.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the funding history store.
+        exchange_id (str): Exchange id.
+        symbol (str): Trading pair symbol.
+        start_ms (int): Start of the period in milliseconds.
+
+    Returns:
+        list: List of (timestamp, rate) tuples ordered by timestamp.
+    """
+    return connection.execute(
+        "SELECT timestamp, rate FROM funding_rates WHERE exchange = ? AND symbol = ? AND timestamp >= ? "
+        "ORDER BY timestamp",
+        (exchange_id, symbol, start_ms)).fetchall()
+
+
+def load_funding_history(connection, exchange_id, start_ms, end_ms=None):
+    """
+    Loads stored funding rates of all symbols of an exchange starting from a timestamp.
+
+    Rows are ordered by symbol and timestamp, the order of the primary key, so they can be turned
+    into a ragged history (see create_rate_history) without sorting.
+
+    Args:
+        connection (sqlite3.Connection): Connection to the funding history store.
+        exchange_id (str): Exchange id.
+        start_ms (int): Start of the period in milliseconds.
+        end_ms (int, optional): End of the period in milliseconds, inclusive. None loads up to the latest rate.
+
+    Returns:
+        pd.DataFrame: DataFrame with symbol, timestamp and rate columns.
+    """
+    return pd.read_sql_query(
+        "SELECT symbol, timestamp, rate FROM funding_rates WHERE exchange = ? AND timestamp >= ? AND timestamp <= ? "
+        "ORDER BY symbol, timestamp",
+        connection, params=(exchange_id, start_ms, end_ms if end_ms is not None else 2 ** 63 - 1))
@@ -1,7 +1,8 @@
+import argparse
+
 import pandas as pd
 from config import CONFIG
-from fetch_data import fetch_and_save_data
-from analyze_data import analyze_data
+from metrics import export_metrics, stage_timer
 
 # Setting display options for pandas DataFrame
 pd.set_option('display.max_columns', None)  # None means unlimited
@@ -9,23 +10,85 @@ pd.set_option('display.width', None)  # Ensure the display is not truncated hori
 pd.set_option('display.max_colwidth', None)  # Ensure full width of each column is displayed
 
 
-def main():
+def main(command=None):
     """
     Main function to execute the script.
 
     This function checks the configuration parameters and executes the appropriate actions:
     - If fetch_and_save_data is True, it fetches and saves data to files.
     - If analyze_data_from_files is True, it analyzes data from previously saved files.
+    - If daemon_mode is True, it runs the scanner continuously instead.
+    - If backtest_mode is True, it backtests the opportunities of saved snapshots instead.
+
+    The modules of every stage are imported only when the stage runs. Fetching imports ccxt, which takes
+    a long time to load and is not needed to analyze or backtest saved files.
+
+    Request and stage metrics of the run are exported to the metrics folder at the end.
 
     Note: Data should be saved before analysis.
+
+    Args:
+        command (str, optional): 'fetch' or 'analyze' to run only that stage whatever the config says.
+            None runs the stages enabled in the config.
     """
-    if CONFIG['fetch_and_save_data']:
-        fetch_and_save_data()
+    if command is None and CONFIG['daemon_mode']:
+        from scanner_daemon import run_daemon
+        run_daemon()
+        return
 
-    if CONFIG['analyze_data_from_files']:
-        analyze_data()
+    if command is None and CONFIG['backtest_mode']:
+        from backtest import run_backtest
+        with stage_timer('backtest'):
+            run_backtest()
+        export_metrics(f"{CONFIG['directory']}/{CONFIG['backtest_subdirectory']}/metrics")
+        return
 
+    if command == 'fetch' or (command is None and CONFIG['fetch_and_save_data']):
+        from fetch_data import fetch_and_save_data
+        with stage_timer('fetch'):
+            fetch_and_save_data()
 
-if __name__ == '__main__':
-    main()
+    if command == 'analyze' or (command is None and CONFIG['analyze_data_from_files']):
+        from analyze_data import analyze_data
+        with stage_timer('analysis'):
+            analyze_data()
+
+    export_metrics(f"{CONFIG['directory']}/{CONFIG['subdirectory']}/metrics")
+
+
+def parse_arguments(args=None):
+    """
+    Applies the command line options to the config.
+
+    Commands:
+        fetch: Only fetch and save the data.
+        analyze: Only analyze the saved data, without loading ccxt.
+        Without a command, the stages enabled in the config run.
+
+    Options:
+        --resume: Continue an interrupted fetch of the subdirectory (see fetch_resume in the config).
+
+    Args:
+        args (list, optional): Command line arguments. Defaults to sys.argv.
 
+    Returns:
+        str: Command to run, or None to run the stages enabled in the config.
+    """
+    # --resume is accepted before and after the fetch command. Without a default, the fetch command
+    # does not reset an option given before it
+    resume_parser = argparse.ArgumentParser(add_help=False)
+    resume_parser.add_argument('--resume', action='store_true', default=argparse.SUPPRESS,
+                               help="continue an interrupted fetch, fetching only the pairs that are missing")
+    parser = argparse.ArgumentParser(description="Funding rate arbitrage scanner", parents=[resume_parser])
+    commands = parser.add_subparsers(dest='command', metavar='{fetch,analyze}',
+                                     help="stage to run, by default the stages enabled in the config")
+    commands.add_parser('fetch', parents=[resume_parser], help="fetch and save the data")
+    commands.add_parser('analyze', help="analyze the saved data")
+    arguments = parser.parse_args(args)
+    if getattr(arguments, 'resume', False):
+        CONFIG['fetch_resume'] = True
+    return arguments.command
+
+
+if __name__ == '__main__':
+    main(parse_arguments())
@@ -0,0 +1,205 @@
+import asyncio
+import threading
+import time
+
+import ccxt
+import pandas as pd
+from config import CONFIG
+from exchange import (init_stream_exchange, get_funding_rate_stream_method, watch_funding_rates, watch_funding_rate,
+                      get_funding_rate_async, get_funding_rates_async, has_bulk_funding_rates)
+from market_cache import apply_cached_markets
+from utils import split_into_chunks
+
+# Errors after which the websocket connection is opened again. ccxt.pro resubscribes on the next watch call
+STREAM_ERRORS = (ccxt.NetworkError, ccxt.ExchangeError)
+
+
+def create_stream_state(exchange_name, pairs):
+    """
+    Creates the state of the funding rate stream of one exchange.
+
+    Args:
+        exchange_name (str): Name of the exchange.
+        pairs (list): List of perpetual trading pairs to stream.
+
+    Returns:
+        dict: Latest-rate table keyed by pair, its lock, the pairs and counters of the stream.
+    """
+    return {'exchange_name': exchange_name, 'pairs': pairs, 'table': {}, 'lock': threading.Lock(),
+            'source': None, 'updates': 0, 'reconnects': 0}
+
+
+def update_rates_table(stream, rates):
+    """
+    Stores the latest funding rates of some pairs in the table of a stream.
+
+    Args:
+        stream (dict): Stream state created by create_stream_state.
+        rates (dict): Funding rates and next funding times (see parse_funding_rate) keyed by trading pair symbol.
+    """
+    updated = int(time.time() * 1000)
+    with stream['lock']:
+        for pair, rate in rates.items():
+            stream['table'][pair] = {**rate, 'updated': updated}
+        stream['updates'] += len(rates)
+
+
+def get_rates_df(stream):
+    """
+    Returns the latest-rate table of a stream in the format of get_funding_rates_for_pairs.
+
+    Args:
+        stream (dict): Stream state created by create_stream_state.
+
+    Returns:
+        pd.DataFrame: DataFrame with pair, rate and next_funding_time columns, in the order of the stream pairs.
+    """
+    with stream['lock']:
+        table = dict(stream['table'])
+    data = [{'pair': pair, 'rate': table[pair]['rate'], 'next_funding_time': table[pair]['next_funding_time']}
+            for pair in stream['pairs'] if pair in table]
+    return pd.DataFrame(data, columns=['pair', 'rate', 'next_funding_time'])
+
+
+async def run_stream(stream):
+    """
+    Keeps the latest-rate table of one exchange up to date until the task is cancelled.
+
+    The table is seeded with one REST snapshot. Then the websocket stream of the exchange is watched.
+    After a dropped connection the stream is opened and subscribed again with exponential backoff.
+    Exchanges without websocket funding rates, and exchanges whose stream failed stream_max_reconnects
+    times in a row, are polled over REST every stream_rest_poll_seconds instead.
+
+    Args:
+        stream (dict): Stream state created by create_stream_state.
+    """
+    exchange = init_stream_exchange(stream['exchange_name'])
+    apply_cached_markets(exchange)
+    try:
+        await poll_rates(exchange, stream)
+        method = get_funding_rate_stream_method(exchange)
+        if method == 'watchFundingRates':
+            stream['source'] = 'websocket'
+            await watch_with_reconnect(stream, lambda: watch_funding_rates(exchange, stream['pairs']))
+        elif method == 'watchFundingRate':
+            stream['source'] = 'websocket'
+            await asyncio.gather(*(watch_with_reconnect(stream, lambda pair=pair: watch_pair(exchange, pair))
+                                   for pair in stream['pairs']))
+        else:
+            print(f" Funding rates of {exchange.id} are not streamed over websocket, polling REST instead")
+        stream['source'] = 'rest'
+        while True:
+            await asyncio.sleep(CONFIG['stream_rest_poll_seconds'])
+            await poll_rates(exchange, stream)
+    finally:
+        await exchange.close()
+
+
+async def watch_pair(exchange, pair):
+    """
+    Waits for the next funding rate update of one pair and returns it in the format of watch_funding_rates.
+
+    Args:
+        exchange (ccxt.pro.Exchange): Exchange object that supports watchFundingRate.
+        pair (str): Trading pair symbol.
+
+    Returns:
+        dict: Funding rate of the pair keyed by its symbol.
+    """
+    return {pair: await watch_funding_rate(exchange, pair)}
+
+
+async def watch_with_reconnect(stream, watch):
+    """
+    Applies websocket updates to the table of a stream and reconnects when the connection is lost.
+
+    Args:
+        stream (dict): Stream state created by create_stream_state.
+        watch (callable): Coroutine function returning the next updates keyed by trading pair symbol.
+    """
+    failures = 0
+    while failures < CONFIG['stream_max_reconnects']:
+        try:
+            rates = await watch()
+        except STREAM_ERRORS as e:
+            failures += 1
+            stream['reconnects'] += 1
+            backoff = min(CONFIG['retry_max_backoff_seconds'], CONFIG['retry_base_backoff_seconds'] * 2 ** failures)
+            print(f"Error streaming funding rates for {stream['exchange_name']}: {e}. Reconnecting in {backoff}s")
+            await asyncio.sleep(backoff)
+            continue
+        failures = 0
+        update_rates_table(stream, rates)
+    print(f" Funding rate stream of {stream['exchange_name']} failed {failures} times in a row, polling REST instead")
+
+
+async def poll_rates(exchange, stream):
+    """
+    Fetches the current funding rates of all pairs of a stream over REST and stores them in its table.
+
+    Args:
+        exchange (ccxt.pro.Exchange): Exchange object.
+        stream (dict): Stream state created by create_stream_state.
+    """
+    pairs = stream['pairs']
+    if has_bulk_funding_rates(exchange):
+        chunks = split_into_chunks(pairs, CONFIG['funding_rates_chunk_size'])
+        requests = [(get_funding_rates_async, chunk) for chunk in chunks]
+    else:
+        requests = [(get_funding_rate_async, pair) for pair in pairs]
+    semaphore = asyncio.Semaphore(CONFIG['async_max_in_flight'])
+
+    async def fetch(function, argument):
+        async with semaphore:
+            try:
+                rates = await function(exchange, argument)
+            except Exception:
+                return False
+        update_rates_table(stream, rates if isinstance(argument, list) else {argument: rates})
+        return True
+
+    results = await asyncio.gather(*(fetch(function, argument) for function, argument in requests))
+    if not all(results):
+        print(f"Error polling funding rates for {stream['exchange_name']}: {results.count(False)} requests failed")
+
+
+def start_funding_rate_streams(exchange_pairs):
+    """
+    Starts funding rate streams of several exchanges on an event loop in a background thread.
+
+    Args:
+        exchange_pairs (dict): Lists of perpetual trading pairs keyed by exchange name.
+
+    Returns:
+        dict: Stream states keyed by exchange name under 'streams', and the event loop and its tasks under 'runner'.
+            Pass it to stop_funding_rate_streams when the streams are no longer needed.
+    """
+    streams = {exchange_name: create_stream_state(exchange_name, pairs)
+               for exchange_name, pairs in exchange_pairs.items()}
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name='funding-rate-streams', daemon=True).start()
+
+    async def create_tasks():
+        return [asyncio.create_task(run_stream(stream)) for stream in streams.values()]
+
+    tasks = asyncio.run_coroutine_threadsafe(create_tasks(), loop).result()
+    return {'streams': streams, 'runner': {'loop': loop, 'tasks': tasks}}
+
+
+def stop_funding_rate_streams(streams):
+    """
+    Stops the streams started by start_funding_rate_streams, closes their exchange objects and the event loop.
+
+    Args:
+        streams (dict): Value returned by start_funding_rate_streams.
+    """
+    loop, tasks = streams['runner']['loop'], streams['runner']['tasks']
+
+    async def cancel_tasks():
+        for task in tasks:
+            task.cancel()
+        # Cancelled streams end with CancelledError, failed ones with their error
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    asyncio.run_coroutine_threadsafe(cancel_tasks(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
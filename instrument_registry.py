@@ -0,0 +1,161 @@
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Leading '10', '100', '1000', etc. of a base currency that lists the contract in multiples, e.g. 1000PEPE
+MULTIPLIER_PATTERN = re.compile(r'^(10+)(\D.*)$')
+
+# Canonical instruments as (base, quote, settle) tuples and their canonical symbols, indexed by instrument id.
+# Spot instruments have no settle
+instruments = []
+instrument_symbols = []
+instrument_ids = {}
+# Instrument id, spot id and multiplier of every symbol seen so far, keyed by the exchange symbol
+symbols = {}
+# Categorical dtype of all canonical symbols registered so far, shared by the pair columns of compact dataframes
+symbol_dtype = None
+registry_lock = threading.Lock()
+
+
+def parse_symbol(symbol):
+    """
+    Splits a ccxt unified symbol into its canonical parts.
+
+    Args:
+        symbol (str): Symbol such as 'BTC/USDT', 'BTC/USDT:USDT' or '1000PEPE/USDT:USDT'.
+
+    Returns:
+        tuple: Base currency without the multiplier, quote currency, settle currency (None for spot)
+            and contract multiplier, e.g. ('PEPE', 'USDT', 'USDT', 1000).
+    """
+    market, _, settle = symbol.partition(':')
+    base, _, quote = market.partition('/')
+    multiplier = 1
+    match = MULTIPLIER_PATTERN.match(base)
+    if match:
+        multiplier, base = int(match.group(1)), match.group(2)
+    return base, quote, settle or None, multiplier
+
+
+def get_exchange_symbol(pair, multiplier=1, spot=False):
+    """
+    Returns the exchange symbol of a canonical pair, the reverse of parse_symbol.
+
+    Args:
+        pair (str): Canonical symbol, e.g. 'PEPE/USDT:USDT'.
+        multiplier (int): Contract multiplier of the exchange, e.g. 1000 for 1000PEPE.
+        spot (bool): Whether to return the symbol of the spot instrument with the same base and quote.
+
+    Returns:
+        str: Exchange symbol, e.g. '1000PEPE/USDT:USDT', or 'PEPE/USDT' for spot.
+    """
+    market, _, settle = pair.partition(':')
+    if spot:
+        return market
+    if multiplier and multiplier != 1:
+        market = f"{int(multiplier)}{market}"
+    return f"{market}:{settle}" if settle else market
+
+
+def get_instrument_id(base, quote, settle):
+    """
+    Returns the integer id of a canonical instrument, registering it on first use. Must be called with
+    registry_lock held.
+
+    Args:
+        base (str): Base currency without the multiplier.
+        quote (str): Quote currency.
+        settle (str): Settle currency, None for spot instruments.
+
+    Returns:
+        int: Instrument id.
+    """
+    key = (base, quote, settle)
+    if key not in instrument_ids:
+        instrument_ids[key] = len(instruments)
+        instruments.append(key)
+        instrument_symbols.append(f"{base}/{quote}:{settle}" if settle else f"{base}/{quote}")
+    return instrument_ids[key]
+
+
+def register_symbol(symbol):
+    """
+    Maps an exchange symbol to its instrument. Must be called with registry_lock held.
+
+    Args:
+        symbol (str): Exchange symbol.
+
+    Returns:
+        tuple: Instrument id, id of the spot instrument with the same base and quote, and contract multiplier.
+    """
+    if symbol not in symbols:
+        base, quote, settle, multiplier = parse_symbol(symbol)
+        symbols[symbol] = (get_instrument_id(base, quote, settle), get_instrument_id(base, quote, None), multiplier)
+    return symbols[symbol]
+
+
+def get_instrument_columns(symbol_column):
+    """
+    Maps a column of exchange symbols to instrument ids, spot ids, multipliers and canonical symbols.
+
+    Every distinct symbol is parsed once per process. Rows are then mapped with integer indexing.
+
+    Args:
+        symbol_column (pd.Series): Column of exchange symbols.
+
+    Returns:
+        tuple: Arrays of instrument ids, spot ids, contract multipliers and canonical symbols, one value per row.
+    """
+    codes, unique_symbols = pd.factorize(symbol_column)
+    with registry_lock:
+        mapped = np.array([register_symbol(symbol) for symbol in unique_symbols], dtype=np.int64).reshape(-1, 3)
+        canonical = np.array([instrument_symbols[instrument_id] for instrument_id in mapped[:, 0]], dtype=object)
+    return mapped[codes, 0], mapped[codes, 1], mapped[codes, 2], canonical[codes]
+
+
+def get_instrument_symbols(ids):
+    """
+    Returns canonical symbols of instruments, e.g. 'PEPE/USDT:USDT' for the instrument of '1000PEPE/USDT:USDT'.
+
+    Args:
+        ids (array-like): Instrument ids.
+
+    Returns:
+        np.ndarray: Canonical symbols.
+    """
+    with registry_lock:
+        return np.array([instrument_symbols[instrument_id] for instrument_id in ids], dtype=object)
+
+
+def get_symbol_dtype():
+    """
+    Returns a categorical dtype whose categories are the canonical symbols of all instruments, in id order.
+
+    The dtype is rebuilt only after new instruments are registered, so pair columns of all exchanges
+    share it and store only the instrument id as the category code.
+
+    Returns:
+        pd.CategoricalDtype: Dtype of canonical symbols.
+    """
+    global symbol_dtype
+    with registry_lock:
+        if symbol_dtype is None or len(symbol_dtype.categories) != len(instrument_symbols):
+            symbol_dtype = pd.CategoricalDtype(instrument_symbols)
+        return symbol_dtype
+
+
+def add_instrument_columns(df):
+    """
+    Adds instrument_id, spot_id and multiplier columns to a dataframe of exchange symbols
+    and replaces the symbols in the pair column with canonical ones.
+
+    Args:
+        df (pd.DataFrame): Dataframe with exchange symbols in the pair column.
+
+    Returns:
+        pd.DataFrame: The dataframe with the instrument columns.
+    """
+    df['instrument_id'], df['spot_id'], df['multiplier'], df['pair'] = get_instrument_columns(df['pair'])
+    return df
@@ -0,0 +1,282 @@
+import asyncio
+
+import numpy as np
+import pandas as pd
+from config import CONFIG
+from exchange import (init_exchange, init_async_exchange, has_bulk_order_books, get_order_book_async,
+                      get_order_books_async)
+from fetch_data_async import create_request_limits, call_limited
+from instrument_registry import get_exchange_symbol
+from market_cache import get_markets, set_exchange_markets
+
+# Legs of every result as the exchange column and the contract multiplier column, None for spot legs
+RESULT_LEGS = {'perp_perp': {'short': ('short_exchange', 'short_multiplier'),
+                             'long': ('long_exchange', 'long_multiplier')},
+               'spot_perp_positive': {'perp': ('perp_exchange', 'multiplier'), 'spot': ('spot_exchange', None)},
+               'spot_perp_negative': {'perp': ('perp_exchange', 'multiplier'), 'spot': ('spot_exchange', None)}}
+LEG_LIQUIDITY_COLUMNS = ['spread', 'fill_pct', 'effective_spread']
+
+
+def rank_by_liquidity(results):
+    """
+    Re-ranks the best opportunities of every result by their expected net yield after trading costs.
+
+    Only the first liquidity_top_n rows of every result, already above the threshold and sorted best first,
+    are evaluated. The order books of both legs of all of them are fetched at once, concurrently for all
+    exchanges, so the stage adds a few requests per exchange to a run. For every leg, the book is walked
+    on both sides for liquidity_notional, and the effective spread is the cost of entering and leaving
+    the position at that size. Spot legs listed on several exchanges use the book of the most liquid one.
+
+    Columns added to the evaluated rows:
+    - <leg>_spread: Bid-ask spread of the leg in percent of the mid price.
+    - <leg>_fill_pct: Percentage of liquidity_notional the fetched book can fill on the thinner side.
+    - <leg>_effective_spread: Round trip cost of the leg at liquidity_notional in percent. NaN if the book
+      can not fill it.
+    - spot_book_exchange: Spot exchange whose book was used (Spot-Perpetual results).
+    - trading_cost: Sum of the effective spreads of both legs.
+    - expected_funding: Funding collected over liquidity_holding_days at the current rates, in percent.
+    - expected_net_yield: Expected funding minus trading cost. The evaluated rows are sorted by it,
+      rows that can not be filled last. The rows below them keep their order.
+
+    Args:
+        results (dict): Result dataframes returned by find_opportunities.
+
+    Returns:
+        dict: Result dataframes with the evaluated rows re-ranked.
+    """
+    candidates = {name: df.head(CONFIG['liquidity_top_n']).reset_index(drop=True)
+                  for name, df in results.items() if name in RESULT_LEGS and not df.empty}
+    if not candidates:
+        return results
+
+    leg_books = {name: get_leg_books(name, df) for name, df in candidates.items()}
+    requests = {}
+    for legs in leg_books.values():
+        for rows in legs.values():
+            for exchange_name, symbol in (book for books in rows for book in books):
+                requests.setdefault(exchange_name, set()).add(symbol)
+    print(f"-- Sampling {sum(map(len, requests.values()))} order books on {len(requests)} exchanges")
+    liquidity = asyncio.run(get_liquidity(requests))
+
+    ranked = dict(results)
+    for name, df in candidates.items():
+        top = add_liquidity_columns(name, df, leg_books[name], liquidity)
+        ranked[name] = pd.concat([top, results[name].iloc[len(df):]], ignore_index=True)
+    return ranked
+
+
+def get_leg_books(name, df):
+    """
+    Returns the order books to sample for every leg of every row of a result.
+
+    Args:
+        name (str): Result name, e.g. 'perp_perp'.
+        df (pd.DataFrame): Rows of the result.
+
+    Returns:
+        dict: Lists of (exchange, symbol) candidates for every row, keyed by leg. Perpetual legs have
+            one candidate, spot legs one per spot exchange that lists the pair.
+    """
+    pairs = df['pair'].astype(str)
+    legs = {}
+    for leg, (exchange_column, multiplier_column) in RESULT_LEGS[name].items():
+        if multiplier_column is None:
+            # Spot exchanges of Spot-Perpetual opportunities are joined with '/', e.g. 'binance/okx'
+            legs[leg] = [[(exchange_name, get_exchange_symbol(pair, spot=True))
+                          for exchange_name in exchanges.split('/')]
+                         for pair, exchanges in zip(pairs, df[exchange_column].astype(str))]
+        else:
+            legs[leg] = [[(exchange_name, get_exchange_symbol(pair, multiplier))]
+                         for pair, exchange_name, multiplier in zip(pairs, df[exchange_column], df[multiplier_column])]
+    return legs
+
+
+async def get_liquidity(requests):
+    """
+    Fetches the order books of all exchanges concurrently and measures their liquidity.
+
+    Args:
+        requests (dict): Sets of symbols keyed by exchange name.
+
+    Returns:
+        dict: Liquidity of every fetched book (see get_book_liquidity) keyed by (exchange, symbol).
+    """
+    exchange_names = list(requests)
+    books = await asyncio.gather(*(get_exchange_liquidity(exchange_name, sorted(requests[exchange_name]))
+                                   for exchange_name in exchange_names))
+    return {(exchange_name, symbol): book_liquidity
+            for exchange_name, exchange_books in zip(exchange_names, books)
+            for symbol, book_liquidity in exchange_books.items()}
+
+
+async def get_exchange_liquidity(exchange_name, symbols):
+    """
+    Fetches the order books of one exchange and measures their liquidity.
+
+    All books are fetched with one request if the exchange supports fetchOrderBooks, otherwise
+    one request per symbol, limited like the async fetch mode (see create_request_limits).
+
+    Args:
+        exchange_name (str): Name of the exchange.
+        symbols (list): List of symbols.
+
+    Returns:
+        dict: Liquidity of every fetched book keyed by symbol. Books that failed are skipped.
+    """
+    try:
+        # Markets come from the market cache, they tell the contract size of every symbol
+        markets = await asyncio.to_thread(get_markets, init_exchange(exchange_name))
+    except Exception as e:
+        print(f"Error loading markets for {exchange_name}: {e}")
+        return {}
+    exchange = init_async_exchange(exchange_name)
+    set_exchange_markets(exchange, markets)
+    limit = CONFIG['liquidity_order_book_limit']
+    try:
+        books = None
+        if has_bulk_order_books(exchange):
+            try:
+                books = await get_order_books_async(exchange, symbols, limit)
+            except Exception as e:
+                print(f"Error fetching order books in bulk for {exchange_name}, fetching them one by one: {e}")
+        if books is None:
+            limits = create_request_limits(CONFIG['async_max_in_flight'], CONFIG['async_endpoint_limits'])
+
+            async def fetch(symbol):
+                try:
+                    return await call_limited(limits, 'order_book', get_order_book_async, exchange, symbol, limit)
+                except Exception as e:
+                    print(f"Error fetching order book for {symbol} on {exchange_name}: {e}")
+                    return None
+
+            books = dict(zip(symbols, await asyncio.gather(*(fetch(symbol) for symbol in symbols))))
+    finally:
+        await exchange.close()
+
+    liquidity = {}
+    for symbol, book in books.items():
+        market = (exchange.markets or {}).get(symbol) or {}
+        book_liquidity = get_book_liquidity(book, CONFIG['liquidity_notional'], market.get('contractSize') or 1)
+        if book_liquidity is not None:
+            liquidity[symbol] = book_liquidity
+    return liquidity
+
+
+def get_book_liquidity(book, notional, contract_size=1):
+    """
+    Measures the liquidity of an order book for a position of the given size.
+
+    Args:
+        book (dict): Order book with 'bids' and 'asks' as [price, amount] lists, best first.
+        notional (float): Position size in quote currency.
+        contract_size (float): Base currency per unit of amount, e.g. per contract.
+
+    Returns:
+        dict: 'spread', 'fill_pct' and 'effective_spread' (see rank_by_liquidity),
+            or None if a side of the book is empty.
+    """
+    if not book or not book.get('bids') or not book.get('asks'):
+        return None
+    mid = (book['bids'][0][0] + book['asks'][0][0]) / 2
+    bid_price, bid_filled = get_fill_price(book['bids'], notional, contract_size)
+    ask_price, ask_filled = get_fill_price(book['asks'], notional, contract_size)
+    fill_pct = 100 * min(bid_filled, ask_filled) / notional
+    return {'spread': 100 * (book['asks'][0][0] - book['bids'][0][0]) / mid,
+            'fill_pct': min(fill_pct, 100.0),
+            'effective_spread': 100 * (ask_price - bid_price) / mid if fill_pct >= 100 else np.nan}
+
+
+def get_fill_price(levels, notional, contract_size=1):
+    """
+    Walks one side of an order book until the notional is filled.
+
+    Args:
+        levels (list): [price, amount] lists, best first. Extra items of a level are ignored.
+        notional (float): Size to fill in quote currency.
+        contract_size (float): Base currency per unit of amount.
+
+    Returns:
+        tuple: Average fill price and the notional filled, less than requested if the levels are too thin.
+    """
+    levels = np.array([level[:2] for level in levels], dtype=np.float64)
+    prices = levels[:, 0]
+    cumulative = np.cumsum(prices * levels[:, 1] * contract_size)
+    filled = min(cumulative[-1], notional)
+    if filled <= 0:
+        return np.nan, 0.0
+    # Levels before the last one are taken whole, the last one in part
+    last = min(int(np.searchsorted(cumulative, filled)), len(levels) - 1)
+    taken = cumulative[last - 1] if last else 0.0
+    base_amount = levels[:last, 1].sum() * contract_size + (filled - taken) / prices[last]
+    return filled / base_amount, filled
+
+
+def add_liquidity_columns(name, df, leg_books, liquidity):
+    """
+    Adds the liquidity and expected net yield columns to the evaluated rows of a result and sorts them.
+
+    Args:
+        name (str): Result name.
+        df (pd.DataFrame): Evaluated rows.
+        leg_books (dict): Order book candidates of every leg, returned by get_leg_books.
+        liquidity (dict): Liquidity of every fetched book keyed by (exchange, symbol).
+
+    Returns:
+        pd.DataFrame: Rows with the new columns, sorted by expected net yield.
+    """
+    columns = {}
+    for leg, rows in leg_books.items():
+        chosen = [min((book for book in books if book in liquidity), key=lambda book: get_leg_cost(liquidity[book]),
+                      default=None)
+                  for books in rows]
+        for column in LEG_LIQUIDITY_COLUMNS:
+            columns[f'{leg}_{column}'] = [liquidity[book][column] if book else np.nan for book in chosen]
+        if RESULT_LEGS[name][leg][1] is None:
+            columns['spot_book_exchange'] = [book[0] if book else None for book in chosen]
+    df = df.assign(**columns)
+    df['trading_cost'] = sum(df[f'{leg}_effective_spread'] for leg in leg_books)
+    df['expected_funding'] = get_expected_funding(name, df)
+    df['expected_net_yield'] = df['expected_funding'] - df['trading_cost']
+    rounded = [*(f'{leg}_{column}' for leg in leg_books for column in LEG_LIQUIDITY_COLUMNS),
+               'trading_cost', 'expected_funding', 'expected_net_yield']
+    df[rounded] = df[rounded].astype(np.float64).round(decimals=4)
+    return df.sort_values('expected_net_yield', ascending=False, na_position='last', kind='stable')
+
+
+def get_leg_cost(book_liquidity):
+    """
+    Sort key of the books a spot leg can use: the largest fill first, then the lowest effective spread.
+
+    Args:
+        book_liquidity (dict): Liquidity of a book.
+
+    Returns:
+        tuple: Sort key.
+    """
+    effective_spread = book_liquidity['effective_spread']
+    return -book_liquidity['fill_pct'], effective_spread if not np.isnan(effective_spread) else np.inf
+
+
+def get_expected_funding(name, df):
+    """
+    Calculates the funding collected over liquidity_holding_days if the current rates persist.
+
+    Rates are paid once per funding interval. Pairs without a known interval
+    (funding_interval_hours columns, see compute_history_stats) use liquidity_funding_interval_hours.
+
+    Args:
+        name (str): Result name.
+        df (pd.DataFrame): Rows of the result.
+
+    Returns:
+        pd.Series: Expected funding in percent of the position of one leg.
+    """
+    def get_fundings(column):
+        hours = df[column].astype(np.float64) if column in df else pd.Series(np.nan, index=df.index)
+        return CONFIG['liquidity_holding_days'] * 24 / hours.fillna(CONFIG['liquidity_funding_interval_hours'])
+
+    if name == 'perp_perp':
+        return (df['short_rate'] * get_fundings('short_funding_interval_hours')
+                - df['long_rate'] * get_fundings('long_funding_interval_hours'))
+    # Negative rates are collected on a long perpetual leg
+    return df['rate'].abs() * get_fundings('funding_interval_hours')
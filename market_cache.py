@@ -0,0 +1,235 @@
+import json
+import os
+import threading
+import time
+
+from config import CONFIG
+from request_scheduler import scheduled_call
+
+# Markets and the time they were fetched, keyed by exchange id. Shared by all exchange objects of a run
+markets_by_exchange = {}
+# Perpetual and spot trading pairs split from the markets above, keyed by exchange id
+pairs_by_exchange = {}
+# Exchange ids whose markets are being refreshed in a background thread
+refreshing = set()
+cache_lock = threading.Lock()
+exchange_locks = {}
+
+
+def get_markets(exchange):
+    """
+    Returns the markets of an exchange, fetching them only if no fresh copy is cached.
+
+    Markets are looked up in memory first and then in the cache file of the exchange.
+    If the cached markets are older than market_cache_ttl_hours, they are still returned and a refresh
+    is started in a background thread. Markets are fetched in the foreground only when nothing is cached.
+    The markets are also set on the exchange object, so ccxt does not load them again before the first request.
+
+    Args:
+        exchange (ccxt.Exchange): Exchange object.
+
+    Returns:
+        list: List of ccxt market structures.
+    """
+    if not CONFIG['market_cache']:
+        return scheduled_call(exchange, 'markets', exchange.fetch_markets)
+
+    with get_exchange_lock(exchange.id):
+        if exchange.id not in markets_by_exchange:
+            cached = read_cache_file(exchange.id)
+            if cached is None:
+                cached = fetch_markets(exchange)
+            markets_by_exchange[exchange.id] = cached
+        fetched_at, markets = markets_by_exchange[exchange.id]
+
+    if time.time() - fetched_at > CONFIG['market_cache_ttl_hours'] * 3600:
+        start_background_refresh(exchange.id)
+    set_exchange_markets(exchange, markets)
+    return markets
+
+
+def get_trading_pairs(exchange, perpetual=False):
+    """
+    Returns the active perpetual or spot trading pairs of an exchange from the cached markets.
+
+    Both lists are built in one pass over the markets and kept in memory, so an exchange configured
+    as both a perpetual and a spot exchange splits its markets only once.
+
+    Args:
+        exchange (ccxt.Exchange): Exchange object.
+        perpetual (bool): Whether to return perpetual trading pairs.
+
+    Returns:
+        list: List of trading pairs.
+    """
+    markets = get_markets(exchange)
+    with cache_lock:
+        cached = pairs_by_exchange.get(exchange.id)
+        if cached is None or cached[0] is not markets:
+            cached = (markets, split_trading_pairs(markets))
+            pairs_by_exchange[exchange.id] = cached
+    return cached[1]['swap' if perpetual else 'spot']
+
+
+def split_trading_pairs(markets):
+    """
+    Splits active markets into perpetual and spot trading pairs in one pass.
+
+    Args:
+        markets (list): List of ccxt market structures.
+
+    Returns:
+        dict: Lists of trading pairs under 'swap' and 'spot'.
+    """
+    pairs = {'swap': [], 'spot': []}
+    for market in markets:
+        if not market['active']:
+            continue
+        for market_type, market_pairs in pairs.items():
+            if market_type in market['type']:
+                market_pairs.append(market['symbol'])
+    return pairs
+
+
+def set_exchange_markets(exchange, markets):
+    """
+    Sets cached markets on an exchange object that has not loaded its markets yet.
+
+    Args:
+        exchange (ccxt.Exchange): Exchange object, sync or asyncio.
+        markets (list): List of ccxt market structures.
+    """
+    if not getattr(exchange, 'markets', None) and hasattr(exchange, 'set_markets'):
+        exchange.set_markets(markets)
+
+
+def apply_cached_markets(exchange):
+    """
+    Sets the markets already cached in memory on a new exchange object, e.g. the asyncio one used by the async fetch.
+
+    Args:
+        exchange (ccxt.Exchange): Exchange object, sync or asyncio.
+    """
+    with cache_lock:
+        cached = markets_by_exchange.get(exchange.id)
+    if cached:
+        set_exchange_markets(exchange, cached[1])
+
+
+def fetch_markets(exchange):
+    """
+    Fetches the markets of an exchange and writes them to the cache file.
+
+    Args:
+        exchange (ccxt.Exchange): Exchange object.
+
+    Returns:
+        tuple: Fetch time in seconds since the epoch and the list of markets.
+    """
+    fetched_at = time.time()
+    markets = scheduled_call(exchange, 'markets', exchange.fetch_markets)
+    write_cache_file(exchange.id, fetched_at, markets)
+    return fetched_at, markets
+
+
+def start_background_refresh(exchange_id):
+    """
+    Refreshes the cached markets of an exchange in a daemon thread, unless a refresh is already running.
+
+    The refresh uses its own exchange object. The new markets are used by exchange objects created afterwards.
+
+    Args:
+        exchange_id (str): Exchange id.
+    """
+    with cache_lock:
+        if exchange_id in refreshing:
+            return
+        refreshing.add(exchange_id)
+
+    def refresh():
+        # Imported here because exchange.py imports this module
+        from exchange import init_exchange
+        try:
+            cached = fetch_markets(init_exchange(exchange_id))
+            with cache_lock:
+                markets_by_exchange[exchange_id] = cached
+        except Exception as e:
+            print(f"Error refreshing markets for {exchange_id}: {e}")
+        finally:
+            with cache_lock:
+                refreshing.discard(exchange_id)
+
+    threading.Thread(target=refresh, name=f"markets-{exchange_id}", daemon=True).start()
+
+
+def get_exchange_lock(exchange_id):
+    """
+    Returns the lock that makes concurrent callers wait for a single market fetch of an exchange.
+
+    Args:
+        exchange_id (str): Exchange id.
+
+    Returns:
+        threading.Lock: Lock of the exchange.
+    """
+    with cache_lock:
+        return exchange_locks.setdefault(exchange_id, threading.Lock())
+
+
+def get_cache_path(exchange_id):
+    """
+    Returns the path to the market cache file of an exchange.
+
+    Args:
+        exchange_id (str): Exchange id.
+
+    Returns:
+        str: Path to the cache file.
+    """
+    return f"{CONFIG['directory']}/{CONFIG['market_cache_subdirectory']}/markets_{exchange_id}.json"
+
+
+def read_cache_file(exchange_id):
+    """
+    Reads the cached markets of an exchange.
+
+    Args:
+        exchange_id (str): Exchange id.
+
+    Returns:
+        tuple: Fetch time and list of markets, or None if the cache file is missing or unreadable.
+    """
+    path = get_cache_path(exchange_id)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as file:
+            cache = json.load(file)
+        return cache['fetched_at'], cache['markets']
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error reading market cache for {exchange_id}: {e}")
+        return None
+
+
+def write_cache_file(exchange_id, fetched_at, markets):
+    """
+    Writes the markets of an exchange to its cache file.
+
+    The file is written under a temporary name and then renamed, so readers never see a partial file.
+
+    Args:
+        exchange_id (str): Exchange id.
+        fetched_at (float): Fetch time in seconds since the epoch.
+        markets (list): List of ccxt market structures.
+    """
+    path = get_cache_path(exchange_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f"{path}.{threading.get_ident()}.tmp"
+    try:
+        with open(temporary_path, 'w') as file:
+            json.dump({'fetched_at': fetched_at, 'markets': markets}, file)
+        os.replace(temporary_path, path)
+    except (OSError, TypeError, ValueError) as e:
+        print(f"Error writing market cache for {exchange_id}: {e}")
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
@@ -0,0 +1,190 @@
+import bisect
+import contextlib
+import json
+import os
+import threading
+import time
+
+from config import CONFIG
+
+# Upper bounds in seconds of the request latency histogram buckets. The last bucket is unbounded
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+
+# Request metrics keyed by (exchange id, endpoint)
+requests = {}
+# Analysis and fetch stage timings keyed by stage name
+stages = {}
+metrics_lock = threading.Lock()
+
+
+def get_request_metrics(exchange_id, endpoint):
+    """
+    Returns the metrics of an exchange endpoint, creating them on first use. Must be called with metrics_lock held.
+
+    Args:
+        exchange_id (str): Exchange id.
+        endpoint (str): Endpoint name.
+
+    Returns:
+        dict: Request, retry, error and byte counters and the latency histogram of the endpoint.
+    """
+    key = (exchange_id, endpoint)
+    if key not in requests:
+        requests[key] = {'requests': 0, 'retries': 0, 'errors': {}, 'bytes': 0,
+                         'latency_buckets': [0] * (len(LATENCY_BUCKETS) + 1), 'latency_sum': 0.0}
+    return requests[key]
+
+
+def record_request(exchange, endpoint, seconds, error=None):
+    """
+    Records one request to an exchange endpoint.
+
+    The size of the response is read from the last HTTP response of the exchange object. It is exact for
+    sync exchange objects and for asyncio ones as well, because nothing else runs on the event loop between
+    the response being stored and the request returning.
+
+    Args:
+        exchange (ccxt.Exchange): Exchange object.
+        endpoint (str): Endpoint name.
+        seconds (float): Duration of the request.
+        error (Exception, optional): Error raised by the request.
+    """
+    if not CONFIG['metrics']:
+        return
+    response = getattr(exchange, 'last_http_response', None) if error is None else None
+    with metrics_lock:
+        metrics = get_request_metrics(exchange.id, endpoint)
+        metrics['requests'] += 1
+        metrics['latency_buckets'][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        metrics['latency_sum'] += seconds
+        if error is not None:
+            error_type = type(error).__name__
+            metrics['errors'][error_type] = metrics['errors'].get(error_type, 0) + 1
+        elif response:
+            metrics['bytes'] += len(response)
+
+
+def record_retry(exchange, endpoint):
+    """
+    Records a retry of a failed request to an exchange endpoint.
+
+    Args:
+        exchange (ccxt.Exchange): Exchange object.
+        endpoint (str): Endpoint name.
+    """
+    if not CONFIG['metrics']:
+        return
+    with metrics_lock:
+        get_request_metrics(exchange.id, endpoint)['retries'] += 1
+
+
+@contextlib.contextmanager
+def stage_timer(stage):
+    """
+    Measures the duration of a stage of the scanner, e.g. loading files or one kind of analysis.
+
+    Args:
+        stage (str): Stage name.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        if CONFIG['metrics']:
+            with metrics_lock:
+                metrics = stages.setdefault(stage, {'runs': 0, 'last_seconds': 0.0, 'total_seconds': 0.0})
+                metrics['runs'] += 1
+                metrics['last_seconds'] = seconds
+                metrics['total_seconds'] += seconds
+
+
+def get_metrics_snapshot():
+    """
+    Returns a copy of all metrics that can be serialized to JSON.
+
+    Returns:
+        dict: Request metrics per exchange and endpoint, and stage timings.
+    """
+    with metrics_lock:
+        request_metrics = [{'exchange': exchange_id, 'endpoint': endpoint, **metrics,
+                            'errors': dict(metrics['errors']), 'latency_buckets': list(metrics['latency_buckets'])}
+                           for (exchange_id, endpoint), metrics in sorted(requests.items())]
+        stage_metrics = {stage: dict(metrics) for stage, metrics in stages.items()}
+    return {'latency_bucket_bounds': LATENCY_BUCKETS, 'requests': request_metrics, 'stages': stage_metrics}
+
+
+def format_prometheus(snapshot):
+    """
+    Formats a metrics snapshot in the Prometheus text exposition format.
+
+    Args:
+        snapshot (dict): Snapshot returned by get_metrics_snapshot.
+
+    Returns:
+        str: Metrics text, e.g. for the textfile collector of the node exporter.
+    """
+    lines = []
+
+    def add_metric(name, metric_type, description, samples, suffix=''):
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for labels, value in samples:
+            label_text = ','.join(f'{key}="{label}"' for key, label in labels.items())
+            lines.append(f"{name}{suffix}{{{label_text}}} {value}")
+
+    request_metrics = snapshot['requests']
+    histogram_samples = []
+    for metrics in request_metrics:
+        labels = {'exchange': metrics['exchange'], 'endpoint': metrics['endpoint']}
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ['+Inf'], metrics['latency_buckets']):
+            cumulative += count
+            histogram_samples.append(({**labels, 'le': bound}, cumulative))
+    # Sum and count series of a histogram share its HELP and TYPE lines
+    add_metric('scanner_request_duration_seconds', 'histogram', "Duration of requests to exchanges.",
+               histogram_samples, suffix='_bucket')
+    lines.extend(f'scanner_request_duration_seconds_sum{{exchange="{metrics["exchange"]}",'
+                 f'endpoint="{metrics["endpoint"]}"}} {metrics["latency_sum"]}' for metrics in request_metrics)
+    lines.extend(f'scanner_request_duration_seconds_count{{exchange="{metrics["exchange"]}",'
+                 f'endpoint="{metrics["endpoint"]}"}} {metrics["requests"]}' for metrics in request_metrics)
+
+    add_metric('scanner_requests_total', 'counter', "Requests to exchanges, including retries.",
+               [({'exchange': m['exchange'], 'endpoint': m['endpoint']}, m['requests']) for m in request_metrics])
+    add_metric('scanner_request_retries_total', 'counter', "Retries of failed requests.",
+               [({'exchange': m['exchange'], 'endpoint': m['endpoint']}, m['retries']) for m in request_metrics])
+    add_metric('scanner_request_errors_total', 'counter', "Failed requests by error type.",
+               [({'exchange': m['exchange'], 'endpoint': m['endpoint'], 'error': error}, count)
+                for m in request_metrics for error, count in sorted(m['errors'].items())])
+    add_metric('scanner_response_bytes_total', 'counter', "Size of response bodies.",
+               [({'exchange': m['exchange'], 'endpoint': m['endpoint']}, m['bytes']) for m in request_metrics])
+    add_metric('scanner_stage_last_duration_seconds', 'gauge', "Duration of the last run of a scanner stage.",
+               [({'stage': stage}, m['last_seconds']) for stage, m in sorted(snapshot['stages'].items())])
+    add_metric('scanner_stage_duration_seconds_total', 'counter', "Total duration of all runs of a scanner stage.",
+               [({'stage': stage}, m['total_seconds']) for stage, m in sorted(snapshot['stages'].items())])
+    add_metric('scanner_stage_runs_total', 'counter', "Runs of a scanner stage.",
+               [({'stage': stage}, m['runs']) for stage, m in sorted(snapshot['stages'].items())])
+    return '\n'.join(lines) + '\n'
+
+
+def export_metrics(directory_metrics):
+    """
+    Writes all metrics to metrics.json and metrics.prom in a directory.
+
+    The files are written under temporary names and then renamed, so readers such as the
+    Prometheus textfile collector never see a partial file.
+
+    Args:
+        directory_metrics (str): Directory to save the files.
+    """
+    if not CONFIG['metrics']:
+        return
+    if not os.path.exists(directory_metrics):
+        os.makedirs(directory_metrics)
+    snapshot = get_metrics_snapshot()
+    for file_name, content in [('metrics.json', json.dumps(snapshot, indent=2)),
+                               ('metrics.prom', format_prometheus(snapshot))]:
+        path = f"{directory_metrics}/{file_name}"
+        with open(f"{path}.tmp", 'w') as file:
+            file.write(content)
+        os.replace(f"{path}.tmp", path)
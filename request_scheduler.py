@@ -0,0 +1,259 @@
+import asyncio
+import random
+import threading
+import time
+import weakref
+
+import ccxt
+from config import CONFIG
+from metrics import record_request, record_retry
+
+# Errors after which a request is retried. RateLimitExceeded and DDoSProtection are subclasses of NetworkError
+RETRYABLE_ERRORS = (ccxt.RateLimitExceeded, ccxt.DDoSProtection, ccxt.NetworkError)
+# Errors that mean the exchange wants fewer requests
+THROTTLING_ERRORS = (ccxt.RateLimitExceeded, ccxt.DDoSProtection)
+# The request rate is never lowered below this share of the exchange rate limit
+MIN_RATE_FACTOR = 0.125
+
+schedulers = weakref.WeakKeyDictionary()
+schedulers_lock = threading.Lock()
+
+
+class TokenBucket:
+    """
+    Token bucket that paces requests to an exchange.
+
+    Tokens are refilled at the current rate up to the capacity. A request takes as many tokens as its weight
+    and waits if the bucket does not have them. The rate is halved on throttling errors and recovers
+    slowly on successful requests.
+
+    Args:
+        rate (float): Number of tokens refilled per second.
+        capacity (float): Maximum number of tokens, i.e. the allowed burst of requests.
+    """
+
+    def __init__(self, rate, capacity):
+        self.base_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self, weight):
+        """
+        Takes tokens for a request and returns how long to wait before sending it.
+
+        Tokens may go below zero, so concurrent requests queue up behind each other.
+
+        Args:
+            weight (float): Number of tokens the request costs.
+
+        Returns:
+            float: Number of seconds to wait.
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= weight
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def slow_down(self):
+        """
+        Halves the refill rate after a throttling error.
+        """
+        with self.lock:
+            self.rate = max(self.base_rate * MIN_RATE_FACTOR, self.rate / 2)
+
+    def speed_up(self):
+        """
+        Raises the refill rate by 5% of the exchange rate limit after a successful request.
+        """
+        with self.lock:
+            self.rate = min(self.base_rate, self.rate + self.base_rate * 0.05)
+
+
+class RequestScheduler:
+    """
+    Paces and retries the requests of one exchange object.
+
+    Args:
+        exchange (ccxt.Exchange): Exchange object. Its rateLimit (milliseconds between requests) seeds the bucket.
+    """
+
+    def __init__(self, exchange):
+        self.exchange_id = exchange.id
+        self.bucket = TokenBucket(rate=1000 / (exchange.rateLimit or 100), capacity=CONFIG['rate_limit_burst'])
+        self.retries_left = CONFIG['max_retries_per_run']
+        self.retries = 0
+        self.lock = threading.Lock()
+
+    def take_retry(self):
+        """
+        Takes one retry from the budget of the run.
+
+        Returns:
+            bool: False if the budget is spent.
+        """
+        with self.lock:
+            if self.retries_left <= 0:
+                return False
+            self.retries_left -= 1
+            self.retries += 1
+            return True
+
+
+def get_scheduler(exchange):
+    """
+    Returns the request scheduler of an exchange object, creating it on first use.
+
+    Args:
+        exchange (ccxt.Exchange): Exchange object.
+
+    Returns:
+        RequestScheduler: Scheduler of the exchange object.
+    """
+    with schedulers_lock:
+        if exchange not in schedulers:
+            schedulers[exchange] = RequestScheduler(exchange)
+        return schedulers[exchange]
+
+
+def get_backoff_seconds(attempt):
+    """
+    Returns the exponential backoff with jitter before a retry.
+
+    Args:
+        attempt (int): Number of the failed attempt, starting from 0.
+
+    Returns:
+        float: Number of seconds to wait.
+    """
+    backoff = min(CONFIG['retry_max_backoff_seconds'], CONFIG['retry_base_backoff_seconds'] * 2 ** attempt)
+    return backoff * random.uniform(0.5, 1)
+
+
+def handle_error(scheduler, error, attempt):
+    """
+    Decides whether a failed request is retried.
+
+    Args:
+        scheduler (RequestScheduler): Scheduler of the exchange.
+        error (Exception): Error raised by the request.
+        attempt (int): Number of the failed attempt, starting from 0.
+
+    Returns:
+        bool: True if the request should be retried.
+    """
+    if isinstance(error, THROTTLING_ERRORS):
+        scheduler.bucket.slow_down()
+    return attempt < CONFIG['max_retries_per_request'] and scheduler.take_retry()
+
+
+def timed_call(exchange, endpoint, function, *args, **kwargs):
+    """
+    Calls an exchange method and records its duration, response size and error in the metrics.
+
+    Args:
+        exchange (ccxt.Exchange): Exchange object.
+        endpoint (str): Endpoint name.
+        function (callable): Exchange method to call.
+
+    Returns:
+        The result of the method.
+    """
+    start = time.perf_counter()
+    try:
+        result = function(*args, **kwargs)
+    except Exception as e:
+        record_request(exchange, endpoint, time.perf_counter() - start, e)
+        raise
+    record_request(exchange, endpoint, time.perf_counter() - start)
+    return result
+
+
+async def timed_call_async(exchange, endpoint, function, *args, **kwargs):
+    """
+    Asyncio version of timed_call for asyncio exchange objects.
+
+    Args:
+        exchange (ccxt.async_support.Exchange): Asyncio exchange object.
+        endpoint (str): Endpoint name.
+        function (callable): Coroutine exchange method to call.
+
+    Returns:
+        The result of the method.
+    """
+    start = time.perf_counter()
+    try:
+        result = await function(*args, **kwargs)
+    except Exception as e:
+        record_request(exchange, endpoint, time.perf_counter() - start, e)
+        raise
+    record_request(exchange, endpoint, time.perf_counter() - start)
+    return result
+
+
+def scheduled_call(exchange, endpoint, function, *args, **kwargs):
+    """
+    Calls an exchange method when the rate limit allows it and retries it on network and throttling errors.
+
+    Args:
+        exchange (ccxt.Exchange): Exchange object.
+        endpoint (str): Endpoint name used to look up the request weight in endpoint_weights.
+        function (callable): Exchange method to call.
+
+    Returns:
+        The result of the method.
+    """
+    if not CONFIG['request_scheduler']:
+        return timed_call(exchange, endpoint, function, *args, **kwargs)
+    scheduler = get_scheduler(exchange)
+    weight = CONFIG['endpoint_weights'].get(endpoint, 1)
+    attempt = 0
+    while True:
+        time.sleep(scheduler.bucket.reserve(weight))
+        try:
+            result = timed_call(exchange, endpoint, function, *args, **kwargs)
+        except RETRYABLE_ERRORS as e:
+            if not handle_error(scheduler, e, attempt):
+                raise
+            record_retry(exchange, endpoint)
+            time.sleep(get_backoff_seconds(attempt))
+            attempt += 1
+            continue
+        scheduler.bucket.speed_up()
+        return result
+
+
+async def scheduled_call_async(exchange, endpoint, function, *args, **kwargs):
+    """
+    Asyncio version of scheduled_call for asyncio exchange objects.
+
+    Args:
+        exchange (ccxt.async_support.Exchange): Asyncio exchange object.
+        endpoint (str): Endpoint name used to look up the request weight in endpoint_weights.
+        function (callable): Coroutine exchange method to call.
+
+    Returns:
+        The result of the method.
+    """
+    if not CONFIG['request_scheduler']:
+        return await timed_call_async(exchange, endpoint, function, *args, **kwargs)
+    scheduler = get_scheduler(exchange)
+    weight = CONFIG['endpoint_weights'].get(endpoint, 1)
+    attempt = 0
+    while True:
+        await asyncio.sleep(scheduler.bucket.reserve(weight))
+        try:
+            result = await timed_call_async(exchange, endpoint, function, *args, **kwargs)
+        except RETRYABLE_ERRORS as e:
+            if not handle_error(scheduler, e, attempt):
+                raise
+            record_retry(exchange, endpoint)
+            await asyncio.sleep(get_backoff_seconds(attempt))
+            attempt += 1
+            continue
+        scheduler.bucket.speed_up()
+        return result
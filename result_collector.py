@@ -0,0 +1,118 @@
+import os
+
+import pandas as pd
+from utils import array_cells_to_lists
+
+
+class ResultCollector:
+    """
+    Collects the opportunities of one analysis output chunk by chunk, as the analysis produces them.
+
+    Without top_k every chunk is kept and sorted once at the end. With top_k only the best top_k rows seen
+    so far are kept: each chunk is merged with them by partial selection (nlargest or nsmallest), so memory
+    stays bounded however many opportunities are found. With a stream path, every chunk is also appended to
+    a JSONL or CSV file as soon as it is produced, in the order it was found.
+
+    Args:
+        sort_column (str): Column to rank the opportunities by.
+        ascending (bool): Whether lower values are better.
+        top_k (int, optional): Number of best rows to keep. None keeps all rows.
+        unique_column (str, optional): Keep only the best row of every value of this column, e.g. 'pair'.
+        stream_path (str, optional): Path to a .jsonl or .csv file to stream every chunk to.
+    """
+
+    def __init__(self, sort_column, ascending=False, top_k=None, unique_column=None, stream_path=None):
+        self.sort_column = sort_column
+        self.ascending = ascending
+        self.top_k = top_k
+        self.unique_column = unique_column
+        self.stream_path = stream_path
+        self.chunks = []
+        self.columns = []
+        self.rows = 0
+        if stream_path:
+            directory = os.path.dirname(stream_path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            open(stream_path, 'w').close()
+
+    def add(self, df):
+        """
+        Adds a chunk of opportunities.
+
+        Args:
+            df (pd.DataFrame): Opportunities with the columns of the output.
+        """
+        self.columns = df.columns
+        if df.empty:
+            return
+        if self.stream_path:
+            self.write_chunk(df)
+        self.rows += len(df)
+        if self.top_k:
+            self.chunks = [self.select_best(pd.concat([*self.chunks, df], ignore_index=True))]
+        else:
+            self.chunks.append(df)
+
+    def select_best(self, df):
+        """
+        Selects the best top_k rows of a dataframe without sorting it.
+
+        Args:
+            df (pd.DataFrame): Opportunities.
+
+        Returns:
+            pd.DataFrame: At most top_k rows, in no particular order.
+        """
+        if self.unique_column:
+            df = self.drop_worse_duplicates(df)
+        if self.ascending:
+            return df.nsmallest(self.top_k, self.sort_column)
+        return df.nlargest(self.top_k, self.sort_column)
+
+    def drop_worse_duplicates(self, df):
+        """
+        Keeps only the best row of every value of the unique column.
+
+        Args:
+            df (pd.DataFrame): Opportunities.
+
+        Returns:
+            pd.DataFrame: Opportunities with unique values in the unique column.
+        """
+        df = df.reset_index(drop=True)
+        grouped = df.groupby(self.unique_column, sort=False, observed=True)[self.sort_column]
+        return df.loc[grouped.idxmin() if self.ascending else grouped.idxmax()]
+
+    def write_chunk(self, df):
+        """
+        Appends a chunk to the stream file.
+
+        Args:
+            df (pd.DataFrame): Opportunities.
+        """
+        try:
+            if self.stream_path.endswith('.jsonl'):
+                lines = df.to_json(orient='records', lines=True)
+                with open(self.stream_path, 'a') as file:
+                    # Older pandas versions do not end the last line
+                    file.write(lines if lines.endswith('\n') else lines + '\n')
+            else:
+                array_cells_to_lists(df).to_csv(self.stream_path, mode='a', header=self.rows == 0, index=False)
+        except (OSError, ValueError) as e:
+            print(f"Error: Error occurred while streaming results to {self.stream_path}: {e}")
+
+    def result(self):
+        """
+        Returns the collected opportunities, best first.
+
+        Returns:
+            pd.DataFrame: Sorted opportunities, or an empty dataframe if none were added.
+        """
+        if not self.chunks:
+            return pd.DataFrame(columns=self.columns)
+        df = pd.concat(self.chunks, ignore_index=True)
+        df = df.sort_values(by=self.sort_column, ascending=self.ascending, ignore_index=True)
+        if self.unique_column:
+            df = df.drop_duplicates(subset=self.unique_column, ignore_index=True)
+        return df
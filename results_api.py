@@ -0,0 +1,259 @@
+import datetime
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+from config import CONFIG
+
+# Leg columns of every result and the side of the position taken on them
+RESULT_LEG_COLUMNS = {'perp_perp': {'short_exchange': 'short', 'long_exchange': 'long'},
+                      'spot_perp_positive': {'perp_exchange': 'short', 'spot_exchange': 'spot'},
+                      'spot_perp_negative': {'perp_exchange': 'long', 'spot_exchange': 'spot'}}
+SIDES = ['short', 'long', 'spot']
+
+# Latest published results. The whole state is replaced at once, so a request always reads one version
+published = None
+publish_lock = threading.Lock()
+
+
+def publish_results(results):
+    """
+    Publishes the results of an analysis to the API, replacing the previous ones at once.
+
+    Every result is serialized to one JSON document per row and indexed by pair and by exchange and side
+    ahead of time, so queries only intersect the row positions of the index entries and join the rows
+    they select. Rows keep the order of the result, best first.
+
+    Args:
+        results (dict): Result dataframes returned by find_opportunities.
+    """
+    global published
+    entries = {name: create_result_entry(name, df) for name, df in results.items()}
+    updated = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')
+    etag = hashlib.blake2b(''.join(entry['etag'] for entry in entries.values()).encode(), digest_size=16).hexdigest()
+    with publish_lock:
+        published = {'results': entries, 'updated': updated, 'etag': f'"{etag}"'}
+
+
+def create_result_entry(name, df):
+    """
+    Serializes and indexes one result.
+
+    Args:
+        name (str): Result name, e.g. 'perp_perp'.
+        df (pd.DataFrame): Result dataframe sorted best first.
+
+    Returns:
+        dict: JSON rows, pair index, exchange index keyed by (exchange, side), number of rows and ETag.
+    """
+    df = df.reset_index(drop=True)
+    rows = df.to_json(orient='records', lines=True).splitlines() if not df.empty else []
+    exchange_index = {}
+    for column, side in RESULT_LEG_COLUMNS.get(name, {}).items():
+        if column not in df:
+            continue
+        # Spot exchanges of Spot-Perpetual opportunities are joined with '/', e.g. 'binance/okx'
+        exchanges = df[column].astype(object).str.split('/').explode() if side == 'spot' else df[column]
+        for exchange, positions in create_index(exchanges).items():
+            exchange_index[(exchange, side)] = positions
+    etag = hashlib.blake2b('\n'.join(rows).encode(), digest_size=16).hexdigest()
+    return {'rows': rows,
+            'pair_index': create_index(df['pair']) if 'pair' in df else {},
+            'exchange_index': exchange_index,
+            'count': len(rows),
+            'etag': f'"{etag}"'}
+
+
+def create_index(values):
+    """
+    Groups row positions by value.
+
+    Args:
+        values (pd.Series): Value of every row. A row may appear several times with a repeated index.
+
+    Returns:
+        dict: Sorted unique row positions keyed by value.
+    """
+    positions = values.index.to_numpy(dtype=np.int64)
+    codes, uniques = pd.factorize(values.to_numpy())
+    order = np.argsort(codes, kind='stable')
+    codes, positions = codes[order], positions[order]
+    # Missing values have code -1 and are sorted before the first group
+    bounds = np.searchsorted(codes, np.arange(len(uniques) + 1))
+    return {value: np.unique(positions[start:end]) for value, start, end in zip(uniques, bounds[:-1], bounds[1:])}
+
+
+def query_result(entry, pair=None, exchange=None, side=None, limit=None):
+    """
+    Selects the rows of a result that match all given filters.
+
+    Args:
+        entry (dict): Result entry created by create_result_entry.
+        pair (str, optional): Canonical pair, e.g. 'BTC/USDT:USDT'.
+        exchange (str, optional): Exchange on any leg, or on the leg of the given side.
+        side (str, optional): 'short', 'long' or 'spot'. Alone it selects rows with a leg of that side.
+        limit (int, optional): Maximum number of rows, the best ones first.
+
+    Returns:
+        list: JSON documents of the selected rows.
+    """
+    selected = None
+    empty = np.empty(0, dtype=np.int64)
+    if pair is not None:
+        selected = entry['pair_index'].get(pair, empty)
+    if exchange is not None or side is not None:
+        legs = [positions for (leg_exchange, leg_side), positions in entry['exchange_index'].items()
+                if exchange in (None, leg_exchange) and side in (None, leg_side)]
+        positions = np.unique(np.concatenate(legs)) if legs else empty
+        selected = positions if selected is None else np.intersect1d(selected, positions, assume_unique=True)
+    rows = entry['rows']
+    if selected is None:
+        return rows[:limit]
+    return [rows[position] for position in selected[:limit]]
+
+
+class ResultsRequestHandler(BaseHTTPRequestHandler):
+    """
+    Answers the API requests:
+    - GET /results: names, number of rows and ETags of the published results.
+    - GET /results/<name>?pair=&exchange=&side=&limit=: rows of a result matching the filters, best first.
+
+    Responses carry the ETag of the published version. A request with a matching If-None-Match header
+    is answered with 304 Not Modified without selecting or sending any rows.
+    """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        state = published
+        if state is None:
+            self.send_json(503, '{"error": "No results published yet"}')
+            return
+        parts = url.path.strip('/').split('/')
+        if parts == ['results']:
+            etag = state['etag']
+            if self.is_not_modified(etag):
+                return
+            summary = {'updated': state['updated'],
+                       'results': {name: {'rows': entry['count'], 'etag': entry['etag']}
+                                   for name, entry in state['results'].items()}}
+            self.send_json(200, json.dumps(summary), etag)
+        elif len(parts) == 2 and parts[0] == 'results' and parts[1] in state['results']:
+            entry = state['results'][parts[1]]
+            try:
+                filters = parse_query(url.query)
+            except ValueError as e:
+                self.send_json(400, json.dumps({'error': str(e)}))
+                return
+            if self.is_not_modified(entry['etag']):
+                return
+            rows = query_result(entry, **filters)
+            self.send_json(200, f"[{','.join(rows)}]", entry['etag'])
+        else:
+            self.send_json(404, '{"error": "Not found"}')
+
+    def is_not_modified(self, etag):
+        """
+        Answers with 304 Not Modified if the client already has the current version.
+
+        Args:
+            etag (str): ETag of the current version.
+
+        Returns:
+            bool: Whether the request was answered.
+        """
+        if_none_match = self.headers.get('If-None-Match')
+        if not if_none_match:
+            return False
+        tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+        if etag not in tags and '*' not in tags:
+            return False
+        self.send_response(304)
+        self.send_header('ETag', etag)
+        self.end_headers()
+        return True
+
+    def send_json(self, status, body, etag=None):
+        """
+        Sends a JSON response.
+
+        Args:
+            status (int): HTTP status code.
+            body (str): JSON document.
+            etag (str, optional): ETag of the response.
+        """
+        content = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        if etag:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        # Clients poll often, requests are not logged
+        pass
+
+
+def parse_query(query):
+    """
+    Parses the filters of a result query.
+
+    Args:
+        query (str): Query string of the request URL.
+
+    Returns:
+        dict: Keyword arguments of query_result.
+
+    Raises:
+        ValueError: If a filter is unknown or has an invalid value.
+    """
+    params = {key: values[-1] for key, values in parse_qs(query).items()}
+    unknown = set(params) - {'pair', 'exchange', 'side', 'limit'}
+    if unknown:
+        raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+    if 'side' in params and params['side'] not in SIDES:
+        raise ValueError(f"side must be one of: {', '.join(SIDES)}")
+    limit = params.get('limit', CONFIG['api_default_limit'])
+    try:
+        limit = int(limit) if limit is not None else None
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if limit is not None and limit < 0:
+        raise ValueError("limit must not be negative")
+    return {'pair': params.get('pair'), 'exchange': params.get('exchange'), 'side': params.get('side'),
+            'limit': limit}
+
+
+def start_api_server():
+    """
+    Starts the API server on api_host and api_port in a background thread.
+
+    Returns:
+        ThreadingHTTPServer: Running server, or None if it could not be started.
+    """
+    try:
+        server = ThreadingHTTPServer((CONFIG['api_host'], CONFIG['api_port']), ResultsRequestHandler)
+    except OSError as e:
+        print(f"Error starting the API server on {CONFIG['api_host']}:{CONFIG['api_port']}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='results_api', daemon=True).start()
+    print(f"- API server listening on http://{CONFIG['api_host']}:{server.server_address[1]}/results")
+    return server
+
+
+def stop_api_server(server):
+    """
+    Stops the API server.
+
+    Args:
+        server (ThreadingHTTPServer): Server returned by start_api_server.
+    """
+    server.shutdown()
+    server.server_close()
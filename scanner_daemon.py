@@ -0,0 +1,266 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+from analyze_data import find_opportunities, prepare_perpetual_data_df, save_results
+from config import CONFIG
+from exchange import init_exchange, get_all_trading_pairs
+from funding_rate_stream import get_rates_df, start_funding_rate_streams, stop_funding_rate_streams
+from liquidity import rank_by_liquidity
+from metrics import export_metrics, stage_timer
+from results_api import publish_results, start_api_server, stop_api_server
+from spot_index import build_spot_index
+from fetch_data import (get_funding_rates_for_pairs, get_historical_funding_rates_for_pairs, get_daily_amplitude,
+                        get_spot_pairs, merge_perpetual_data)
+
+REFRESH_TASKS = ['rates', 'history', 'amplitude']
+# Tasks due within this many seconds run in the same round, so close refreshes share one analysis
+DUE_TOLERANCE_SECONDS = 1.0
+
+
+def run_daemon(max_cycles=None, on_results=None):
+    """
+    Runs the scanner continuously and keeps the opportunities up to date.
+
+    Exchange objects and their markets are loaded once and kept for the whole run.
+    Current rates, historical rates and daily amplitudes of every perpetual exchange are refreshed
+    on their own schedules from daemon_refresh_intervals. Rate and history refreshes are also moved
+    to just before and just after the next funding time of the exchange. After every round of
+    refreshes the analysis runs again in memory and the metrics files are updated.
+
+    If funding_rate_source is 'stream', current rates are read from latest-rate tables that are kept
+    up to date by websocket streams (see funding_rate_stream.py) instead of being fetched over REST.
+    If api_server is enabled, the results of every analysis are also published to the HTTP API (see results_api.py).
+
+    Args:
+        max_cycles (int, optional): Number of refresh rounds after which the daemon stops. None means run forever.
+        on_results (callable, optional): Function called with the result dataframes after every analysis.
+    """
+    print(f"- Scanner daemon started")
+    directory_result = f"{CONFIG['directory']}/{CONFIG['daemon_subdirectory']}/result"
+    directory_metrics = f"{CONFIG['directory']}/{CONFIG['daemon_subdirectory']}/metrics"
+    perpetual_states = [create_exchange_state(exchange_name) for exchange_name in CONFIG['perpetual_exchanges']]
+    perpetual_states = [state for state in perpetual_states if state['pairs']]
+    if not perpetual_states:
+        print(f"- Exiting: No perpetual trading pairs found on any of the perpetual exchanges.")
+        return
+
+    streams = None
+    if CONFIG['funding_rate_source'] == 'stream':
+        streams = start_funding_rate_streams({state['exchange'].id: state['pairs'] for state in perpetual_states})
+        for state in perpetual_states:
+            state['stream'] = streams['streams'][state['exchange'].id]
+
+    spot_index = None
+    if CONFIG['get_spot_perp_opportunities']:
+        spot_data = {exchange_name: get_spot_pairs(init_exchange(exchange_name))
+                     for exchange_name in CONFIG['spot_exchanges']}
+        spot_index = build_spot_index(spot_data)
+
+    api_server = start_api_server() if CONFIG['api_server'] else None
+
+    cycles = 0
+    try:
+        while max_cycles is None or cycles < max_cycles:
+            now = time.time()
+            due_tasks = [(state, task) for state in perpetual_states for task in REFRESH_TASKS
+                         if state['next_refresh'][task] <= now + DUE_TOLERANCE_SECONDS]
+            if due_tasks:
+                with stage_timer('daemon_refresh'):
+                    run_refresh_tasks(due_tasks)
+                with stage_timer('analysis'):
+                    results = analyze_in_memory(perpetual_states, spot_index,
+                                                directory_result if CONFIG['daemon_save_results'] else None)
+                if CONFIG['liquidity_ranking'] and results:
+                    with stage_timer('analysis_liquidity'):
+                        results = rank_by_liquidity(results)
+                print_results_summary(results)
+                if api_server:
+                    publish_results(results)
+                if CONFIG['daemon_save_results']:
+                    save_results(results, directory_result)
+                if on_results:
+                    on_results(results)
+                export_metrics(directory_metrics)
+                cycles += 1
+
+            next_refresh = min(state['next_refresh'][task] for state in perpetual_states for task in REFRESH_TASKS)
+            time.sleep(max(0.0, next_refresh - time.time()))
+    finally:
+        if streams:
+            stop_funding_rate_streams(streams)
+        if api_server:
+            stop_api_server(api_server)
+    print(f"- Scanner daemon stopped")
+
+
+def create_exchange_state(exchange_name):
+    """
+    Creates an exchange object, loads its markets and prepares the state kept between refreshes.
+
+    Args:
+        exchange_name (str): Name of the exchange.
+
+    Returns:
+        dict: Exchange object, perpetual pairs, latest dataframes, funding rate stream and the time of the next
+            refresh of every task.
+    """
+    exchange = init_exchange(exchange_name)
+    pairs = get_all_trading_pairs(exchange, perpetual=True)
+    print(f" {len(pairs)} perpetual trading pairs found for {exchange_name}")
+    return {'exchange': exchange, 'pairs': pairs, 'rates': None, 'historical_rates': None, 'daily_amplitude': None,
+            'stream': None, 'next_refresh': {task: 0 for task in REFRESH_TASKS}}
+
+
+def run_refresh_tasks(due_tasks):
+    """
+    Runs due refresh tasks. Tasks of different exchanges run in parallel if parallel_exchanges is enabled.
+
+    Args:
+        due_tasks (list): List of (exchange state, task name) tuples.
+    """
+    tasks_by_exchange = {}
+    for state, task in due_tasks:
+        tasks_by_exchange.setdefault(id(state), (state, []))[1].append(task)
+
+    def run_exchange_tasks(state, tasks):
+        for task in tasks:
+            refresh(state, task)
+
+    if CONFIG['parallel_exchanges']:
+        with ThreadPoolExecutor(max_workers=CONFIG['parallel_workers'] or len(tasks_by_exchange)) as executor:
+            list(executor.map(lambda item: run_exchange_tasks(*item), tasks_by_exchange.values()))
+    else:
+        for state, tasks in tasks_by_exchange.values():
+            run_exchange_tasks(state, tasks)
+
+
+def refresh(state, task):
+    """
+    Refreshes one kind of data of an exchange and schedules the next refresh of the task.
+
+    Args:
+        state (dict): Exchange state created by create_exchange_state.
+        task (str): 'rates', 'history' or 'amplitude'.
+    """
+    exchange, pairs = state['exchange'], state['pairs']
+    try:
+        if task == 'rates' and state['stream']:
+            state['rates'] = get_rates_df(state['stream'])
+        elif task == 'rates':
+            state['rates'] = get_funding_rates_for_pairs(exchange, pairs)
+        elif task == 'history':
+            hours = CONFIG['funding_historical_days'] * 24
+            state['historical_rates'] = get_historical_funding_rates_for_pairs(exchange, pairs, hours=hours)
+        elif task == 'amplitude':
+            state['daily_amplitude'] = get_daily_amplitude(exchange, pairs)
+    except Exception as e:
+        print(f"Error refreshing {task} for {exchange.id}: {e}")
+    schedule_next_refresh(state, task, time.time())
+
+
+def schedule_next_refresh(state, task, now):
+    """
+    Sets the time of the next refresh of a task.
+
+    The task runs again after its interval from daemon_refresh_intervals, or stream_refresh_seconds for
+    rates read from a funding rate stream. Rates are refreshed earlier
+    if the next funding of the exchange comes first: daemon_funding_lead_seconds before it, to catch
+    the final rate, and daemon_funding_delay_seconds after it, to catch the new one. History is refreshed
+    daemon_funding_delay_seconds after the funding, when the new funding rate is published.
+
+    Args:
+        state (dict): Exchange state created by create_exchange_state.
+        task (str): 'rates', 'history' or 'amplitude'.
+        now (float): Current time in seconds.
+    """
+    next_time = now + CONFIG['daemon_refresh_intervals'][task]
+    if task == 'rates' and state['stream']:
+        next_time = now + CONFIG['stream_refresh_seconds']
+    next_funding_time = get_next_funding_time(state, now)
+    if next_funding_time is not None:
+        aligned_times = []
+        if task == 'rates':
+            aligned_times = [next_funding_time - CONFIG['daemon_funding_lead_seconds'],
+                             next_funding_time + CONFIG['daemon_funding_delay_seconds']]
+        elif task == 'history':
+            aligned_times = [next_funding_time + CONFIG['daemon_funding_delay_seconds']]
+        next_time = min([next_time, *[aligned for aligned in aligned_times if aligned > now]])
+    state['next_refresh'][task] = next_time
+
+
+def get_next_funding_time(state, now):
+    """
+    Returns the earliest upcoming funding time of the exchange.
+
+    Args:
+        state (dict): Exchange state created by create_exchange_state.
+        now (float): Current time in seconds.
+
+    Returns:
+        float: Time of the next funding in seconds, or None if the exchange does not report it.
+    """
+    df_rates = state['rates']
+    if df_rates is None or df_rates.empty or 'next_funding_time' not in df_rates:
+        return None
+    funding_times = df_rates['next_funding_time'].dropna() / 1000
+    funding_times = funding_times[funding_times > now]
+    return funding_times.min() if not funding_times.empty else None
+
+
+def analyze_in_memory(perpetual_states, spot_index, directory_stream=None):
+    """
+    Identifies trading opportunities in the latest data kept by the daemon.
+
+    Args:
+        perpetual_states (list): Exchange states created by create_exchange_state.
+        spot_index (dict): Spot index created by build_spot_index, or None without spot data.
+        directory_stream (str, optional): Directory to stream the opportunities to (see find_opportunities).
+
+    Returns:
+        dict: Result dataframes returned by find_opportunities.
+    """
+    perpetual_data_df = {}
+    for state in perpetual_states:
+        if state['rates'] is None or state['rates'].empty:
+            continue
+        df = merge_perpetual_data(
+            state['rates'],
+            latest_or_empty(state['historical_rates'], ['historical_rates']),
+            latest_or_empty(state['daily_amplitude'], ['mean_daily_amplitude', 'max_daily_amplitude', 'amplitude_days']))
+        perpetual_data_df[state['exchange'].id] = prepare_perpetual_data_df(state['exchange'].id, df)
+    if not perpetual_data_df:
+        return {}
+    return find_opportunities(perpetual_data_df, spot_index, directory_stream)
+
+
+def latest_or_empty(df, columns):
+    """
+    Returns the latest dataframe of a task, or an empty one with its columns if it has not succeeded yet.
+
+    Args:
+        df (pd.DataFrame): Latest dataframe of the task or None.
+        columns (list): Columns of the task dataframe besides pair.
+
+    Returns:
+        pd.DataFrame: Dataframe that can be merged on pair.
+    """
+    if df is None or df.empty:
+        return pd.DataFrame(columns=['pair', *columns])
+    return df
+
+
+def print_results_summary(results):
+    """
+    Prints the number of opportunities and the best one of every analysis.
+
+    Args:
+        results (dict): Result dataframes returned by find_opportunities.
+    """
+    for name, df in results.items():
+        if df.empty:
+            print(f"-- {name}: no opportunities")
+            continue
+        best = df.iloc[0]
+        rate = best['rate_diff'] if 'rate_diff' in df else best['rate']
+        print(f"-- {name}: {len(df)} opportunities, best {best['pair']} with rate {rate}")
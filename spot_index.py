@@ -0,0 +1,175 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from config import CONFIG
+from instrument_registry import get_instrument_columns, get_instrument_symbols
+from utils import file_to_df
+
+# One bit of an int64 mask per spot exchange
+MAX_SPOT_EXCHANGES = 63
+
+
+def load_spot_pairs_from_files(directory_data):
+    """
+    Loads the spot trading pairs of every configured spot exchange from the snapshot files.
+
+    Args:
+        directory_data (str): Directory containing files.
+
+    Returns:
+        dict: Dictionary with exchange names as keys and dataframes of spot pairs as values.
+    """
+    spot_data = {}
+    for exchange in CONFIG['spot_exchanges']:
+        df = file_to_df(f"{directory_data}", f"spot_pairs_{exchange}", CONFIG['snapshot_format'])
+        if not df.empty:
+            spot_data[exchange] = df
+    return spot_data
+
+
+def build_spot_index(spot_data):
+    """
+    Builds the spot index: a bitmask of the spot exchanges that list every spot instrument.
+
+    Bit i of a mask is set if the i-th exchange of the index lists the instrument. Masks are kept in an
+    array indexed by spot instrument id (see instrument_registry.py), so looking up the spot exchanges
+    of any number of perpetual pairs is a single array gather.
+
+    Args:
+        spot_data (dict): Dictionary with exchange names as keys and dataframes of spot pairs as values.
+
+    Returns:
+        dict: Exchange names in bit order under 'exchanges' and the masks under 'masks',
+            or None if there is no spot data.
+    """
+    spot_data = {exchange: df for exchange, df in spot_data.items() if not df.empty}
+    if len(spot_data) > MAX_SPOT_EXCHANGES:
+        print(f"Warning: Only the first {MAX_SPOT_EXCHANGES} spot exchanges are indexed")
+        spot_data = dict(list(spot_data.items())[:MAX_SPOT_EXCHANGES])
+    if len(spot_data) == 0:
+        print("- Exiting: No spot data found")
+        return None
+    spot_ids = [get_instrument_columns(df['pair'])[0] for df in spot_data.values()]
+    masks = np.zeros(max(ids.max(initial=-1) for ids in spot_ids) + 1, dtype=np.int64)
+    for bit, ids in enumerate(spot_ids):
+        masks[ids] |= np.int64(1) << bit
+    return {'exchanges': list(spot_data.keys()), 'masks': masks}
+
+
+def get_spot_masks(spot_index, spot_ids):
+    """
+    Looks up the spot exchange masks of spot instruments.
+
+    Args:
+        spot_index (dict): Spot index created by build_spot_index.
+        spot_ids (array-like): Spot instrument ids.
+
+    Returns:
+        np.ndarray: Mask of every instrument, 0 for instruments not listed on any spot exchange.
+    """
+    masks = spot_index['masks']
+    spot_ids = np.asarray(spot_ids, dtype=np.int64)
+    indexed = spot_ids < len(masks)
+    return np.where(indexed, masks[np.where(indexed, spot_ids, 0)], 0)
+
+
+def get_exchange_bits(spot_index, exchanges):
+    """
+    Returns the mask with the bits of some spot exchanges set.
+
+    Args:
+        spot_index (dict): Spot index created by build_spot_index.
+        exchanges (list): Spot exchange names. Exchanges that are not in the index are ignored.
+
+    Returns:
+        np.int64: Mask of the exchanges.
+    """
+    bits = np.int64(0)
+    for exchange in exchanges:
+        if exchange in spot_index['exchanges']:
+            bits |= np.int64(1) << spot_index['exchanges'].index(exchange)
+    return bits
+
+
+def get_spot_exchange_names(spot_index, masks):
+    """
+    Converts spot exchange masks to exchange names joined with '/', e.g. 'binance/okx'.
+
+    Every distinct mask is converted once.
+
+    Args:
+        spot_index (dict): Spot index created by build_spot_index.
+        masks (np.ndarray): Spot exchange masks.
+
+    Returns:
+        np.ndarray: Exchange names of every mask.
+    """
+    unique_masks, codes = np.unique(masks, return_inverse=True)
+    names = np.array(['/'.join(exchange for bit, exchange in enumerate(spot_index['exchanges']) if mask >> bit & 1)
+                      for mask in unique_masks], dtype=object)
+    return names[codes]
+
+
+def get_spot_index_path(directory_data):
+    """
+    Returns the path to the spot index file of a snapshot.
+
+    Args:
+        directory_data (str): Data directory of the snapshot.
+
+    Returns:
+        str: Path to the file.
+    """
+    return f"{directory_data}/spot_index.json"
+
+
+def save_spot_index(spot_index, directory_data):
+    """
+    Saves the spot index with the snapshot. Instrument ids are specific to the process,
+    so the file keeps the canonical spot symbols instead.
+
+    The file is written under a temporary name and then renamed, so readers never see a partial file.
+
+    Args:
+        spot_index (dict): Spot index created by build_spot_index.
+        directory_data (str): Data directory of the snapshot.
+    """
+    spot_ids = np.flatnonzero(spot_index['masks'])
+    content = {'exchanges': spot_index['exchanges'],
+               'pairs': get_instrument_symbols(spot_ids).tolist(),
+               'masks': spot_index['masks'][spot_ids].tolist()}
+    path = get_spot_index_path(directory_data)
+    os.makedirs(directory_data, exist_ok=True)
+    try:
+        with open(f"{path}.tmp", 'w') as file:
+            json.dump(content, file)
+        os.replace(f"{path}.tmp", path)
+    except OSError as e:
+        print(f"Error saving spot index: {e}")
+
+
+def load_spot_index(directory_data):
+    """
+    Loads the spot index saved with a snapshot.
+
+    Args:
+        directory_data (str): Data directory of the snapshot.
+
+    Returns:
+        dict: Spot index, or None if the file is missing or unreadable.
+    """
+    path = get_spot_index_path(directory_data)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path) as file:
+            content = json.load(file)
+        spot_ids = get_instrument_columns(pd.Series(content['pairs'], dtype=object))[0]
+        masks = np.zeros(spot_ids.max(initial=-1) + 1, dtype=np.int64)
+        masks[spot_ids] = content['masks']
+        return {'exchanges': content['exchanges'], 'masks': masks}
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Error loading spot index: {e}")
+        return None
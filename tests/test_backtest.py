@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+import backtest
+from backtest import create_realized_funding, get_realized_funding
+from funding_history import HOUR_MS
+
+NOW = 1_700_000_000_000
+
+
+@pytest.fixture
+def history(monkeypatch):
+    # Exchange a has 8-hour fundings of X up to 24 hours after NOW, exchange b only up to NOW
+    history_a = pd.DataFrame({'symbol': 'X/USDT:USDT', 'timestamp': NOW + np.array([0, 8, 16, 24]) * HOUR_MS,
+                              'rate': [0.0001, 0.0002, -0.0001, 0.0003]})
+    history_b = pd.DataFrame({'symbol': ['X/USDT:USDT'], 'timestamp': [NOW], 'rate': [0.0001]})
+    monkeypatch.setattr(backtest, 'worker_history', {'a': create_realized_funding(history_a),
+                                                     'b': create_realized_funding(history_b)})
+
+
+def get_funding(exchanges, pairs, start_ms, end_ms):
+    return get_realized_funding(np.array(exchanges, dtype=object), np.array(pairs, dtype=object), start_ms, end_ms)
+
+
+def test_fundings_after_the_entry(history):
+    # The funding at the entry time is not collected, the one at the exit time is
+    realized = get_funding(['a', None], ['X/USDT:USDT', 'X/USDT'], NOW, NOW + 16 * HOUR_MS)
+
+    assert list(realized) == pytest.approx([0.02 - 0.01, 0.0])
+
+
+def test_no_funding_in_a_short_holding_period(history):
+    # No funding falls between two 8-hour fundings, so nothing is paid
+    realized = get_funding(['a'], ['X/USDT:USDT'], NOW + HOUR_MS, NOW + 5 * HOUR_MS)
+
+    assert list(realized) == [0.0]
+
+
+def test_missing_exchange_data(history):
+    # b has no rates up to the exit, c none at all and Y is not stored on a
+    realized = get_funding(['b', 'c', 'a', 'a'], ['X/USDT:USDT', 'X/USDT:USDT', 'Y/USDT:USDT', 'X/USDT:USDT'],
+                           NOW + HOUR_MS, NOW + 5 * HOUR_MS)
+
+    assert np.isnan(realized[:3]).all()
+    assert realized[3] == 0.0
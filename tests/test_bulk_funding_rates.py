@@ -0,0 +1,85 @@
+import ccxt
+import pytest
+from config import CONFIG
+from fake_exchange import FakeExchange
+from fetch_data import get_funding_rates_for_pairs
+
+MARKETS = 12
+PAIRS = [f"COIN{index}/USDT:USDT" for index in range(MARKETS)]
+
+
+class RecordingExchange(FakeExchange):
+    """
+    Fake exchange that records the pairs of every funding rate request. The bulk endpoint fails for
+    chunks with a pair of failing_pairs and returns no rate for the pairs of missing_pairs.
+    """
+
+    def __init__(self, bulk_funding_rates=True, failing_pairs=(), missing_pairs=()):
+        super().__init__('a', markets=MARKETS, latency=0, rate_limit=1, bulk_funding_rates=bulk_funding_rates)
+        self.requests = []
+        self.failing_pairs = set(failing_pairs)
+        self.missing_pairs = set(missing_pairs)
+
+    def fetch_funding_rate(self, symbol):
+        self.requests.append(('fetch_funding_rate', [symbol]))
+        return super().fetch_funding_rate(symbol)
+
+    def fetch_funding_rates(self, symbols=None):
+        self.requests.append(('fetch_funding_rates', list(symbols)))
+        if self.failing_pairs.intersection(symbols):
+            raise ccxt.BadSymbol("unknown symbol")
+        rates = super().fetch_funding_rates(symbols)
+        for symbol in self.missing_pairs.intersection(symbols):
+            rates[symbol] = {**rates[symbol], 'fundingRate': None}
+        return rates
+
+
+@pytest.fixture
+def config(monkeypatch):
+    for key, value in {'market_cache': False, 'metrics': False, 'funding_rates_chunk_size': 5}.items():
+        monkeypatch.setitem(CONFIG, key, value)
+
+
+def get_rates(exchange):
+    df = get_funding_rates_for_pairs(exchange, PAIRS)
+    return dict(zip(df['pair'], df['rate']))
+
+
+def test_bulk_endpoint_in_chunks(config):
+    exchange = RecordingExchange()
+
+    rates = get_rates(exchange)
+
+    assert exchange.requests == [('fetch_funding_rates', PAIRS[:5]), ('fetch_funding_rates', PAIRS[5:10]),
+                                 ('fetch_funding_rates', PAIRS[10:])]
+    # The same rates as pair by pair
+    assert rates == get_rates(RecordingExchange(bulk_funding_rates=False))
+
+
+def test_all_pairs_in_one_request(config, monkeypatch):
+    monkeypatch.setitem(CONFIG, 'funding_rates_chunk_size', None)
+    exchange = RecordingExchange()
+
+    assert list(get_rates(exchange)) == PAIRS
+    assert exchange.requests == [('fetch_funding_rates', PAIRS)]
+
+
+def test_per_pair_requests_without_the_bulk_endpoint(config):
+    exchange = RecordingExchange(bulk_funding_rates=False)
+
+    rates = get_rates(exchange)
+
+    assert exchange.requests == [('fetch_funding_rate', [pair]) for pair in PAIRS]
+    assert list(rates) == PAIRS
+    assert rates['COIN0/USDT:USDT'] == pytest.approx(100 * exchange._funding_rate('COIN0/USDT:USDT')['fundingRate'],
+                                                     abs=1e-3)
+
+
+def test_failed_chunk_and_missing_rates_are_skipped(config):
+    exchange = RecordingExchange(failing_pairs=['COIN6/USDT:USDT'], missing_pairs=['COIN1/USDT:USDT'])
+
+    rates = get_rates(exchange)
+
+    # The failed chunk is not requested again, the other chunks are kept in order
+    assert len(exchange.requests) == 3
+    assert list(rates) == [pair for pair in PAIRS[:5] + PAIRS[10:] if pair != 'COIN1/USDT:USDT']
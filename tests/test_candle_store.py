@@ -0,0 +1,91 @@
+import pytest
+from config import CONFIG
+from candle_store import get_fetch_start, load_candles, open_candle_store, save_candles
+from fake_exchange import TIMEFRAME_MS, FakeExchange
+from fetch_data import get_daily_amplitude
+
+DAY_MS = TIMEFRAME_MS['1d']
+START = 1_700_006_400_000
+PAIRS = ['COIN0/USDT:USDT', 'COIN1/USDT:USDT']
+
+
+class RecordingExchange(FakeExchange):
+    """
+    Fake exchange that records the pair and start of every candle request.
+    """
+
+    def __init__(self):
+        super().__init__('a', markets=2, latency=0, rate_limit=1)
+        self.requests = []
+
+    def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=None):
+        candles = super().fetch_ohlcv(symbol, timeframe, since, limit)
+        self.requests.append((symbol, since, len(candles)))
+        return candles
+
+
+@pytest.fixture
+def store(tmp_path):
+    connection = open_candle_store(f"{tmp_path}/candles.sqlite")
+    yield connection
+    connection.close()
+
+
+@pytest.fixture
+def config(monkeypatch, tmp_path):
+    for key, value in {'directory': str(tmp_path), 'candle_store_file': 'candles.sqlite', 'amplitude_days': 30,
+                       'market_cache': False, 'metrics': False}.items():
+        monkeypatch.setitem(CONFIG, key, value)
+
+
+def create_candles(days, high=2.0):
+    return [[START + day * DAY_MS, 1.0, high, 0.5, 1.5, 100.0] for day in range(days)]
+
+
+def test_fetch_start_of_an_empty_store(store):
+    assert get_fetch_start(store, 'a', 'X/USDT:USDT', '1d', START) == START
+
+
+def test_fetch_start_is_the_last_stored_candle(store):
+    save_candles(store, 'a', 'X/USDT:USDT', '1d', create_candles(5))
+
+    # The last candle is fetched again, it may have been incomplete
+    assert get_fetch_start(store, 'a', 'X/USDT:USDT', '1d', START) == START + 4 * DAY_MS
+    # Candles before the required period are not fetched, other pairs and timeframes are not stored yet
+    assert get_fetch_start(store, 'a', 'X/USDT:USDT', '1d', START + 10 * DAY_MS) == START + 10 * DAY_MS
+    assert get_fetch_start(store, 'a', 'Y/USDT:USDT', '1d', START) == START
+    assert get_fetch_start(store, 'b', 'X/USDT:USDT', '1d', START) == START
+    assert get_fetch_start(store, 'a', 'X/USDT:USDT', '1h', START) == START
+
+
+def test_refetched_candle_replaces_the_stored_one(store):
+    save_candles(store, 'a', 'X/USDT:USDT', '1d', create_candles(3))
+    save_candles(store, 'a', 'X/USDT:USDT', '1d', create_candles(3, high=3.0)[2:] + create_candles(4)[3:])
+
+    candles = load_candles(store, 'a', 'X/USDT:USDT', '1d', START, START + 4 * DAY_MS)
+
+    assert [candle[0] for candle in candles] == [START + day * DAY_MS for day in range(4)]
+    assert [candle[2] for candle in candles] == [2.0, 2.0, 3.0, 2.0]
+    assert load_candles(store, 'a', 'X/USDT:USDT', '1d', START + DAY_MS, START + 2 * DAY_MS) == \
+        [[START + DAY_MS, 1.0, 2.0, 0.5, 1.5, 100.0]]
+
+
+def test_amplitude_fetches_only_new_candles(config, monkeypatch):
+    monkeypatch.setitem(CONFIG, 'candle_store', True)
+    exchange = RecordingExchange()
+    first = get_daily_amplitude(exchange, PAIRS)
+    # The first fetch fills the store with the whole period
+    assert [(pair, count) for pair, _, count in exchange.requests] == [(pair, 30) for pair in PAIRS]
+    store = open_candle_store()
+    last_timestamps = {pair: get_fetch_start(store, 'a', pair, '1d', 0) for pair in PAIRS}
+    store.close()
+
+    exchange.requests.clear()
+    second = get_daily_amplitude(exchange, PAIRS)
+
+    # The second one fetches from the last stored candle on
+    assert exchange.requests == [(pair, last_timestamps[pair], 1) for pair in PAIRS]
+    monkeypatch.setitem(CONFIG, 'candle_store', False)
+    expected = get_daily_amplitude(RecordingExchange(), PAIRS)
+    for df in (first, second):
+        assert df.to_dict(orient='records') == expected.to_dict(orient='records')
@@ -0,0 +1,127 @@
+import os
+
+import pandas as pd
+import pytest
+from config import CONFIG
+import fetch_data
+from checkpoint_log import get_checkpoint_path, read_checkpoint_log
+from fake_exchange import FakeExchange
+
+MARKETS = 6
+# Endpoint of the checkpoint log filled by every request method of the exchange
+ENDPOINTS = {'fetch_funding_rate': 'rates', 'fetch_funding_rate_history': 'history', 'fetch_ohlcv': 'amplitude'}
+
+
+class CrashingExchange(FakeExchange):
+    """
+    Fake exchange that records the pairs requested per checkpoint endpoint and interrupts the process
+    on the request number crash_at, like a crash or Ctrl+C in the middle of a fetch.
+    """
+
+    def __init__(self, exchange_id, requests, crash_at=None):
+        super().__init__(exchange_id, markets=MARKETS, latency=0, rate_limit=1, bulk_funding_rates=False)
+        self.requests = requests
+        self.crash_at = crash_at
+
+    def _record(self, method, symbol):
+        self.requests.append((self.id, ENDPOINTS[method], symbol))
+        if len(self.requests) == self.crash_at:
+            raise KeyboardInterrupt
+
+    def fetch_funding_rate(self, symbol):
+        self._record('fetch_funding_rate', symbol)
+        return super().fetch_funding_rate(symbol)
+
+    def fetch_funding_rate_history(self, symbol, since=None, limit=None):
+        self._record('fetch_funding_rate_history', symbol)
+        return super().fetch_funding_rate_history(symbol, since, limit)
+
+    def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=None):
+        self._record('fetch_ohlcv', symbol)
+        return super().fetch_ohlcv(symbol, timeframe, since, limit)
+
+
+@pytest.fixture
+def config(monkeypatch, tmp_path):
+    for key, value in {'perpetual_exchanges': ['a', 'b'], 'spot_exchanges': ['a'], 'market_cache': False,
+                       'metrics': False, 'fetch_mode': 'sync', 'parallel_exchanges': False, 'fetch_resume': False,
+                       'funding_history_store': True, 'candle_store': True, 'snapshot_format': 'parquet'}.items():
+        monkeypatch.setitem(CONFIG, key, value)
+
+
+def fetch(monkeypatch, directory, requests, crash_at=None):
+    """
+    Fetches a snapshot from crashing fake exchanges and returns its data directory.
+    """
+    monkeypatch.setitem(CONFIG, 'directory', str(directory))
+    monkeypatch.setitem(CONFIG, 'subdirectory', 'snapshot')
+    monkeypatch.setattr(fetch_data, 'init_exchange',
+                        lambda exchange_name: CrashingExchange(exchange_name, requests, crash_at))
+    fetch_data.fetch_and_save_data()
+    return f"{directory}/snapshot/data"
+
+
+def read_snapshot_file(path):
+    df = pd.read_parquet(path)
+    if 'historical_rates' in df:
+        df['historical_rates'] = df['historical_rates'].map(list)
+    return df
+
+
+def test_resume_after_a_crash(config, monkeypatch, tmp_path):
+    directory_expected = fetch(monkeypatch, tmp_path / 'uninterrupted', [])
+
+    # The crash comes while the historical rates of the second exchange are fetched
+    requests = []
+    with pytest.raises(KeyboardInterrupt):
+        fetch(monkeypatch, tmp_path / 'crashed', requests, crash_at=3 * MARKETS + MARKETS + 3)
+    directory_data = f"{tmp_path}/crashed/snapshot/data"
+    path = get_checkpoint_path(directory_data)
+    assert not os.path.exists(f"{directory_data}/funding_rates_b.parquet")
+
+    # The crash also cut off the last line of the log while it was written
+    with open(path) as file:
+        lines = file.readlines()
+    with open(path, 'w') as file:
+        file.writelines(lines[:-1] + [lines[-1][:len(lines[-1]) // 2]])
+    checkpointed = read_checkpoint_log(path)
+    assert sorted(checkpointed) == [('a', 'amplitude'), ('a', 'history'), ('a', 'rates'), ('b', 'history'),
+                                    ('b', 'rates')]
+    assert len(checkpointed[('b', 'history')]) == 1
+
+    monkeypatch.setitem(CONFIG, 'fetch_resume', True)
+    resumed_requests = []
+    fetch(monkeypatch, tmp_path / 'crashed', resumed_requests)
+
+    # Pairs in the log are read from it, all others are requested
+    for exchange, endpoint, pair in resumed_requests:
+        assert pair not in checkpointed.get((exchange, endpoint), {})
+    assert len(resumed_requests) == 3 * 2 * MARKETS - sum(len(rows) for rows in checkpointed.values())
+
+    names = sorted(name for name in os.listdir(directory_expected) if name.endswith('.parquet'))
+    assert names == ['funding_rates_a.parquet', 'funding_rates_b.parquet', 'spot_pairs_a.parquet']
+    for name in names:
+        pd.testing.assert_frame_equal(read_snapshot_file(f"{directory_data}/{name}"),
+                                      read_snapshot_file(f"{directory_expected}/{name}"))
+
+
+def test_read_checkpoint_log_skips_a_truncated_last_line(tmp_path):
+    path = tmp_path / 'fetch_checkpoint.jsonl'
+    path.write_text('{"exchange": "a", "endpoint": "rates", "pair": "X/USDT:USDT", "row": {"pair": "X/USDT:USDT", '
+                    '"rate": 0.01}}\n'
+                    '{"exchange": "a", "endpoint": "rates", "pair": "X/USDT:USDT", "row": {"pair": "X/USDT:USDT", '
+                    '"rate": 0.02}}\n'
+                    '{"exchange": "a", "endpoint": "rates", "pair": "Y/USD')
+
+    assert read_checkpoint_log(path) == {('a', 'rates'): {'X/USDT:USDT': {'pair': 'X/USDT:USDT', 'rate': 0.02}}}
+
+
+def test_new_run_starts_an_empty_log(config, monkeypatch, tmp_path):
+    requests = []
+    directory_data = fetch(monkeypatch, tmp_path, requests)
+    fetch(monkeypatch, tmp_path, requests)
+
+    # Without resume every pair is requested again and the log holds the rows of the last run only
+    assert len(requests) == 2 * 3 * 2 * MARKETS
+    rows = read_checkpoint_log(get_checkpoint_path(directory_data))
+    assert sum(len(pair_rows) for pair_rows in rows.values()) == 3 * 2 * MARKETS
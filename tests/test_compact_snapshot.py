@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+import pytest
+from config import CONFIG
+from analyze_data import (create_perpetual_data_df_from_files, create_spot_index_from_files, find_opportunities,
+                          prepare_perpetual_data_df)
+from compact_snapshot import expand_compact_df, get_budget_chunk_pairs, get_df_memory_bytes, get_memory_report
+from utils import array_cells_to_lists, df_to_file
+
+EXCHANGES = ['a', 'b', 'c']
+
+
+@pytest.fixture
+def config(monkeypatch):
+    for key, value in {'perpetual_exchanges': EXCHANGES, 'spot_exchanges': ['a', 'b'], 'snapshot_format': 'parquet',
+                       'funding_history_store': False, 'apy_horizons_days': [], 'result_top_k': None,
+                       'result_stream_format': None, 'liquidity_ranking': False, 'funding_rate_threshold': 0.01,
+                       'memory_budget_mb': None}.items():
+        monkeypatch.setitem(CONFIG, key, value)
+
+
+def create_funding_rates(exchange, pairs=200):
+    """
+    Creates funding rates of an exchange as fetched: rates with 3 decimals, amplitudes with 2, some pairs
+    with a multiplier and up to 3 days of 8-hour historical rates, also none.
+    """
+    rng = np.random.default_rng(EXCHANGES.index(exchange))
+    indexes = np.sort(rng.choice(300, pairs, replace=False))
+    return pd.DataFrame({'pair': [f"{'1000' if index % 7 == 0 else ''}COIN{index}/USDT:USDT" for index in indexes],
+                         'rate': rng.uniform(-0.1, 0.1, pairs).round(3),
+                         'historical_rates': [list(rng.uniform(-0.1, 0.1, rng.integers(0, 10)).round(3))
+                                              for _ in range(pairs)],
+                         'mean_daily_amplitude': rng.uniform(1, 10, pairs).round(2),
+                         'max_daily_amplitude': rng.uniform(10, 30, pairs).round(2),
+                         'amplitude_days': rng.integers(1, 101, pairs)})
+
+
+def prepare(exchange, compact, monkeypatch):
+    monkeypatch.setitem(CONFIG, 'compact_snapshots', compact)
+    return prepare_perpetual_data_df(exchange, create_funding_rates(exchange))
+
+
+def test_compact_df_reads_back_equal(config, monkeypatch):
+    plain = prepare('a', False, monkeypatch)
+    compact = prepare('a', True, monkeypatch)
+
+    assert compact['rate'].dtype == np.float32
+    assert isinstance(compact['pair'].dtype, pd.CategoricalDtype)
+    expanded = array_cells_to_lists(expand_compact_df(compact)).assign(pair=compact['pair'].astype(object))
+    pd.testing.assert_frame_equal(expanded, plain, check_dtype=False)
+    assert all(isinstance(rate, float) for rates in expanded['historical_rates'] for rate in rates)
+
+
+def test_compact_df_uses_less_memory(config, monkeypatch):
+    plain = {exchange: prepare(exchange, False, monkeypatch) for exchange in EXCHANGES}
+    compact = {exchange: prepare(exchange, True, monkeypatch) for exchange in EXCHANGES}
+
+    for exchange in EXCHANGES:
+        for column in ['rate', 'historical_rates', 'instrument_id']:
+            assert get_df_memory_bytes(compact[exchange][[column]]) < get_df_memory_bytes(plain[exchange][[column]])
+    # Once the symbols of all exchanges are registered, e.g. on the next load of the daemon, the pair columns
+    # of all exchanges share their categories and the memory report counts them once
+    compact = {exchange: prepare(exchange, True, monkeypatch) for exchange in EXCHANGES}
+    categories = compact['a']['pair'].cat.categories
+    assert all(df['pair'].cat.categories is categories for df in compact.values())
+    report = get_memory_report(compact)
+    assert report['exchanges']['a']['bytes'] == get_df_memory_bytes(compact['a'])
+    assert report['exchanges']['b']['bytes'] == get_df_memory_bytes(compact['b'], {id(categories)})
+    assert report['exchanges']['a']['rows'] == 200
+
+
+@pytest.mark.parametrize('engine', ['matrix', 'pairwise'])
+def test_analysis_of_a_compact_snapshot_is_the_same(config, monkeypatch, tmp_path, engine):
+    monkeypatch.setitem(CONFIG, 'perp_perp_engine', engine)
+    for exchange in EXCHANGES:
+        df_to_file(create_funding_rates(exchange), tmp_path, f"funding_rates_{exchange}", 'parquet')
+    for exchange in CONFIG['spot_exchanges']:
+        df_to_file(pd.DataFrame({'pair': [f"COIN{index}/USDT" for index in range(0, 300, 2)]}), tmp_path,
+                   f"spot_pairs_{exchange}", 'parquet')
+
+    results = {}
+    for compact in (False, True):
+        monkeypatch.setitem(CONFIG, 'compact_snapshots', compact)
+        results[compact] = find_opportunities(create_perpetual_data_df_from_files(tmp_path),
+                                              create_spot_index_from_files(tmp_path))
+
+    assert sorted(results[True]) == sorted(results[False])
+    for name, df in results[False].items():
+        assert not df.empty
+        pd.testing.assert_frame_equal(array_cells_to_lists(results[True][name]), array_cells_to_lists(df),
+                                      check_dtype=False, check_categorical=False)
+
+
+def test_budget_chunk_pairs(config, monkeypatch):
+    perpetual_data_df = {exchange: prepare(exchange, True, monkeypatch) for exchange in EXCHANGES}
+
+    assert get_budget_chunk_pairs(perpetual_data_df, 10000) == 10000
+    # A budget smaller than the loaded data still compares 100 pairs at once
+    monkeypatch.setitem(CONFIG, 'memory_budget_mb', 0.01)
+    assert get_budget_chunk_pairs(perpetual_data_df, 10000) == 100
+    monkeypatch.setitem(CONFIG, 'memory_budget_mb', 1)
+    assert 100 < get_budget_chunk_pairs(perpetual_data_df, None) < 10000
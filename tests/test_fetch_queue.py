@@ -0,0 +1,224 @@
+import functools
+import json
+import os
+import subprocess
+import sys
+
+import pandas as pd
+import pytest
+from config import CONFIG
+import fetch_data
+import fetch_queue
+from analyze_data import create_perpetual_data_df_from_files, get_apy_horizon_columns, get_history_stat_columns
+from fake_exchange import FakeExchange
+from fetch_queue import (claim_work_unit, complete_work_unit, enqueue_work_units, get_queue_progress,
+                         load_work_results, load_work_store_rows, open_fetch_queue, release_work_unit)
+from utils import get_snapshot_time, save_snapshot_time
+
+MARKETS = 12
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class FakeClock:
+    """
+    Stands in for the time module of fetch_queue, so leases expire without waiting.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+class ExitOnceExchangeFactory:
+    """
+    Creates fake exchanges, but the first worker process other than the main one to create one exits at once,
+    while it holds the lease of its work unit.
+    """
+
+    def __init__(self, marker_path, main_pid):
+        self.marker_path = marker_path
+        self.main_pid = main_pid
+
+    def __call__(self, exchange_name):
+        if os.getpid() != self.main_pid:
+            try:
+                os.close(os.open(self.marker_path, os.O_CREAT | os.O_EXCL))
+                os._exit(1)
+            except FileExistsError:
+                pass
+        return FakeExchange(exchange_name, markets=MARKETS, latency=0.01, rate_limit=1)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(fetch_queue, 'time', clock)
+    monkeypatch.setitem(CONFIG, 'shard_lease_seconds', 60)
+    monkeypatch.setitem(CONFIG, 'shard_max_leases_per_exchange', 1)
+    monkeypatch.setitem(CONFIG, 'shard_max_attempts', 2)
+    return clock
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    connection = open_fetch_queue(f"{tmp_path}/fetch_queue.sqlite")
+    enqueue_work_units(connection, [('a', 'rates', ['X/USDT:USDT']), ('a', 'rates', ['Y/USDT:USDT']),
+                                    ('b', 'rates', ['X/USDT:USDT'])])
+    yield connection
+    connection.close()
+
+
+def test_journal_mode(queue):
+    # WAL needs shared memory, which workers on other hosts do not share
+    assert queue.execute("PRAGMA journal_mode").fetchone()[0] == 'delete'
+
+
+def test_lease_limit_per_exchange(queue):
+    assert claim_work_unit(queue, 'worker1')['id'] == 1
+    # The second unit of exchange a waits for the lease of the first one
+    assert claim_work_unit(queue, 'worker2')['id'] == 3
+    assert claim_work_unit(queue, 'worker3') is None
+
+
+def test_expired_lease_is_claimed_again(queue, clock):
+    claim_work_unit(queue, 'dead')
+    clock.now += CONFIG['shard_lease_seconds'] - 1
+    assert claim_work_unit(queue, 'live')['id'] == 3
+
+    clock.now += 2
+    unit = claim_work_unit(queue, 'live')
+
+    assert unit['id'] == 1
+    assert queue.execute("SELECT worker, attempts FROM work_units WHERE id = 1").fetchone() == ('live', 2)
+
+
+def create_result(rate):
+    return json.dumps({'records': [{'pair': 'X/USDT:USDT', 'rate': rate}], 'store_rows': [['X/USDT:USDT', 0, rate]]})
+
+
+def test_result_of_a_stale_lease_is_dropped(queue, clock):
+    claim_work_unit(queue, 'slow')
+    clock.now += CONFIG['shard_lease_seconds'] + 1
+    claim_work_unit(queue, 'live')
+
+    complete_work_unit(queue, 1, 'slow', create_result(1.0))
+    assert get_queue_progress(queue)['done'] == 0
+    # A failure reported by the worker that lost the lease does not return the unit to the queue either
+    release_work_unit(queue, 1, 'slow', 'timeout')
+    assert queue.execute("SELECT worker, status FROM work_units WHERE id = 1").fetchone() == ('live', 'leased')
+
+    complete_work_unit(queue, 1, 'live', create_result(2.0))
+    assert load_work_results(queue, 'a', 'rates') == [{'pair': 'X/USDT:USDT', 'rate': 2.0}]
+    assert load_work_store_rows(queue, 'a', 'rates') == [['X/USDT:USDT', 0, 2.0]]
+
+
+def test_failed_unit_is_given_up_after_max_attempts(queue, clock):
+    for attempt in range(CONFIG['shard_max_attempts']):
+        assert claim_work_unit(queue, 'worker')['id'] == 1
+        release_work_unit(queue, 1, 'worker', 'boom')
+
+    assert get_queue_progress(queue) == {'pending': 2, 'leased': 0, 'done': 0, 'failed': 1}
+
+
+@pytest.fixture
+def fetch_config(monkeypatch, tmp_path):
+    for key, value in {'directory': str(tmp_path), 'perpetual_exchanges': ['a', 'b', 'c'],
+                       'spot_exchanges': ['a', 'd'], 'market_cache': False, 'metrics': False,
+                       'fetch_resume': False, 'shard_batch_pairs': 5, 'funding_history_store': True,
+                       'candle_store': True, 'apy_horizons_days': [1, 3, 7, 30], 'compact_snapshots': False,
+                       'shard_lease_seconds': 1, 'shard_poll_seconds': 0.1}.items():
+        monkeypatch.setitem(CONFIG, key, value)
+
+
+def fetch_sync(monkeypatch):
+    """
+    Fetches a snapshot in the sync mode and returns its data directory. The snapshot and the stores
+    it fills are kept in the sync folder, apart from the stores of the sharded fetch.
+    """
+    directory = CONFIG['directory']
+    monkeypatch.setitem(CONFIG, 'directory', f"{directory}/sync")
+    monkeypatch.setattr(fetch_data, 'init_exchange', functools.partial(FakeExchange, markets=MARKETS, latency=0,
+                                                                       rate_limit=1))
+    monkeypatch.setitem(CONFIG, 'fetch_mode', 'sync')
+    monkeypatch.setitem(CONFIG, 'subdirectory', 'sync')
+    fetch_data.fetch_and_save_data()
+    directory_expected = f"{CONFIG['directory']}/sync/data"
+    monkeypatch.setitem(CONFIG, 'directory', directory)
+    return directory_expected
+
+
+def assert_same_snapshot_files(directory_expected, directory_data):
+    names = sorted(name for name in os.listdir(directory_expected)
+                   if name.startswith(('funding_rates_', 'spot_pairs_')))
+    assert len(names) == 5
+    for name in names:
+        expected = read_snapshot_file(f"{directory_expected}/{name}")
+        result = read_snapshot_file(f"{directory_data}/{name}")
+        pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+def read_snapshot_file(path):
+    """
+    Reads a Parquet snapshot file with the historical rates as lists, which are compared by value.
+    Rates of -0.0 become 0.0 when the results of the work units are stored as JSON.
+    """
+    df = pd.read_parquet(path)
+    if 'historical_rates' in df:
+        df['historical_rates'] = [list(map(float, rates)) for rates in df['historical_rates']]
+    return df
+
+
+def test_sharded_fetch_with_a_dying_worker(fetch_config, monkeypatch, tmp_path):
+    directory_expected = fetch_sync(monkeypatch)
+    monkeypatch.setitem(CONFIG, 'shard_workers', 2)
+    directory_data = f"{tmp_path}/sharded/data"
+
+    fetch_data.run_sharded_fetch(directory_data, ExitOnceExchangeFactory(f"{tmp_path}/exited", os.getpid()))
+
+    # A worker exited holding a lease, and its unit was claimed again after the lease expired
+    assert os.path.exists(f"{tmp_path}/exited")
+    connection = open_fetch_queue(fetch_data.get_fetch_queue_path(directory_data))
+    assert get_queue_progress(connection) == {'pending': 0, 'leased': 0, 'done': 3 * 3 * 3 + 2, 'failed': 0}
+    assert connection.execute("SELECT MAX(attempts) FROM work_units").fetchone()[0] == 2
+    connection.close()
+    assert_same_snapshot_files(directory_expected, directory_data)
+
+
+def get_history_stats(monkeypatch, directory_data):
+    """
+    Returns the statistics of every exchange calculated from the funding history store of the snapshot directory.
+    """
+    monkeypatch.setitem(CONFIG, 'directory', os.path.dirname(os.path.dirname(directory_data)))
+    columns = ['pair', *get_apy_horizon_columns(), *get_history_stat_columns()]
+    return {exchange: df[columns] for exchange, df in create_perpetual_data_df_from_files(directory_data).items()}
+
+
+def test_worker_from_the_command_line(fetch_config, monkeypatch, tmp_path):
+    directory_expected = fetch_sync(monkeypatch)
+    directory_data = f"{tmp_path}/sharded/data"
+    queue_path = fetch_data.get_fetch_queue_path(directory_data)
+    connection = open_fetch_queue(queue_path)
+    enqueue_work_units(connection, fetch_data.create_work_units(functools.partial(FakeExchange, markets=MARKETS)))
+
+    # The worker runs with the default config, like a worker on another host, so the settings that change the fetched
+    # data are left at their defaults here. It keeps its stores in its own working directory
+    worker_directory = tmp_path / 'worker'
+    worker_directory.mkdir()
+    subprocess.run([sys.executable, f"{REPOSITORY}/fetch_data.py", queue_path, '--fake-markets', str(MARKETS),
+                    '--fake-latency', '0'], cwd=worker_directory, check=True, capture_output=True, timeout=300)
+    fetch_data.merge_sharded_results(connection, directory_data)
+
+    assert get_queue_progress(connection)['done'] == 3 * 3 * 3 + 2
+    connection.close()
+    assert_same_snapshot_files(directory_expected, directory_data)
+
+    # The funding history the worker fetched into its own store was saved into the store of the coordinator
+    save_snapshot_time(directory_data, get_snapshot_time(directory_expected))
+    expected_stats = get_history_stats(monkeypatch, directory_expected)
+    stats = get_history_stats(monkeypatch, directory_data)
+    assert sorted(stats) == ['a', 'b', 'c']
+    for exchange, df in stats.items():
+        assert df['APY_30d'].notna().all()
+        pd.testing.assert_frame_equal(df, expected_stats[exchange])
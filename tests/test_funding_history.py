@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+import pytest
+from funding_history import (DAY_MS, HISTORY_STAT_COLUMNS, HOUR_MS, compute_history_stats, create_rate_history,
+                             get_funding_intervals)
+
+NOW = 1_700_000_000_000
+
+
+def create_history(rates_by_symbol, interval_hours=8):
+    """
+    Creates a ragged history whose last rate of every symbol was paid just before NOW.
+    """
+    rows = [(symbol, NOW - 1000 - (len(rates) - 1 - index) * interval_hours * HOUR_MS, rate)
+            for symbol, rates in rates_by_symbol.items() for index, rate in enumerate(rates)]
+    symbols, timestamps, rates = zip(*rows)
+    return create_rate_history(np.array(symbols), np.array(timestamps), np.array(rates))
+
+
+def test_apy_windows():
+    # 30 days of fundings every 8 hours: 0.01% for the last day, 0.02% before
+    rates = [0.0002] * 87 + [0.0001] * 3
+    stats = compute_history_stats(create_history({'X/USDT:USDT': rates}), NOW, [1, 3, 30])
+
+    row = stats.loc['X/USDT:USDT']
+    assert row['APY_1d'] == pytest.approx(round(365 * 0.03, 2))
+    assert row['APY_3d'] == pytest.approx(round(365 * (0.03 + 0.12) / 3, 2))
+    assert row['APY_30d'] == pytest.approx(round(365 * (0.03 + 87 * 0.02) / 30, 2))
+    assert row['funding_interval_hours'] == 8
+    # Volatility and positive fundings are taken over the longest period
+    assert row['rate_volatility'] == pytest.approx(round(np.std(100 * np.array(rates)), 4))
+    assert row['positive_intervals_pct'] == 100
+
+
+def test_pair_with_fewer_fundings_than_the_window():
+    # Listed 2 days ago: 6 fundings of 0.01%, annualized over the 2 days they cover rather than 30
+    stats = compute_history_stats(create_history({'NEW/USDT:USDT': [0.0001, -0.0001] + [0.0001] * 4}), NOW, [7, 30])
+
+    row = stats.loc['NEW/USDT:USDT']
+    assert row['APY_7d'] == pytest.approx(round(365 * 0.04 / 2, 2))
+    assert row['APY_30d'] == row['APY_7d']
+    assert row['positive_intervals_pct'] == pytest.approx(round(100 * 5 / 6, 1))
+
+
+def test_pair_with_one_funding():
+    # The interval of a single funding is unknown, so the rate is annualized over the whole window
+    stats = compute_history_stats(create_history({'ONE/USDT:USDT': [0.0003]}), NOW, [3])
+
+    row = stats.loc['ONE/USDT:USDT']
+    assert row['APY_3d'] == pytest.approx(round(365 * 0.03 / 3, 2))
+    assert np.isnan(row['funding_interval_hours'])
+
+
+def test_pair_without_fundings_in_the_window():
+    history = create_history({'OLD/USDT:USDT': [0.0001] * 3, 'X/USDT:USDT': [0.0001] * 3})
+    history['timestamps'][:3] -= 10 * DAY_MS
+
+    stats = compute_history_stats(history, NOW, [1, 7])
+
+    assert stats.loc['OLD/USDT:USDT'][['APY_1d', 'APY_7d', 'rate_volatility', 'positive_intervals_pct']].isna().all()
+    assert stats.loc['X/USDT:USDT', 'APY_1d'] == pytest.approx(round(365 * 0.03, 2))
+
+
+def test_no_horizons():
+    history = create_history({'X/USDT:USDT': [0.0001] * 3})
+
+    stats = compute_history_stats(history, NOW, [])
+
+    assert list(stats.index) == ['X/USDT:USDT']
+    assert list(stats.columns) == []
+
+
+def test_columns():
+    stats = compute_history_stats(create_history({'X/USDT:USDT': [0.0001] * 3}), NOW, [30, 1])
+
+    assert list(stats.columns) == ['APY_1d', 'APY_30d', *HISTORY_STAT_COLUMNS]
+
+
+def test_funding_intervals_ignore_gaps():
+    # Hourly fundings with one missing stretch, and a symbol that moved from 8 to 4 hours once
+    history = create_history({'A/USDT:USDT': [0.0001] * 6, 'B/USDT:USDT': [0.0001] * 5}, interval_hours=1)
+    history['timestamps'][:2] -= 5 * HOUR_MS
+    history['timestamps'][6:] = NOW - np.array([32, 24, 16, 8, 4]) * HOUR_MS
+
+    assert list(get_funding_intervals(history)) == [1, 8]
+
+
+def test_empty_history():
+    history = create_rate_history(np.array([], dtype=object), np.array([], dtype=np.int64), np.array([]))
+
+    stats = compute_history_stats(history, NOW, [1, 7])
+
+    assert stats.empty
+    assert isinstance(stats, pd.DataFrame)
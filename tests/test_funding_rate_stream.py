@@ -0,0 +1,138 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from config import CONFIG
+import funding_rate_stream
+from fake_exchange import AsyncFakeExchange, AsyncFakeStreamingExchange, FakeExchange, start_fake_funding_rate_server
+from funding_rate_stream import get_rates_df, start_funding_rate_streams, stop_funding_rate_streams
+
+PAIRS = [f"COIN{index}/USDT:USDT" for index in range(30)]
+
+
+@pytest.fixture
+def config(monkeypatch):
+    for key, value in {'metrics': False, 'market_cache': False, 'retry_base_backoff_seconds': 0.01,
+                       'retry_max_backoff_seconds': 0.05, 'stream_rest_poll_seconds': 0.05,
+                       'stream_max_reconnects': 3}.items():
+        monkeypatch.setitem(CONFIG, key, value)
+
+
+@pytest.fixture
+def server_loop():
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    yield loop
+    loop.call_soon_threadsafe(loop.stop)
+
+
+def start_server(loop, **kwargs):
+    """
+    Starts the stand-in websocket server of exchange 'a' on its own event loop and returns its runner and URL.
+    """
+    return asyncio.run_coroutine_threadsafe(
+        start_fake_funding_rate_server(FakeExchange('a', markets=len(PAIRS)), **kwargs), loop).result()
+
+
+def use_exchanges(monkeypatch, factory):
+    """
+    Makes the streams create their exchange objects with factory and returns the list of created objects.
+    """
+    created = []
+
+    def init_stream_exchange(exchange_name):
+        exchange = factory(exchange_name)
+        created.append(exchange)
+        return exchange
+
+    monkeypatch.setattr(funding_rate_stream, 'init_stream_exchange', init_stream_exchange)
+    return created
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.01)
+
+
+def test_websocket_updates_table(config, monkeypatch, server_loop):
+    runner, url = start_server(server_loop, interval=0.01, batch_size=10)
+    created = use_exchanges(monkeypatch, lambda exchange_name: AsyncFakeStreamingExchange(
+        url, exchange_id=exchange_name, markets=len(PAIRS), latency=0, rate_limit=1))
+
+    streams = start_funding_rate_streams({'a': PAIRS})
+    stream = streams['streams']['a']
+    try:
+        # The REST snapshot fills the table, then every websocket message updates 10 pairs
+        wait_for(lambda: stream['source'] == 'websocket' and stream['updates'] >= len(PAIRS) + 50)
+        df = get_rates_df(stream)
+    finally:
+        stop_funding_rate_streams(streams)
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), server_loop).result()
+
+    assert list(df['pair']) == PAIRS
+    assert df['rate'].notna().all()
+    # Streamed rates move around the REST ones, so the table does not hold only the snapshot
+    rest_rates = {pair: round(FakeExchange('a')._funding_rate(pair)['fundingRate'] * 100, 3) for pair in PAIRS}
+    assert (df['rate'] != df['pair'].map(rest_rates)).any()
+    assert created[0].connection_count == 1
+    assert created[0].request_count == 1
+    assert stream['reconnects'] == 0
+
+
+def test_websocket_reconnects_after_drop(config, monkeypatch, server_loop):
+    runner, url = start_server(server_loop, interval=0.01, batch_size=10, drop_after=3)
+    created = use_exchanges(monkeypatch, lambda exchange_name: AsyncFakeStreamingExchange(
+        url, exchange_id=exchange_name, markets=len(PAIRS), latency=0, rate_limit=1))
+
+    streams = start_funding_rate_streams({'a': PAIRS})
+    stream = streams['streams']['a']
+    try:
+        # Every connection gets 3 messages of 10 pairs before the server closes it
+        wait_for(lambda: created and created[0].connection_count >= 3)
+        updates = stream['updates']
+        wait_for(lambda: stream['updates'] > updates)
+    finally:
+        stop_funding_rate_streams(streams)
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), server_loop).result()
+
+    assert stream['reconnects'] >= 2
+    # Reconnects reset after updates, so the stream is never given up
+    assert stream['source'] == 'websocket'
+    assert len(get_rates_df(stream)) == len(PAIRS)
+
+
+def test_rest_fallback_without_websocket(config, monkeypatch):
+    created = use_exchanges(monkeypatch, lambda exchange_name: AsyncFakeExchange(
+        exchange_name, markets=len(PAIRS), latency=0, rate_limit=1, bulk_funding_rates=False))
+
+    streams = start_funding_rate_streams({'b': PAIRS})
+    stream = streams['streams']['b']
+    try:
+        # Without fetchFundingRates every poll makes one request per pair
+        wait_for(lambda: stream['source'] == 'rest' and created[0].request_count >= 3 * len(PAIRS))
+    finally:
+        stop_funding_rate_streams(streams)
+
+    assert list(get_rates_df(stream)['pair']) == PAIRS
+
+
+def test_rest_fallback_after_failed_reconnects(config, monkeypatch, server_loop):
+    runner, url = start_server(server_loop)
+    # Nothing listens on the URL after the server is stopped, so every connection fails
+    asyncio.run_coroutine_threadsafe(runner.cleanup(), server_loop).result()
+    created = use_exchanges(monkeypatch, lambda exchange_name: AsyncFakeStreamingExchange(
+        url, exchange_id=exchange_name, markets=len(PAIRS), latency=0, rate_limit=1))
+
+    streams = start_funding_rate_streams({'a': PAIRS})
+    stream = streams['streams']['a']
+    try:
+        wait_for(lambda: stream['source'] == 'rest' and created[0].request_count >= 3)
+    finally:
+        stop_funding_rate_streams(streams)
+
+    assert stream['reconnects'] == CONFIG['stream_max_reconnects']
+    assert created[0].connection_count == 0
+    assert list(get_rates_df(stream)['pair']) == PAIRS
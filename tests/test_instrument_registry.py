@@ -0,0 +1,60 @@
+import pandas as pd
+import pytest
+from instrument_registry import (add_instrument_columns, get_exchange_symbol, get_instrument_columns,
+                                 get_instrument_symbols, get_symbol_dtype, parse_symbol)
+
+
+@pytest.mark.parametrize('symbol, expected', [
+    ('BTC/USDT:USDT', ('BTC', 'USDT', 'USDT', 1)),
+    ('1000PEPE/USDT:USDT', ('PEPE', 'USDT', 'USDT', 1000)),
+    ('10000SATS/USDT:USDT', ('SATS', 'USDT', 'USDT', 10000)),
+    ('1000000MOG/USDC:USDC', ('MOG', 'USDC', 'USDC', 1000000)),
+    ('1000PEPE/USDT', ('PEPE', 'USDT', None, 1000)),
+    ('BTC/USD:BTC', ('BTC', 'USD', 'BTC', 1)),
+    # Only powers of ten followed by the currency are multipliers
+    ('1INCH/USDT:USDT', ('1INCH', 'USDT', 'USDT', 1)),
+    ('1000/USDT:USDT', ('1000', 'USDT', 'USDT', 1)),
+    ('2000X/USDT:USDT', ('2000X', 'USDT', 'USDT', 1)),
+])
+def test_parse_symbol(symbol, expected):
+    assert parse_symbol(symbol) == expected
+
+
+@pytest.mark.parametrize('symbol', ['BTC/USDT:USDT', '1000PEPE/USDT:USDT', '1000000MOG/USDC:USDC', '1INCH/USDT:USDT'])
+def test_exchange_symbol_of_a_canonical_pair(symbol):
+    base, quote, settle, multiplier = parse_symbol(symbol)
+
+    assert get_exchange_symbol(f"{base}/{quote}:{settle}", multiplier) == symbol
+    assert get_exchange_symbol(f"{base}/{quote}:{settle}", multiplier, spot=True) == f"{base}/{quote}"
+
+
+def test_multiplied_contracts_share_the_instrument():
+    instrument_ids, spot_ids, multipliers, pairs = get_instrument_columns(pd.Series(
+        ['1000PEPE/USDT:USDT', 'PEPE/USDT:USDT', 'PEPE/USDT', 'PEPE/USDC:USDC', '1000PEPE/USDT:USDT']))
+
+    assert list(pairs) == ['PEPE/USDT:USDT', 'PEPE/USDT:USDT', 'PEPE/USDT', 'PEPE/USDC:USDC', 'PEPE/USDT:USDT']
+    assert list(multipliers) == [1000, 1, 1, 1, 1000]
+    assert instrument_ids[0] == instrument_ids[1] == instrument_ids[4]
+    assert len({instrument_ids[1], instrument_ids[2], instrument_ids[3]}) == 3
+    # Perpetuals point to the spot instrument with the same base and quote
+    assert spot_ids[0] == spot_ids[1] == spot_ids[2] == instrument_ids[2]
+    assert spot_ids[3] != spot_ids[0]
+    assert list(get_instrument_symbols(instrument_ids[:3])) == list(pairs[:3])
+
+
+def test_ids_are_stable():
+    first = get_instrument_columns(pd.Series(['ETH/USDT:USDT', '1000SHIB/USDT:USDT']))[0]
+    second = get_instrument_columns(pd.Series(['SHIB/USDT:USDT', 'NEWCOIN/USDT:USDT', 'ETH/USDT:USDT']))[0]
+
+    assert (second[0], second[2]) == (first[1], first[0])
+
+
+def test_add_instrument_columns_and_symbol_dtype():
+    df = add_instrument_columns(pd.DataFrame({'pair': ['10000SATS/USDT:USDT', 'BTC/USDT:USDT'], 'rate': [0.01, 0.02]}))
+
+    assert list(df.columns) == ['pair', 'rate', 'instrument_id', 'spot_id', 'multiplier']
+    assert list(df['pair']) == ['SATS/USDT:USDT', 'BTC/USDT:USDT']
+    assert list(df['multiplier']) == [10000, 1]
+    # The category code of a canonical symbol is its instrument id
+    codes = pd.Series(df['pair'], dtype=get_symbol_dtype()).cat.codes
+    assert list(codes) == list(df['instrument_id'])
@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+import pytest
+from config import CONFIG
+import liquidity
+from fake_exchange import AsyncFakeExchange, FakeExchange
+from liquidity import get_book_liquidity, get_fill_price, rank_by_liquidity
+
+BOOK = {'bids': [[99.0, 1.0], [98.0, 2.0], [97.0, 5.0]],
+        'asks': [[101.0, 1.0], [102.0, 2.0], [103.0, 5.0, 'ignored']]}
+CONTRACT_SIZES = {'a': 1, 'b': 10}
+
+
+class ContractSizeExchange(FakeExchange):
+    """
+    Fake exchange whose perpetual contracts are CONTRACT_SIZES[exchange] units of the base currency.
+    """
+
+    def _markets(self):
+        return [{**market, 'contractSize': CONTRACT_SIZES[self.id]} if market['type'] == 'swap' else market
+                for market in super()._markets()]
+
+
+def test_fill_price_walks_several_levels():
+    # 101 for 1 unit from the first level, then 149 of the 204 of the second one
+    price, filled = get_fill_price(BOOK['asks'], 250)
+
+    assert filled == 250
+    assert price == pytest.approx(250 / (1 + 149 / 102))
+
+
+def test_fill_price_of_a_single_level():
+    assert get_fill_price(BOOK['bids'], 50) == (pytest.approx(99.0), 50)
+
+
+def test_fill_price_of_a_book_too_shallow():
+    price, filled = get_fill_price(BOOK['asks'], 10000)
+
+    assert filled == 101 + 204 + 515
+    assert price == pytest.approx(filled / 8)
+
+
+def test_fill_price_with_contract_size():
+    # 10 units of the base currency per contract, so the first level holds 1010
+    price, filled = get_fill_price(BOOK['asks'], 2000, contract_size=10)
+
+    assert filled == 2000
+    assert price == pytest.approx(2000 / (10 + 990 / 102))
+
+
+def test_book_liquidity():
+    book_liquidity = get_book_liquidity(BOOK, 250)
+
+    assert book_liquidity['spread'] == pytest.approx(2.0)
+    assert book_liquidity['fill_pct'] == 100.0
+    bid_price = 250 / (1 + 151 / 98)
+    ask_price = 250 / (1 + 149 / 102)
+    assert book_liquidity['effective_spread'] == pytest.approx(100 * (ask_price - bid_price) / 100)
+
+
+def test_book_too_shallow_is_flagged():
+    book_liquidity = get_book_liquidity(BOOK, 10000)
+
+    # The bids hold 99 + 196 + 485 = 780, less than the asks
+    assert book_liquidity['fill_pct'] == pytest.approx(7.8)
+    assert np.isnan(book_liquidity['effective_spread'])
+    assert get_book_liquidity(BOOK, 10000, contract_size=10)['fill_pct'] == pytest.approx(78.0)
+
+
+def test_book_with_an_empty_side():
+    assert get_book_liquidity({'bids': [], 'asks': BOOK['asks']}, 100) is None
+    assert get_book_liquidity(None, 100) is None
+
+
+@pytest.fixture
+def config(monkeypatch):
+    for key, value in {'market_cache': False, 'metrics': False, 'liquidity_top_n': 4, 'liquidity_notional': 20000,
+                       'liquidity_order_book_limit': 5, 'liquidity_holding_days': 7,
+                       'liquidity_funding_interval_hours': 8}.items():
+        monkeypatch.setitem(CONFIG, key, value)
+    monkeypatch.setattr(liquidity, 'init_exchange', lambda exchange_name: ContractSizeExchange(
+        exchange_name, markets=10, latency=0, rate_limit=1))
+    monkeypatch.setattr(liquidity, 'init_async_exchange', lambda exchange_name: AsyncFakeExchange(
+        exchange_name, markets=10, latency=0, rate_limit=1, bulk_order_books=exchange_name == 'a'))
+
+
+def get_expected_liquidity(exchange_name, symbol, contract_size=1):
+    book = FakeExchange(exchange_name)._order_book(symbol, CONFIG['liquidity_order_book_limit'])
+    return get_book_liquidity(book, CONFIG['liquidity_notional'], contract_size)
+
+
+def test_rank_perp_perp_by_net_yield(config):
+    df = pd.DataFrame({'pair': [f"COIN{index}/USDT:USDT" for index in range(6)],
+                       'rate_diff': [0.06, 0.05, 0.04, 0.03, 0.02, 0.01],
+                       'short_exchange': ['a', 'b', 'a', 'b', 'a', 'b'],
+                       'long_exchange': ['b', 'a', 'b', 'a', 'b', 'a'],
+                       'short_rate': [0.05, 0.03, 0.02, 0.02, 0.01, 0.0],
+                       'long_rate': [-0.01, -0.02, -0.02, -0.01, -0.01, -0.01],
+                       'short_multiplier': 1, 'long_multiplier': 1})
+
+    ranked = rank_by_liquidity({'perp_perp': df})['perp_perp']
+
+    top = ranked.head(4)
+    assert sorted(top['pair']) == [f"COIN{index}/USDT:USDT" for index in range(4)]
+    # Rows below liquidity_top_n are not evaluated and keep their order
+    assert list(ranked['pair'][4:]) == ['COIN4/USDT:USDT', 'COIN5/USDT:USDT']
+    assert ranked['expected_net_yield'][4:].isna().all()
+    for row in top.itertuples():
+        legs = {'short': row.short_exchange, 'long': row.long_exchange}
+        expected = {leg: get_expected_liquidity(exchange_name, row.pair, CONTRACT_SIZES[exchange_name])
+                    for leg, exchange_name in legs.items()}
+        for leg in legs:
+            for column in ['spread', 'fill_pct', 'effective_spread']:
+                assert getattr(row, f'{leg}_{column}') == pytest.approx(round(expected[leg][column], 4), nan_ok=True)
+        assert row.expected_funding == pytest.approx(21 * (row.short_rate - row.long_rate))
+        assert row.expected_net_yield == pytest.approx(row.expected_funding - row.trading_cost, abs=1e-4,
+                                                       nan_ok=True)
+    # Best net yield first. The book of COIN0 on a can not fill the notional, so the row goes last
+    assert top['expected_net_yield'][:3].notna().all()
+    assert list(top['expected_net_yield'][:3]) == sorted(top['expected_net_yield'][:3], reverse=True)
+    assert ranked['pair'][3] == 'COIN0/USDT:USDT'
+    assert ranked['short_fill_pct'][3] < 100
+    # The contracts of b are 10 units each, so its thin book of COIN3 still fills the notional
+    coin3 = ranked.set_index('pair').loc['COIN3/USDT:USDT']
+    assert coin3['short_fill_pct'] == 100
+    assert get_expected_liquidity('b', 'COIN3/USDT:USDT')['fill_pct'] < 100
+
+
+def test_rank_spot_perp_uses_the_most_liquid_spot_book(config):
+    df = pd.DataFrame({'pair': ['COIN0/USDT:USDT', 'COIN1/USDT:USDT'], 'rate': [0.03, 0.02],
+                       'perp_exchange': ['a', 'a'], 'spot_exchange': ['a/b', 'b'], 'multiplier': 1})
+
+    ranked = rank_by_liquidity({'spot_perp_positive': df})['spot_perp_positive']
+
+    row = ranked.set_index('pair').loc['COIN0/USDT:USDT']
+    books = {exchange_name: get_expected_liquidity(exchange_name, 'COIN0/USDT') for exchange_name in ['a', 'b']}
+    best = min(books, key=lambda exchange_name: (-books[exchange_name]['fill_pct'],
+                                                 np.nan_to_num(books[exchange_name]['effective_spread'], nan=np.inf)))
+    assert row['spot_book_exchange'] == best
+    assert row['spot_fill_pct'] == pytest.approx(round(books[best]['fill_pct'], 4))
+    assert ranked.set_index('pair').loc['COIN1/USDT:USDT', 'spot_book_exchange'] == 'b'
@@ -0,0 +1,139 @@
+import threading
+
+import pytest
+from config import CONFIG
+import exchange
+import market_cache
+from fake_exchange import FakeExchange
+from market_cache import get_cache_path, get_markets, get_trading_pairs
+
+HOUR = 3600
+
+
+class FakeClock:
+    """
+    Stands in for the time module of market_cache, so the cache gets stale without waiting.
+    """
+
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def time(self):
+        return self.now
+
+
+class ExchangeFactory:
+    """
+    Creates fake exchanges with a number of markets that can be changed, and keeps them to count their requests.
+    """
+
+    def __init__(self):
+        self.markets = 2
+        self.exchanges = []
+
+    def __call__(self, exchange_name):
+        self.exchanges.append(FakeExchange(exchange_name, markets=self.markets, latency=0, rate_limit=1))
+        return self.exchanges[-1]
+
+    def request_count(self):
+        return sum(fake_exchange.request_count for fake_exchange in self.exchanges)
+
+
+@pytest.fixture
+def clock(monkeypatch, tmp_path):
+    for key, value in {'directory': str(tmp_path), 'market_cache': True, 'market_cache_ttl_hours': 24,
+                       'market_cache_subdirectory': 'market_cache', 'metrics': False}.items():
+        monkeypatch.setitem(CONFIG, key, value)
+    clear_memory(monkeypatch)
+    clock = FakeClock()
+    monkeypatch.setattr(market_cache, 'time', clock)
+    return clock
+
+
+@pytest.fixture
+def factory(monkeypatch):
+    factory = ExchangeFactory()
+    # The background refresh creates its exchange object with exchange.init_exchange
+    monkeypatch.setattr(exchange, 'init_exchange', factory)
+    return factory
+
+
+def clear_memory(monkeypatch):
+    """
+    Forgets the markets cached in memory, like a new run.
+    """
+    for name in ['markets_by_exchange', 'pairs_by_exchange', 'exchange_locks']:
+        monkeypatch.setattr(market_cache, name, {})
+    monkeypatch.setattr(market_cache, 'refreshing', set())
+
+
+def wait_for_refresh():
+    for thread in threading.enumerate():
+        if thread.name.startswith('markets-'):
+            thread.join(timeout=10)
+
+
+def test_markets_are_fetched_once_for_all_roles(clock, factory, monkeypatch):
+    perpetual_pairs = get_trading_pairs(factory('a'), perpetual=True)
+    spot_pairs = get_trading_pairs(factory('a'))
+
+    assert perpetual_pairs == ['COIN0/USDT:USDT', 'COIN1/USDT:USDT']
+    assert spot_pairs == ['COIN0/USDT', 'COIN1/USDT']
+    assert factory.request_count() == 1
+    # The markets are set on the exchange objects, so ccxt does not load them again
+    assert all(fake_exchange.markets for fake_exchange in factory.exchanges)
+
+    # A new run reads them from the cache file
+    clear_memory(monkeypatch)
+    clock.now += 23 * HOUR
+    assert get_trading_pairs(factory('a'), perpetual=True) == perpetual_pairs
+    assert factory.request_count() == 1
+
+
+def test_stale_markets_are_refreshed_in_the_background(clock, factory, monkeypatch):
+    get_markets(factory('a'))
+    factory.markets = 3
+    clock.now += 25 * HOUR
+
+    # The stale markets are still returned at once, fresh ones are fetched for later callers
+    assert get_trading_pairs(factory('a'), perpetual=True) == ['COIN0/USDT:USDT', 'COIN1/USDT:USDT']
+    wait_for_refresh()
+    assert factory.request_count() == 2
+    assert get_trading_pairs(factory('a'), perpetual=True)[-1] == 'COIN2/USDT:USDT'
+    assert factory.request_count() == 2
+
+    # The refreshed markets are written to the cache file for the next run
+    clear_memory(monkeypatch)
+    assert len(get_markets(factory('a'))) == 6
+    assert factory.request_count() == 2
+
+
+def test_fresh_markets_are_not_refreshed(clock, factory):
+    get_markets(factory('a'))
+    clock.now += 24 * HOUR
+
+    get_markets(factory('a'))
+    wait_for_refresh()
+
+    assert factory.request_count() == 1
+
+
+def test_unreadable_cache_file_is_fetched_again(clock, factory, monkeypatch, capsys):
+    get_markets(factory('a'))
+    with open(get_cache_path('a'), 'w') as file:
+        file.write('{"fetched_at": 1700000000.0, "markets": [')
+    clear_memory(monkeypatch)
+
+    assert len(get_markets(factory('a'))) == 4
+    assert factory.request_count() == 2
+    assert "Error reading market cache for a" in capsys.readouterr().out
+
+
+def test_cache_disabled(clock, factory, monkeypatch):
+    monkeypatch.setitem(CONFIG, 'market_cache', False)
+
+    get_markets(factory('a'))
+    get_markets(factory('a'))
+
+    assert factory.request_count() == 2
+    assert not market_cache.markets_by_exchange
@@ -0,0 +1,145 @@
+import json
+import os
+import re
+
+import ccxt
+import pytest
+from config import CONFIG
+import metrics
+from fake_exchange import FakeExchange
+from metrics import (LATENCY_BUCKETS, export_metrics, format_prometheus, get_metrics_snapshot, record_request,
+                     record_retry, stage_timer)
+
+SAMPLE = re.compile(r'^([a-z_]+)\{([^}]*)\} (\S+)$')
+
+
+class ResponseExchange(FakeExchange):
+    """
+    Fake exchange with the body of its last HTTP response, like a ccxt exchange.
+    """
+
+    def __init__(self, exchange_id):
+        super().__init__(exchange_id, markets=1, latency=0, rate_limit=1)
+        self.last_http_response = '{"fundingRate": 0.0001}'
+
+
+@pytest.fixture
+def config(monkeypatch):
+    monkeypatch.setitem(CONFIG, 'metrics', True)
+    monkeypatch.setattr(metrics, 'requests', {})
+    monkeypatch.setattr(metrics, 'stages', {})
+
+
+def record_requests():
+    binance, bybit = ResponseExchange('binance'), ResponseExchange('bybit')
+    record_request(binance, 'funding_rate', 0.04)
+    record_request(binance, 'funding_rate', 0.3)
+    record_request(binance, 'funding_rate', 45, error=ccxt.RequestTimeout('timeout'))
+    record_retry(binance, 'funding_rate')
+    record_request(bybit, 'ohlcv', 0.1)
+
+
+def parse_prometheus(text):
+    """
+    Parses the samples of a metrics text into {(name, labels): value}, checking that every metric is declared.
+    """
+    declared = set()
+    samples = {}
+    for line in text.splitlines():
+        if line.startswith('# TYPE '):
+            declared.add(line.split()[2])
+            continue
+        if line.startswith('# HELP '):
+            continue
+        name, labels, value = SAMPLE.match(line).groups()
+        assert re.sub(r'_(bucket|sum|count)$', '', name) in declared or name in declared
+        samples[name, labels] = float(value)
+    return samples
+
+
+def test_request_metrics(config):
+    record_requests()
+
+    snapshot = get_metrics_snapshot()
+
+    binance, bybit = snapshot['requests']
+    assert (binance['exchange'], binance['endpoint'], bybit['exchange']) == ('binance', 'funding_rate', 'bybit')
+    assert binance['requests'] == 3
+    assert binance['retries'] == 1
+    assert binance['errors'] == {'RequestTimeout': 1}
+    # Failed requests have no response
+    assert binance['bytes'] == 2 * len('{"fundingRate": 0.0001}')
+    assert binance['latency_sum'] == pytest.approx(45.34)
+    # 0.04 in the first bucket, 0.3 up to 0.5 and 45 above the last bound
+    expected_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+    expected_buckets[0] = expected_buckets[3] = expected_buckets[-1] = 1
+    assert binance['latency_buckets'] == expected_buckets
+    # The bound of a bucket is included in it
+    assert bybit['latency_buckets'][1] == 1
+
+
+def test_metrics_disabled(config, monkeypatch, tmp_path):
+    monkeypatch.setitem(CONFIG, 'metrics', False)
+    record_requests()
+    with stage_timer('analysis'):
+        pass
+
+    export_metrics(f"{tmp_path}/metrics")
+
+    assert get_metrics_snapshot()['requests'] == []
+    assert get_metrics_snapshot()['stages'] == {}
+    assert not os.path.exists(f"{tmp_path}/metrics")
+
+
+def test_stage_timer(config):
+    for _ in range(2):
+        with stage_timer('analysis'):
+            pass
+    with pytest.raises(ValueError):
+        with stage_timer('load_files'):
+            raise ValueError
+
+    stages = get_metrics_snapshot()['stages']
+
+    assert stages['analysis']['runs'] == 2
+    assert stages['analysis']['total_seconds'] >= stages['analysis']['last_seconds'] >= 0
+    # Failed stages are timed as well
+    assert stages['load_files']['runs'] == 1
+
+
+def test_prometheus_format(config):
+    record_requests()
+    with stage_timer('analysis'):
+        pass
+
+    samples = parse_prometheus(format_prometheus(get_metrics_snapshot()))
+
+    labels = 'exchange="binance",endpoint="funding_rate"'
+    assert samples['scanner_requests_total', labels] == 3
+    assert samples['scanner_request_retries_total', labels] == 1
+    assert samples['scanner_request_errors_total', f'{labels},error="RequestTimeout"'] == 1
+    assert samples['scanner_response_bytes_total', labels] == 46
+    # Histogram buckets are cumulative and end with +Inf, which counts every request
+    buckets = [samples['scanner_request_duration_seconds_bucket', f'{labels},le="{bound}"']
+               for bound in LATENCY_BUCKETS + ['+Inf']]
+    assert buckets == [1, 1, 1, 2, 2, 2, 2, 2, 2, 3]
+    assert samples['scanner_request_duration_seconds_count', labels] == 3
+    assert samples['scanner_request_duration_seconds_sum', labels] == pytest.approx(45.34)
+    assert samples['scanner_stage_runs_total', 'stage="analysis"'] == 1
+
+
+def test_export_textfile(config, tmp_path):
+    record_requests()
+    directory_metrics = f"{tmp_path}/metrics"
+
+    export_metrics(directory_metrics)
+    record_retry(ResponseExchange('binance'), 'funding_rate')
+    export_metrics(directory_metrics)
+
+    # Files are replaced as a whole, no temporary files are left for the textfile collector
+    assert sorted(os.listdir(directory_metrics)) == ['metrics.json', 'metrics.prom']
+    with open(f"{directory_metrics}/metrics.prom") as file:
+        samples = parse_prometheus(file.read())
+    assert samples['scanner_request_retries_total', 'exchange="binance",endpoint="funding_rate"'] == 2
+    with open(f"{directory_metrics}/metrics.json") as file:
+        assert json.load(file) == json.loads(json.dumps(get_metrics_snapshot()))
@@ -0,0 +1,204 @@
+import ast
+
+import numpy as np
+import pandas as pd
+import pytest
+from config import CONFIG
+from analyze_data import (create_perp_perp_opportunities_df, create_perp_perp_opportunities_matrix_df,
+                          generate_perp_perp_opportunities_pairwise, prepare_perpetual_data_df, sum_historical_rates)
+
+
+def create_perp_perp_opportunities_df_baseline(exchange_1, exchange_2, df_1, df_2):
+    """
+    Perpetual-Perpetual opportunities as built before the vectorized builder, with merge and row-wise apply.
+    """
+    df = pd.merge(df_1, df_2, on='pair', how='inner')
+
+    # Identify short and long exchanges
+    df['short_exchange'] = exchange_1
+    df['long_exchange'] = exchange_2
+    df.loc[df['rate_x'] < df['rate_y'], ['short_exchange', 'long_exchange']] = exchange_2, exchange_1
+
+    # Identify short and long rates
+    df['short_rate'] = df.apply(lambda x: x['rate_x'] if x['short_exchange'] == exchange_1 else x['rate_y'],
+                                axis=1)
+    df['long_rate'] = df.apply(lambda x: x['rate_x'] if x['long_exchange'] == exchange_1 else x['rate_y'],
+                               axis=1)
+    df['rate_diff'] = df['short_rate'] - df['long_rate']
+
+    # Identify historical rates for short and long exchanges
+    df['historical_rates_x'] = df['historical_rates_x'].fillna('[]').apply(ast.literal_eval)
+    df['historical_rates_y'] = df['historical_rates_y'].fillna('[]').apply(ast.literal_eval)
+
+    df['short_historical_rates'] = df.apply(
+        lambda x: x['historical_rates_x'] if x['short_exchange'] == exchange_1
+        else x['historical_rates_y'], axis=1)
+    df['long_historical_rates'] = df.apply(
+        lambda x: x['historical_rates_x'] if x['long_exchange'] == exchange_1
+        else x['historical_rates_y'], axis=1)
+
+    # Calculate cumulative rates and average APY
+    df['short_cumulative_rate'] = df['short_historical_rates'].apply(sum)
+    df['long_cumulative_rate'] = df['long_historical_rates'].apply(sum)
+
+    df['cumulative_rate_diff'] = df['short_cumulative_rate'] - df['long_cumulative_rate']
+    df['APY_historical_average'] = 365 * df['cumulative_rate_diff'] / CONFIG['funding_historical_days']
+    df['APY_historical_average'] = df['APY_historical_average'].round(decimals=2)
+
+    # Identify amplitude as the maximum between two exchanges or the values with more data available
+    # Assigning initial values
+    df['mean_daily_amplitude'] = df[['mean_daily_amplitude_x', 'mean_daily_amplitude_y']].max(axis=1)
+    df['max_daily_amplitude'] = df[['max_daily_amplitude_x', 'max_daily_amplitude_y']].max(axis=1)
+    df['amplitude_days'] = df['amplitude_days_x']
+
+    # Updating values based on conditions
+    condition_1 = df['amplitude_days_x'] > df['amplitude_days_y']
+    condition_2 = df['amplitude_days_y'] > df['amplitude_days_x']
+
+    df.loc[condition_1, 'mean_daily_amplitude'] = df['mean_daily_amplitude_x']
+    df.loc[condition_1, 'max_daily_amplitude'] = df['max_daily_amplitude_x']
+    df.loc[condition_1, 'amplitude_days'] = df['amplitude_days_x']
+    df.loc[condition_2, 'mean_daily_amplitude'] = df['mean_daily_amplitude_y']
+    df.loc[condition_2, 'max_daily_amplitude'] = df['max_daily_amplitude_y']
+    df.loc[condition_2, 'amplitude_days'] = df['amplitude_days_y']
+
+    return df[
+        ['pair', 'rate_diff', f'APY_historical_average', 'short_exchange', 'long_exchange',
+         'mean_daily_amplitude', 'max_daily_amplitude', 'amplitude_days', 'short_rate', 'long_rate',
+         'short_cumulative_rate', 'long_cumulative_rate', 'short_historical_rates', 'long_historical_rates']]
+
+
+def create_snapshot(seed, pairs, listed_pairs=None):
+    """
+    Creates a funding_rates_{exchange} snapshot as loaded from a CSV file, with equal and missing rates
+    and missing, empty and partial histories.
+    """
+    rng = np.random.default_rng(seed)
+    listed_pairs = listed_pairs if listed_pairs is not None else range(pairs)
+    # Rates of a few values only, so many pairs have equal rates on both exchanges
+    rates = rng.choice([-0.01, 0.0, 0.005, 0.01, np.nan], pairs, p=[0.3, 0.2, 0.2, 0.25, 0.05])
+    histories = []
+    for index in range(pairs):
+        kind = rng.integers(0, 4)
+        if kind == 0:
+            histories.append(np.nan)
+        elif kind == 1:
+            histories.append('[]')
+        else:
+            histories.append(str(list(rng.uniform(-0.01, 0.01, rng.integers(1, 10)).round(4))))
+    df = pd.DataFrame({
+        'pair': [f"COIN{index}/USDT:USDT" for index in range(pairs)],
+        'rate': rates,
+        'historical_rates': histories,
+        'mean_daily_amplitude': rng.uniform(1, 20, pairs).round(2),
+        'max_daily_amplitude': rng.uniform(20, 60, pairs).round(2),
+        'amplitude_days': rng.integers(1, 4, pairs),
+    })
+    df = df.iloc[list(listed_pairs)]
+    return df.iloc[rng.permutation(len(df))].reset_index(drop=True)
+
+
+def to_lists(df):
+    """
+    Converts the historical rates columns to lists of floats, compact snapshots keep them as arrays.
+    """
+    for column in ['short_historical_rates', 'long_historical_rates']:
+        df[column] = [[float(rate) for rate in rates] for rates in df[column]]
+    return df
+
+
+@pytest.fixture(params=[False, True], ids=['plain', 'compact'])
+def compact(request, monkeypatch):
+    monkeypatch.setitem(CONFIG, 'compact_snapshots', request.param)
+    monkeypatch.setitem(CONFIG, 'funding_history_store', False)
+    return request.param
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_matches_baseline(compact, seed):
+    df_1 = create_snapshot(seed, 300, listed_pairs=range(0, 250))
+    df_2 = create_snapshot(seed + 100, 300, listed_pairs=range(50, 300))
+
+    expected = create_perp_perp_opportunities_df_baseline('a', 'b', df_1.copy(), df_2.copy())
+    result = create_perp_perp_opportunities_df('a', 'b', prepare_perpetual_data_df('a', df_1.copy()),
+                                               prepare_perpetual_data_df('b', df_2.copy()))
+
+    # Pairs listed on one exchange only are not combined
+    assert len(expected) == 200
+    result = to_lists(result[expected.columns].astype({'pair': str, 'short_exchange': str, 'long_exchange': str}))
+    pd.testing.assert_frame_equal(result, to_lists(expected), check_dtype=False)
+
+
+def test_equal_rates_keep_exchange_order(compact):
+    df = create_snapshot(3, 50)
+    df['rate'] = 0.01
+
+    result = create_perp_perp_opportunities_df('a', 'b', prepare_perpetual_data_df('a', df.copy()),
+                                               prepare_perpetual_data_df('b', df.copy()))
+
+    assert (result['short_exchange'] == 'a').all()
+    assert (result['long_exchange'] == 'b').all()
+    assert (result['rate_diff'] == 0).all()
+
+
+def test_no_common_pairs(compact):
+    df_1 = create_snapshot(4, 100, listed_pairs=range(0, 50))
+    df_2 = create_snapshot(5, 100, listed_pairs=range(50, 100))
+
+    result = create_perp_perp_opportunities_df('a', 'b', prepare_perpetual_data_df('a', df_1),
+                                               prepare_perpetual_data_df('b', df_2))
+
+    assert result.empty
+    assert list(result.columns[:5]) == ['pair', 'rate_diff', 'APY_historical_average', 'short_exchange',
+                                        'long_exchange']
+
+
+def test_sum_historical_rates():
+    historical_rates = pd.Series([[], [0.1, -0.2], np.array([0.3]), [0.0] * 5, []], dtype=object)
+
+    np.testing.assert_allclose(sum_historical_rates(historical_rates), [0.0, -0.1, 0.3, 0.0, 0.0])
+    assert len(sum_historical_rates(pd.Series([], dtype=object))) == 0
+
+
+@pytest.mark.parametrize('threshold', [-1, 0])
+def test_matrix_best_pair_only_equal_rates(compact, threshold):
+    df = create_snapshot(6, 50)
+    df['rate'] = 0.01
+    perpetual_data_df = {exchange: prepare_perpetual_data_df(exchange, df.copy()) for exchange in ['a', 'b', 'c']}
+
+    result = create_perp_perp_opportunities_matrix_df(perpetual_data_df, threshold, best_pair_only=True)
+
+    assert len(result) == (50 if threshold < 0 else 0)
+    assert (result['short_exchange'].astype(str) == 'a').all()
+    assert (result['long_exchange'].astype(str) == 'b').all()
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_matrix_best_pair_only_matches_pairwise(compact, seed):
+    perpetual_data_df = {exchange: prepare_perpetual_data_df(exchange, create_snapshot(seed * 10 + index, 200))
+                         for index, exchange in enumerate(['a', 'b', 'c'])}
+
+    pairwise = pd.concat(list(generate_perp_perp_opportunities_pairwise(perpetual_data_df, -1)), ignore_index=True)
+    result = create_perp_perp_opportunities_matrix_df(perpetual_data_df, -1, best_pair_only=True)
+
+    # Every pair gets one row with two different exchanges and the largest rate difference of the pairwise rows
+    assert (result['short_exchange'].astype(str) != result['long_exchange'].astype(str)).all()
+    assert result['pair'].is_unique
+    best = pairwise.assign(pair=pairwise['pair'].astype(str)).groupby('pair')['rate_diff'].max()
+    result = result.assign(pair=result['pair'].astype(str)).set_index('pair')['rate_diff']
+    pd.testing.assert_series_equal(result.sort_index(), best.reindex(result.index).sort_index(), check_names=False)
+
+
+def test_default_columns(monkeypatch, tmp_path):
+    # Statistics from the funding history store are opt-in, by default only the multipliers are new
+    monkeypatch.setitem(CONFIG, 'directory', str(tmp_path))
+    df_1, df_2 = create_snapshot(8, 50), create_snapshot(9, 50)
+    expected = list(create_perp_perp_opportunities_df_baseline('a', 'b', df_1.copy(), df_2.copy()).columns)
+    expected[expected.index('long_rate') + 1:expected.index('long_rate') + 1] = ['short_multiplier', 'long_multiplier']
+    perpetual_data_df = {'a': prepare_perpetual_data_df('a', df_1), 'b': prepare_perpetual_data_df('b', df_2)}
+
+    result = create_perp_perp_opportunities_df('a', 'b', perpetual_data_df['a'], perpetual_data_df['b'])
+    matrix_result = create_perp_perp_opportunities_matrix_df(perpetual_data_df, -1)
+
+    assert list(result.columns) == expected
+    assert list(matrix_result.columns) == expected
@@ -0,0 +1,163 @@
+import asyncio
+import random
+import time
+
+import ccxt
+import pytest
+from config import CONFIG
+import fake_exchange
+import request_scheduler
+from fake_exchange import AsyncFakeExchange, FakeExchange
+from request_scheduler import MIN_RATE_FACTOR, TokenBucket, get_scheduler, scheduled_call, scheduled_call_async
+
+
+class FakeClock:
+    """
+    Virtual clock shared by the scheduler and the fake exchange, so waits take no real time.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def perf_counter(self):
+        return self.now
+
+    def time(self):
+        return time.time()
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    async def sleep_async(self, seconds):
+        self.sleep(seconds)
+        await asyncio.sleep(0)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(request_scheduler, 'time', clock)
+    monkeypatch.setattr(fake_exchange, 'time', clock)
+    monkeypatch.setattr(request_scheduler, 'asyncio', type('asyncio', (), {'sleep': staticmethod(clock.sleep_async)}))
+    for key, value in {'request_scheduler': True, 'metrics': False, 'rate_limit_burst': 10,
+                       'max_retries_per_request': 3, 'max_retries_per_run': 500,
+                       'retry_base_backoff_seconds': 1, 'retry_max_backoff_seconds': 4}.items():
+        monkeypatch.setitem(CONFIG, key, value)
+    random.seed(0)
+    return clock
+
+
+def get_backoffs(clock):
+    """
+    Returns the waits before retries. Waits for tokens are shorter than the base backoff here.
+    """
+    return [seconds for seconds in clock.sleeps if seconds >= CONFIG['retry_base_backoff_seconds'] * 0.5]
+
+
+def check_backoffs(backoffs):
+    for attempt, seconds in enumerate(backoffs):
+        backoff = min(CONFIG['retry_max_backoff_seconds'], CONFIG['retry_base_backoff_seconds'] * 2 ** attempt)
+        assert backoff * 0.5 <= seconds <= backoff
+
+
+def test_token_bucket_rate():
+    bucket = TokenBucket(rate=10, capacity=10)
+
+    bucket.slow_down()
+    assert bucket.rate == 5
+    for _ in range(10):
+        bucket.slow_down()
+    assert bucket.rate == 10 * MIN_RATE_FACTOR
+
+    for _ in range(17):
+        bucket.speed_up()
+    assert bucket.rate < 10
+    bucket.speed_up()
+    assert bucket.rate == 10
+    bucket.speed_up()
+    assert bucket.rate == 10
+
+
+def test_network_errors_back_off_until_the_request_cap(clock):
+    exchange = FakeExchange('a', markets=1, latency=0, error_rate=1.0)
+
+    with pytest.raises(ccxt.NetworkError):
+        scheduled_call(exchange, 'funding_rate', exchange.fetch_funding_rate, 'COIN0/USDT:USDT')
+
+    assert exchange.request_count == CONFIG['max_retries_per_request'] + 1
+    assert get_scheduler(exchange).retries == CONFIG['max_retries_per_request']
+    backoffs = get_backoffs(clock)
+    assert len(backoffs) == CONFIG['max_retries_per_request']
+    check_backoffs(backoffs)
+    # Network errors do not lower the request rate
+    assert get_scheduler(exchange).bucket.rate == get_scheduler(exchange).bucket.base_rate
+
+
+def test_run_retry_budget(clock, monkeypatch):
+    monkeypatch.setitem(CONFIG, 'max_retries_per_run', 5)
+    exchange = FakeExchange('a', markets=1, latency=0, error_rate=1.0)
+
+    request_counts = []
+    for _ in range(3):
+        with pytest.raises(ccxt.NetworkError):
+            scheduled_call(exchange, 'funding_rate', exchange.fetch_funding_rate, 'COIN0/USDT:USDT')
+        request_counts.append(exchange.request_count - sum(request_counts))
+
+    # 3 retries for the first request, the 2 left for the second one and none for the third one
+    assert request_counts == [4, 3, 1]
+    assert get_scheduler(exchange).retries == 5
+
+
+def test_throttling_halves_and_recovers_the_rate(clock):
+    # The exchange advertises 20 requests per second but allows 5
+    exchange = FakeExchange('a', markets=1, latency=0, rate_limit=50, max_requests_per_second=5)
+    bucket = get_scheduler(exchange).bucket
+
+    rates = []
+    for _ in range(30):
+        result = scheduled_call(exchange, 'funding_rate', exchange.fetch_funding_rate, 'COIN0/USDT:USDT')
+        assert result['symbol'] == 'COIN0/USDT:USDT'
+        rates.append(bucket.rate)
+
+    assert exchange.throttled_count > 0
+    assert get_scheduler(exchange).retries == exchange.throttled_count
+    assert min(rates) <= bucket.base_rate / 2
+    assert min(rates) >= bucket.base_rate * MIN_RATE_FACTOR
+
+    # Successful requests bring the rate back to the rate limit
+    exchange.max_requests_per_second = None
+    for _ in range(20):
+        scheduled_call(exchange, 'funding_rate', exchange.fetch_funding_rate, 'COIN0/USDT:USDT')
+    assert bucket.rate == bucket.base_rate
+
+
+def test_async_network_errors_back_off_until_the_request_cap(clock):
+    exchange = AsyncFakeExchange('a', markets=1, latency=0, error_rate=1.0)
+
+    with pytest.raises(ccxt.NetworkError):
+        asyncio.run(scheduled_call_async(exchange, 'funding_rate', exchange.fetch_funding_rate, 'COIN0/USDT:USDT'))
+
+    assert exchange.request_count == CONFIG['max_retries_per_request'] + 1
+    check_backoffs(get_backoffs(clock))
+
+
+def test_async_concurrent_throttled_requests(clock):
+    exchange = AsyncFakeExchange('a', markets=40, latency=0, rate_limit=50, max_requests_per_second=5)
+    bucket = get_scheduler(exchange).bucket
+
+    async def fetch_all():
+        return await asyncio.gather(*(scheduled_call_async(exchange, 'funding_rate', exchange.fetch_funding_rate,
+                                                           f"COIN{index}/USDT:USDT") for index in range(40)))
+
+    results = asyncio.run(fetch_all())
+
+    assert [result['symbol'] for result in results] == [f"COIN{index}/USDT:USDT" for index in range(40)]
+    assert exchange.throttled_count > 0
+    assert get_scheduler(exchange).retries == exchange.throttled_count
+    assert exchange.request_count == 40 + exchange.throttled_count
+    assert bucket.rate < bucket.base_rate
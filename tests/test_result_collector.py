@@ -0,0 +1,118 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+from result_collector import ResultCollector
+
+
+def create_chunks(seed=0, chunks=5, rows=40):
+    """
+    Creates chunks of opportunities with repeated pairs and tied rates.
+    """
+    rng = np.random.default_rng(seed)
+    return [pd.DataFrame({'pair': [f"COIN{index}/USDT:USDT" for index in rng.integers(0, 30, rows)],
+                          'rate_diff': rng.choice(np.arange(-0.05, 0.05, 0.005), rows).round(3),
+                          'historical_rates': [list(rng.normal(0, 0.01, 3).round(3)) for _ in range(rows)]})
+            for _ in range(chunks)]
+
+
+def sort_all(chunks, ascending=False, unique_column=None):
+    """
+    Sorts all opportunities at once, as without a collector.
+    """
+    df = pd.concat(chunks, ignore_index=True)
+    df = df.sort_values(by=['rate_diff', 'pair'], ascending=[ascending, True], ignore_index=True)
+    if unique_column:
+        df = df.drop_duplicates(subset=unique_column, ignore_index=True)
+    return df
+
+
+def collect(chunks, **kwargs):
+    collector = ResultCollector('rate_diff', **kwargs)
+    for df in chunks:
+        collector.add(df)
+    return collector.result()
+
+
+@pytest.mark.parametrize('ascending', [False, True])
+def test_all_rows_sorted(ascending):
+    chunks = create_chunks()
+
+    df = collect(chunks, ascending=ascending)
+
+    assert len(df) == 200
+    assert df['rate_diff'].is_monotonic_decreasing if not ascending else df['rate_diff'].is_monotonic_increasing
+    expected = sort_all(chunks, ascending)
+    assert sorted(map(tuple, df[['pair', 'rate_diff']].to_numpy())) == \
+        sorted(map(tuple, expected[['pair', 'rate_diff']].to_numpy()))
+
+
+@pytest.mark.parametrize('ascending', [False, True])
+@pytest.mark.parametrize('unique_column', [None, 'pair'])
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_top_k(ascending, unique_column, seed):
+    chunks = create_chunks(seed)
+
+    df = collect(chunks, ascending=ascending, top_k=10, unique_column=unique_column)
+
+    expected = sort_all(chunks, ascending, unique_column)
+    assert len(df) == 10
+    # Rows tied with the last kept one may be any of them, the kept values are the best ones
+    assert list(df['rate_diff']) == list(expected['rate_diff'][:10])
+    if unique_column:
+        assert df['pair'].is_unique
+        best = expected.set_index('pair')['rate_diff']
+        assert (df['rate_diff'].to_numpy() == best[df['pair']].to_numpy()).all()
+
+
+def test_unique_column_without_top_k():
+    chunks = create_chunks()
+
+    df = collect(chunks, unique_column='pair')
+
+    expected = sort_all(chunks, unique_column='pair')
+    assert df['pair'].is_unique
+    assert sorted(map(tuple, df[['pair', 'rate_diff']].to_numpy())) == \
+        sorted(map(tuple, expected[['pair', 'rate_diff']].to_numpy()))
+
+
+def test_no_rows_keeps_the_columns():
+    df = collect([pd.DataFrame(columns=['pair', 'rate_diff'])], top_k=10)
+
+    assert df.empty
+    assert list(df.columns) == ['pair', 'rate_diff']
+
+
+@pytest.mark.parametrize('top_k', [None, 10])
+def test_stream_jsonl(tmp_path, top_k):
+    chunks = create_chunks()
+    path = tmp_path / 'result' / 'stream_perp_perp_a_b.jsonl'
+
+    collect(chunks, top_k=top_k, stream_path=str(path))
+
+    # Every opportunity is streamed in the order found, also the ones top_k does not keep
+    rows = [json.loads(line) for line in path.read_text().splitlines()]
+    assert rows == [row for df in chunks for row in df.to_dict(orient='records')]
+
+
+def test_stream_csv(tmp_path):
+    chunks = create_chunks()
+    path = tmp_path / 'stream_perp_perp_a_b.csv'
+
+    collect([chunks[0].iloc[:0], *chunks], top_k=10, stream_path=str(path))
+
+    # One header, then the rows of every chunk with the historical rates as lists
+    df = pd.read_csv(path)
+    expected = pd.concat(chunks, ignore_index=True)
+    pd.testing.assert_frame_equal(df[['pair', 'rate_diff']], expected[['pair', 'rate_diff']])
+    assert list(df['historical_rates']) == [str(rates) for rates in expected['historical_rates']]
+
+
+def test_stream_is_started_empty(tmp_path):
+    path = tmp_path / 'stream_perp_perp_a_b.jsonl'
+    path.write_text('{"pair": "OLD/USDT:USDT"}\n')
+
+    collect([pd.DataFrame(columns=['pair', 'rate_diff'])], stream_path=str(path))
+
+    assert path.read_text() == ''
@@ -0,0 +1,118 @@
+import http.client
+import json
+
+import pandas as pd
+import pytest
+from config import CONFIG
+import results_api
+from results_api import publish_results, start_api_server, stop_api_server
+
+
+def create_results(rate_diff=0.05):
+    perp_perp = pd.DataFrame({'pair': ['BTC/USDT:USDT', 'ETH/USDT:USDT', 'BTC/USDT:USDT', 'SOL/USDT:USDT'],
+                              'short_exchange': ['a', 'b', 'c', 'a'],
+                              'long_exchange': ['b', 'c', 'a', 'c'],
+                              'rate_diff': [rate_diff, 0.04, 0.03, 0.02]})
+    spot_perp = pd.DataFrame({'pair': ['BTC/USDT:USDT', 'ETH/USDT:USDT'],
+                              'perp_exchange': ['a', 'b'],
+                              'spot_exchange': ['b/c', 'a'],
+                              'rate': [0.03, 0.02]})
+    return {'perp_perp': perp_perp, 'spot_perp_positive': spot_perp}
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setitem(CONFIG, 'api_host', '127.0.0.1')
+    monkeypatch.setitem(CONFIG, 'api_port', 0)
+    monkeypatch.setitem(CONFIG, 'api_default_limit', 100)
+    monkeypatch.setattr(results_api, 'published', None)
+    server = start_api_server()
+    yield server
+    stop_api_server(server)
+
+
+def get(server, path, headers=None):
+    """
+    Sends a GET request to the server and returns the status, headers and body of the response.
+    """
+    connection = http.client.HTTPConnection(*server.server_address, timeout=10)
+    connection.request('GET', path, headers=headers or {})
+    response = connection.getresponse()
+    result = response.status, response.headers, response.read()
+    connection.close()
+    return result
+
+
+def get_rows(server, query):
+    status, _, body = get(server, f"/results/perp_perp?{query}")
+    assert status == 200
+    return [(row['pair'], row['short_exchange'], row['long_exchange']) for row in json.loads(body)]
+
+
+def test_no_results_published_yet(server):
+    assert get(server, '/results')[0] == 503
+
+
+def test_summary_and_unknown_result(server):
+    publish_results(create_results())
+
+    status, headers, body = get(server, '/results')
+    summary = json.loads(body)
+
+    assert status == 200
+    assert {name: result['rows'] for name, result in summary['results'].items()} == {'perp_perp': 4,
+                                                                                   'spot_perp_positive': 2}
+    assert headers['ETag']
+    assert get(server, '/results/perp_perp_best')[0] == 404
+
+
+def test_etag_changes_on_republish(server):
+    publish_results(create_results())
+    _, headers, _ = get(server, '/results/perp_perp')
+    etag = headers['ETag']
+
+    # Same version: 304 without a body
+    status, headers, body = get(server, '/results/perp_perp', {'If-None-Match': etag})
+    assert status == 304
+    assert headers['ETag'] == etag
+    assert body == b''
+
+    # Publishing the same results again keeps the ETag, new results change it
+    publish_results(create_results())
+    assert get(server, '/results/perp_perp', {'If-None-Match': etag})[0] == 304
+    publish_results(create_results(rate_diff=0.06))
+    status, headers, body = get(server, '/results/perp_perp', {'If-None-Match': etag})
+    assert status == 200
+    assert headers['ETag'] != etag
+    assert json.loads(body)[0]['rate_diff'] == 0.06
+
+    status, _, _ = get(server, '/results', {'If-None-Match': headers['ETag']})
+    assert status == 200
+
+
+def test_filters(server):
+    publish_results(create_results())
+
+    assert get_rows(server, 'pair=BTC/USDT:USDT') == [('BTC/USDT:USDT', 'a', 'b'), ('BTC/USDT:USDT', 'c', 'a')]
+    assert get_rows(server, 'exchange=a') == [('BTC/USDT:USDT', 'a', 'b'), ('BTC/USDT:USDT', 'c', 'a'),
+                                              ('SOL/USDT:USDT', 'a', 'c')]
+    assert get_rows(server, 'exchange=a&side=long') == [('BTC/USDT:USDT', 'c', 'a')]
+    assert get_rows(server, 'pair=BTC/USDT:USDT&exchange=a&side=short') == [('BTC/USDT:USDT', 'a', 'b')]
+    assert get_rows(server, 'exchange=a&limit=2') == [('BTC/USDT:USDT', 'a', 'b'), ('BTC/USDT:USDT', 'c', 'a')]
+    assert get_rows(server, 'limit=0') == []
+    assert get_rows(server, 'pair=XRP/USDT:USDT') == []
+
+    # Spot exchanges joined with '/' are indexed one by one
+    status, _, body = get(server, '/results/spot_perp_positive?exchange=c&side=spot')
+    assert status == 200
+    assert [row['pair'] for row in json.loads(body)] == ['BTC/USDT:USDT']
+
+
+@pytest.mark.parametrize('query', ['limit=ten', 'limit=-1', 'side=middle', 'exchanges=a'])
+def test_invalid_query(server, query):
+    publish_results(create_results())
+
+    status, _, body = get(server, f"/results/perp_perp?{query}")
+
+    assert status == 400
+    assert 'error' in json.loads(body)
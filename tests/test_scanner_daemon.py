@@ -0,0 +1,34 @@
+import pytest
+from config import CONFIG
+import scanner_daemon
+from fake_exchange import FakeExchange
+
+
+@pytest.fixture
+def config(monkeypatch, tmp_path):
+    for key, value in {'directory': str(tmp_path), 'perpetual_exchanges': ['a', 'b'], 'spot_exchanges': ['a'],
+                       'funding_rate_source': 'rest', 'api_server': False, 'liquidity_ranking': False,
+                       'metrics': False, 'funding_history_store': False, 'candle_store': False,
+                       'market_cache': False, 'daemon_save_results': False, 'amplitude_days': 2,
+                       'daemon_refresh_intervals': {'rates': 1, 'history': 1, 'amplitude': 1}}.items():
+        monkeypatch.setitem(CONFIG, key, value)
+
+
+def test_exits_without_perpetual_pairs(config, monkeypatch, capsys):
+    monkeypatch.setattr(scanner_daemon, 'init_exchange', lambda exchange_name: FakeExchange(exchange_name, markets=0))
+    results = []
+
+    scanner_daemon.run_daemon(max_cycles=1, on_results=results.append)
+
+    assert results == []
+    assert "No perpetual trading pairs found" in capsys.readouterr().out
+
+
+def test_runs_analysis(config, monkeypatch):
+    monkeypatch.setattr(scanner_daemon, 'init_exchange', lambda exchange_name: FakeExchange(exchange_name, markets=5))
+    results = []
+
+    scanner_daemon.run_daemon(max_cycles=1, on_results=results.append)
+
+    assert len(results) == 1
+    assert not results[0]['perp_perp'].empty
@@ -0,0 +1,66 @@
+import pandas as pd
+import pytest
+from config import CONFIG
+from analyze_data import create_perpetual_data_df_from_files, create_spot_index_from_files, find_opportunities
+from utils import array_cells_to_lists, df_to_file, file_to_df
+
+
+@pytest.fixture
+def config(monkeypatch):
+    for key, value in {'perpetual_exchanges': ['a', 'b'], 'spot_exchanges': ['a'], 'snapshot_format': 'parquet',
+                       'funding_history_store': False, 'result_top_k': None, 'result_stream_format': None,
+                       'liquidity_ranking': False, 'funding_rate_threshold': 0.01}.items():
+        monkeypatch.setitem(CONFIG, key, value)
+
+
+def save_snapshot(directory_data, file_format):
+    """
+    Saves a snapshot of two perpetual exchanges and one spot exchange in a file format.
+    """
+    df_to_file(pd.DataFrame({'pair': ['BTC/USDT:USDT', 'ETH/USDT:USDT', '1000PEPE/USDT:USDT'],
+                             'rate': [0.05, -0.03, 0.02],
+                             'historical_rates': [[0.01, 0.02], [-0.01], [0.03, 0.01, 0.02]],
+                             'mean_daily_amplitude': [3.1, 4.2, 9.5], 'max_daily_amplitude': [6.0, 8.1, 20.4],
+                             'amplitude_days': [100, 100, 40]}),
+               directory_data, 'funding_rates_a', file_format)
+    df_to_file(pd.DataFrame({'pair': ['BTC/USDT:USDT', 'ETH/USDT:USDT', '1000PEPE/USDT:USDT'],
+                             'rate': [-0.01, 0.02, -0.02], 'historical_rates': [[0.0], [0.01, 0.01], []],
+                             'mean_daily_amplitude': [3.0, 4.0, 9.0], 'max_daily_amplitude': [6.1, 8.0, 20.0],
+                             'amplitude_days': [100, 90, 40]}),
+               directory_data, 'funding_rates_b', file_format)
+    df_to_file(pd.DataFrame({'pair': ['BTC/USDT', 'ETH/USDT', 'PEPE/USDT']}), directory_data, 'spot_pairs_a',
+               file_format)
+
+
+def analyze(directory_data):
+    results = find_opportunities(create_perpetual_data_df_from_files(directory_data),
+                                 create_spot_index_from_files(directory_data))
+    return {name: array_cells_to_lists(df) for name, df in results.items()}
+
+
+@pytest.mark.parametrize('file_format', ['xlsx', 'csv'])
+def test_file_in_another_format_is_read(tmp_path, file_format):
+    df_to_file(pd.DataFrame({'pair': ['BTC/USDT:USDT'], 'rate': [0.01]}), tmp_path, 'funding_rates_a', file_format)
+
+    df = file_to_df(tmp_path, 'funding_rates_a', 'parquet')
+
+    pd.testing.assert_frame_equal(df, pd.DataFrame({'pair': ['BTC/USDT:USDT'], 'rate': [0.01]}))
+
+
+def test_missing_file(tmp_path, capsys):
+    assert file_to_df(tmp_path, 'funding_rates_a', 'parquet').empty
+    assert "No file found" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize('file_format', ['xlsx', 'csv'])
+def test_older_snapshot_is_analyzed_like_a_parquet_one(config, tmp_path, file_format):
+    save_snapshot(f"{tmp_path}/parquet/data", 'parquet')
+    save_snapshot(f"{tmp_path}/older/data", file_format)
+
+    expected = analyze(f"{tmp_path}/parquet/data")
+    results = analyze(f"{tmp_path}/older/data")
+
+    assert sorted(results) == sorted(expected)
+    assert all(not df.empty for df in expected.values())
+    for name, df in results.items():
+        pd.testing.assert_frame_equal(df, expected[name], check_dtype=False)
@@ -0,0 +1,82 @@
+import datetime
+import os
+import time
+
+import pytest
+from config import CONFIG
+import fetch_data
+from fake_exchange import FakeExchange
+from utils import get_snapshot_time, save_snapshot_time
+
+
+@pytest.fixture
+def config(monkeypatch, tmp_path):
+    monkeypatch.setitem(CONFIG, 'directory', str(tmp_path))
+    monkeypatch.setitem(CONFIG, 'perpetual_exchanges', ['a'])
+
+
+def create_snapshot(directory, subdirectory, modified):
+    directory_data = f"{directory}/{subdirectory}/data"
+    os.makedirs(directory_data)
+    path = f"{directory_data}/funding_rates_a.csv"
+    with open(path, 'w') as file:
+        file.write("pair,rate\n")
+    os.utime(path, (modified.timestamp(), modified.timestamp()))
+    return directory_data
+
+
+def test_recorded_time_wins_over_file_time(config, tmp_path, capsys):
+    directory_data = create_snapshot(tmp_path, '20240514_01', datetime.datetime(2024, 6, 1))
+    fetched_at = int(datetime.datetime(2024, 5, 14, 8).timestamp() * 1000)
+
+    save_snapshot_time(directory_data, fetched_at)
+
+    assert get_snapshot_time(directory_data) == fetched_at
+    assert capsys.readouterr().out == ""
+
+
+def test_file_time_fallback(config, tmp_path, capsys):
+    modified = datetime.datetime(2024, 5, 14, 23, 30)
+    directory_data = create_snapshot(tmp_path, '20240514_01', modified)
+
+    assert get_snapshot_time(directory_data) == int(modified.timestamp() * 1000)
+    assert capsys.readouterr().out == ""
+
+
+@pytest.mark.parametrize('subdirectory', ['20240514_01', '20240514'])
+def test_file_time_far_from_subdirectory_date_warns(config, tmp_path, capsys, subdirectory):
+    modified = datetime.datetime(2024, 7, 2, 10)
+    directory_data = create_snapshot(tmp_path, subdirectory, modified)
+
+    assert get_snapshot_time(directory_data) == int(modified.timestamp() * 1000)
+    assert "no recorded fetch time" in capsys.readouterr().out
+
+
+def test_no_snapshot(config, tmp_path):
+    os.makedirs(f"{tmp_path}/20240514_01/data")
+
+    assert get_snapshot_time(f"{tmp_path}/20240514_01/data") is None
+
+
+def test_fetch_records_its_start_time(config, monkeypatch):
+    for key, value in {'subdirectory': '20240514_01', 'spot_exchanges': ['a'], 'file_format': 'csv',
+                       'metrics': False, 'market_cache': False, 'amplitude_days': 2, 'fetch_mode': 'sync',
+                       'fetch_resume': False}.items():
+        monkeypatch.setitem(CONFIG, key, value)
+    monkeypatch.setattr(fetch_data, 'init_exchange', lambda exchange_name: FakeExchange(exchange_name, markets=3,
+                                                                                         latency=0))
+    directory_data = f"{CONFIG['directory']}/{CONFIG['subdirectory']}/data"
+
+    start = int(time.time() * 1000)
+    fetch_data.fetch_and_save_data()
+    fetched_at = get_snapshot_time(directory_data)
+    assert start <= fetched_at <= int(time.time() * 1000)
+
+    # A resumed fetch keeps the time of the run it continues, a new one records its own
+    monkeypatch.setitem(CONFIG, 'fetch_resume', True)
+    fetch_data.fetch_and_save_data()
+    assert get_snapshot_time(directory_data) == fetched_at
+    monkeypatch.setitem(CONFIG, 'fetch_resume', False)
+    time.sleep(0.01)
+    fetch_data.fetch_and_save_data()
+    assert get_snapshot_time(directory_data) > fetched_at
@@ -0,0 +1,73 @@
+import pandas as pd
+import pytest
+from config import CONFIG
+from analyze_data import (create_spot_perp_opportunites_df, find_opportunities, generate_spot_perp_opportunities,
+                          prepare_perpetual_data_df)
+from spot_index import build_spot_index
+
+
+@pytest.fixture
+def data(monkeypatch):
+    monkeypatch.setitem(CONFIG, 'funding_history_store', False)
+    monkeypatch.setitem(CONFIG, 'funding_rate_threshold', 0.001)
+    df = pd.DataFrame({'pair': [f"COIN{index}/USDT:USDT" for index in range(6)],
+                       'rate': [0.01, -0.02, 0.03, 0.0, 0.05, -0.06],
+                       'historical_rates': ['[0.01, 0.02]', None, '[]', '[0.1]', '[0.0]', '[-0.01]'],
+                       'mean_daily_amplitude': 1.0, 'max_daily_amplitude': 2.0, 'amplitude_days': 3})
+    perpetual_data_df = {'perp': prepare_perpetual_data_df('perp', df)}
+    spot_index = build_spot_index({'a': pd.DataFrame({'pair': ['COIN0/USDT', 'COIN1/USDT', 'COIN2/USDT']}),
+                                   'b': pd.DataFrame({'pair': ['COIN1/USDT', 'COIN3/USDT', 'COIN4/USDT']}),
+                                   'c': pd.DataFrame({'pair': []})})
+    return perpetual_data_df, spot_index
+
+
+@pytest.mark.parametrize('required, expected', [
+    ([], {'COIN0/USDT:USDT': 'a', 'COIN1/USDT:USDT': 'a/b', 'COIN2/USDT:USDT': 'a', 'COIN4/USDT:USDT': 'b'}),
+    (['a'], {'COIN0/USDT:USDT': 'a', 'COIN1/USDT:USDT': 'a/b', 'COIN2/USDT:USDT': 'a'}),
+    (['a', 'b'], {'COIN1/USDT:USDT': 'a/b'}),
+])
+def test_required_spot_exchanges(data, monkeypatch, required, expected):
+    monkeypatch.setitem(CONFIG, 'spot_exchanges_required', required)
+
+    df = create_spot_perp_opportunites_df(*data)
+
+    assert dict(zip(df['pair'].astype(str), df['spot_exchange'])) == expected
+
+
+@pytest.mark.parametrize('required', [['c'], ['a', 'missing']])
+def test_required_spot_exchange_without_data(data, monkeypatch, capsys, required):
+    monkeypatch.setitem(CONFIG, 'spot_exchanges_required', required)
+
+    df = create_spot_perp_opportunites_df(*data)
+
+    assert df.empty
+    assert "Required spot exchanges without spot data" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_chunks_match_all_pairs_at_once(data, monkeypatch, tmp_path, compact):
+    monkeypatch.setitem(CONFIG, 'spot_exchanges_required', [])
+    monkeypatch.setitem(CONFIG, 'compact_snapshots', compact)
+    monkeypatch.setitem(CONFIG, 'get_perp_perp_opportunities', False)
+    monkeypatch.setitem(CONFIG, 'result_top_k', None)
+    monkeypatch.setitem(CONFIG, 'result_stream_format', 'jsonl')
+    perpetual_data_df, spot_index = data
+    df = perpetual_data_df['perp'].assign(rate=-perpetual_data_df['perp']['rate'])
+    perpetual_data_df = {'perp': perpetual_data_df['perp'], 'other': prepare_perpetual_data_df('other', df)}
+
+    chunks = list(generate_spot_perp_opportunities(perpetual_data_df, spot_index, chunk_pairs=4))
+
+    assert [len(df) for df in chunks] == [3, 1, 3, 1]
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True),
+                                  create_spot_perp_opportunites_df(perpetual_data_df, spot_index))
+
+    # Every chunk is streamed as soon as it is found, and the results are those of all pairs at once
+    results = {}
+    for chunk_pairs in [None, 4]:
+        monkeypatch.setitem(CONFIG, 'spot_perp_chunk_pairs', chunk_pairs)
+        results[chunk_pairs] = find_opportunities(perpetual_data_df, spot_index, f"{tmp_path}/{chunk_pairs}")
+    for name in ['spot_perp_positive', 'spot_perp_negative']:
+        pd.testing.assert_frame_equal(results[4][name], results[None][name])
+        assert len(results[4][name]) == 4
+        with open(f"{tmp_path}/4/stream_{name}_{'_'.join(CONFIG['perpetual_exchanges'])}.jsonl") as file:
+            assert len(file.readlines()) == 4
@@ -1,12 +1,22 @@
 import sys
+import datetime
+import glob
+import json
 import os
+import threading
+import numpy as np
 import pandas as pd
 from config import CONFIG
 
+# File formats of saved dataframes, in the order a file of another format is looked for
+FILE_FORMATS = ['parquet', 'xlsx', 'csv']
+
 
 def display_progress(index, total, info=""):
     """
    Displays progress of a process.
+   In the main thread the progress is updated in place. In worker threads, where several
+   exchanges share the output, a separate line is printed every 10%.
 
    Args:
        index (int): Current index.
@@ -14,53 +24,194 @@ def display_progress(index, total, info=""):
        info (str, optional): Additional information to display. Defaults to "".
    """
     msg = f"{info}" if info else "Current progress"
-    sys.stdout.write(f"\r {msg}: {round((index / total) * 100, 2)}% completed.")
-    sys.stdout.flush()
+    percent = round((index / total) * 100, 2)
+    if threading.current_thread() is threading.main_thread():
+        sys.stdout.write(f"\r {msg}: {percent}% completed.")
+        sys.stdout.flush()
+    else:
+        step = max(total // 10, 1)
+        if index % step == 0 or index == total:
+            sys.stdout.write(f" {msg}: {percent}% completed.\n")
 
 
-def df_to_file(df, directory, filename):
+def split_into_chunks(items, chunk_size=None):
     """
-    Saves DataFrame to Excel or CSV file.
+    Splits a list into consecutive chunks.
+
+    Args:
+        items (list): List to split.
+        chunk_size (int, optional): Maximum chunk length. None means a single chunk with all items.
+
+    Returns:
+        list: List of chunks.
+    """
+    if not chunk_size:
+        return [items] if items else []
+    return [items[index:index + chunk_size] for index in range(0, len(items), chunk_size)]
+
+
+def df_to_file(df, directory, filename, file_format=None):
+    """
+    Saves DataFrame to Parquet, Excel or CSV file.
 
     Args:
         df (pd.DataFrame): DataFrame to be saved.
         directory (str): Directory to save the file.
         filename (str): Name of the file (without extension).
+        file_format (str, optional): 'parquet', 'xlsx' or 'csv'. Defaults to file_format from the config.
     """
+    file_format = file_format or CONFIG['file_format']
     if not os.path.exists(directory):
         os.makedirs(directory)
+    if file_format != 'parquet':
+        df = array_cells_to_lists(df)
     try:
-        if CONFIG['file_format'] == 'xlsx':
+        if file_format == 'parquet':
+            df.to_parquet(f'{directory}/{filename}.parquet', index=False, compression=CONFIG['parquet_compression'])
+        elif file_format == 'xlsx':
             df.to_excel(f'{directory}/{filename}.xlsx', index=False)
-        elif CONFIG['file_format'] == 'csv':
+        elif file_format == 'csv':
             df.to_csv(f'{directory}/{filename}.csv', index=False)
         else:
-            print(f"File format {CONFIG['file_format']} is not supported. The data is saved to csv file: {filename}.csv")
+            print(f"File format {file_format} is not supported. The data is saved to csv file: {filename}.csv")
             df.to_csv(f'{directory}/{filename}.csv', index=False)
     except Exception as e:
         print(f"Error: Error occurred while saving the file: {e}")
 
 
-def file_to_df(directory, filename):
+def array_cells_to_lists(df):
+    """
+    Converts columns of numpy arrays, e.g. historical rates loaded from Parquet or compact snapshots,
+    to columns of lists, so text formats store them as lists that can be parsed back.
+
+    Args:
+        df (pd.DataFrame): DataFrame.
+
+    Returns:
+        pd.DataFrame: DataFrame with lists instead of arrays.
+    """
+    columns = {column: df[column].map(np.ndarray.tolist, na_action='ignore') for column in df.columns
+               if df[column].dtype == object and not df[column].empty and isinstance(df[column].iloc[0], np.ndarray)}
+    return df.assign(**columns) if columns else df
+
+
+def file_to_df(directory, filename, file_format=None):
     """
-    Loads DataFrame from Excel or CSV file.
+    Loads DataFrame from Parquet, Excel or CSV file.
+
+    Parquet files are read with memory mapping, and list columns are loaded as arrays.
+    If there is no file in the given format but one in another format, e.g. a snapshot saved as xlsx
+    before snapshot_format was added, the format is taken from the extension of that file.
 
     Args:
         directory (str): Directory containing the file.
         filename (str): Name of the file (without extension).
+        file_format (str, optional): 'parquet', 'xlsx' or 'csv'. Defaults to file_format from the config.
 
     Returns:
         pd.DataFrame: DataFrame loaded from the file.
     """
+    file_format = file_format or CONFIG['file_format']
+    if not os.path.exists(f"{directory}/{filename}.{file_format}"):
+        file_format = next((other_format for other_format in FILE_FORMATS
+                            if os.path.exists(f"{directory}/{filename}.{other_format}")), file_format)
     df = pd.DataFrame()
     try:
-        if CONFIG['file_format'] == 'xlsx':
+        if file_format == 'parquet':
+            df = pd.read_parquet(f"{directory}/{filename}.parquet", memory_map=True)
+        elif file_format == 'xlsx':
             df = pd.read_excel(f"{directory}/{filename}.xlsx")
-        elif CONFIG['file_format'] == 'csv':
+        elif file_format == 'csv':
             df = pd.read_csv(f"{directory}/{filename}.csv")
         else:
-            print(f"File format {CONFIG['file_format']} is not supported. "
+            print(f"File format {file_format} is not supported. "
                   f"Please specify the correct file_format in the config")
     except FileNotFoundError as e:
         print(f"Error: No file found with name {filename} in directory {directory}: \n {str(e)}")
     return df
+
+
+def get_snapshot_info_path(directory_data):
+    """
+    Returns the path to the file recording the time a snapshot was fetched.
+
+    Args:
+        directory_data (str): Data directory of the snapshot.
+
+    Returns:
+        str: Path to snapshot.json in the data directory.
+    """
+    return f"{directory_data}/snapshot.json"
+
+
+def save_snapshot_time(directory_data, snapshot_time):
+    """
+    Records the time a snapshot was fetched, so later analyses of the snapshot use the data of that time.
+
+    Args:
+        directory_data (str): Data directory of the snapshot.
+        snapshot_time (int): Time in milliseconds.
+    """
+    os.makedirs(directory_data, exist_ok=True)
+    with open(get_snapshot_info_path(directory_data), 'w') as file:
+        json.dump({'fetched_at': snapshot_time}, file)
+
+
+def get_snapshot_time(directory_data):
+    """
+    Returns the time a snapshot was fetched.
+
+    Snapshots saved before the time was recorded fall back to the time their last perpetual funding rates
+    file was written. Copying or restoring the files changes it, so a warning is printed when it is more than
+    a day away from the date the subdirectory name starts with, e.g. 20240514 of 20240514_01.
+
+    Args:
+        directory_data (str): Data directory of the snapshot.
+
+    Returns:
+        int: Time in milliseconds, or None if the snapshot has neither the record nor perpetual funding rates files.
+    """
+    path = get_snapshot_info_path(directory_data)
+    if os.path.exists(path):
+        try:
+            with open(path) as file:
+                return int(json.load(file)['fetched_at'])
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Error reading the snapshot time from {path}: {e}")
+    paths = [path for exchange in CONFIG['perpetual_exchanges']
+             for path in glob.glob(f"{directory_data}/funding_rates_{exchange}.*")]
+    if not paths:
+        return None
+    modified = datetime.datetime.fromtimestamp(max(os.path.getmtime(path) for path in paths))
+    subdirectory = os.path.basename(os.path.dirname(os.path.abspath(directory_data)))
+    try:
+        subdirectory_date = datetime.datetime.strptime(subdirectory[:8], '%Y%m%d')
+    except ValueError:
+        subdirectory_date = None
+    if subdirectory_date and not (subdirectory_date - datetime.timedelta(days=1) <= modified
+                                  <= subdirectory_date + datetime.timedelta(days=2)):
+        print(f"Warning: Snapshot {subdirectory} has no recorded fetch time and its files were written on "
+              f"{modified:%Y-%m-%d %H:%M}, using that time")
+    return int(modified.timestamp() * 1000)
+
+
+def get_amplitude_stats(pair, ohlc_data):
+    """
+    Calculates mean and max daily amplitude of a trading pair from OHLC candles.
+    Amplitude is defined as high - low of a candle in percentage of the open price.
+
+    Args:
+        pair (str): Trading pair symbol.
+        ohlc_data (list): List of candles in the ccxt format [timestamp, open, high, low, close, volume].
+
+    Returns:
+        dict: Dictionary with pair, mean and max amplitude and number of candles used.
+    """
+    df = pd.DataFrame(ohlc_data, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+
+    df['amplitude'] = 100 * (df['high'] - df['low']) / df['open']
+
+    return {'pair': pair,
+            'mean_daily_amplitude': round(df['amplitude'].mean(), 2),
+            'max_daily_amplitude': round(df['amplitude'].max(), 2),
+            'amplitude_days': len(df)}